@@ -0,0 +1,83 @@
+# bench/bench_index.py
+"""
+Бенчмарк пошуку товарів: лінійний прохід (як було в find_product)
+проти ShopIndex (див. shopindex.py).
+
+    python bench/bench_index.py [--products 50000] [--cart 20] [--repeat 50]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import shopindex  # noqa: E402
+
+
+def linear_find(d: dict, pid: int):
+    # стара реалізація data.find_product
+    for p in d.get("products", []):
+        try:
+            if int(p.get("id")) == int(pid):
+                return p
+        except Exception:
+            continue
+    return None
+
+
+def linear_find_sku(d: dict, sku: str):
+    for p in d.get("products", []):
+        if (p.get("sku") or "").strip() == sku:
+            return p
+    return None
+
+
+def make_state(n: int) -> dict:
+    return {"products": [
+        {"id": pid, "sku": f"SKU-{pid:06d}", "barcode": f"48{pid:011d}", "name": f"Товар {pid}", "base_price": 100}
+        for pid in range(1, n + 1)
+    ]}
+
+
+def timeit(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--products", type=int, default=50000)
+    ap.add_argument("--cart", type=int, default=20)
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    d = make_state(args.products)
+    rnd = random.Random(1)
+    cart = [rnd.randint(1, args.products) for _ in range(args.cart)]
+    skus = [f"SKU-{pid:06d}" for pid in cart]
+
+    for pid in cart:
+        assert linear_find(d, pid) is shopindex.by_id(d, pid)
+
+    build = timeit(lambda: shopindex.reindex(d), max(1, args.repeat // 5))
+    lin = timeit(lambda: [linear_find(d, pid) for pid in cart], args.repeat)
+    idx = timeit(lambda: [shopindex.by_id(d, pid) for pid in cart], args.repeat)
+    lin_sku = timeit(lambda: [linear_find_sku(d, s) for s in skus], args.repeat)
+    idx_sku = timeit(lambda: [shopindex.by_sku(d, s) for s in skus], args.repeat)
+
+    print(f"products={args.products} cart={args.cart}")
+    print(f"index build            {build * 1000:10.2f} ms (раз на стан)")
+    print(f"by id:  linear {lin * 1000:10.3f} ms   index {idx * 1000:10.3f} ms   x{lin / max(idx, 1e-9):.0f}")
+    print(f"by sku: linear {lin_sku * 1000:10.3f} ms   index {idx_sku * 1000:10.3f} ms   x{lin_sku / max(idx_sku, 1e-9):.0f}")
+
+
+if __name__ == "__main__":
+    main()
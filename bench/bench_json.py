@@ -0,0 +1,105 @@
+# bench/bench_json.py
+"""
+Бенчмарк JSON-кодеків для стану магазину (див. jsoncodec.py).
+
+    python bench/bench_json.py [--sizes 100,1000,5000] [--repeat 5]
+
+Для кожного розміру генерує синтетичний стан (товари / замовлення / юзери
+з українським текстом) і міряє encode/decode обох кодеків.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SHOP_JSON_CODEC", "auto")
+
+import jsoncodec  # noqa: E402
+
+WORDS = ["Футболка", "Кросівки", "Рюкзак", "Кепка", "Світшот", "Шкарпетки", "Ґудзик", "Їжак", "Є", "чорний", "білий"]
+
+
+def make_state(n: int, seed: int = 1) -> dict:
+    rnd = random.Random(seed)
+    products = []
+    cats: dict = {}
+    for pid in range(1, n + 1):
+        cat = f"Категорія {pid % 7}"
+        sub = f"Підкатегорія {pid % 5}"
+        products.append({
+            "id": pid,
+            "sku": f"SKU-{pid:06d}",
+            "name": " ".join(rnd.choice(WORDS) for _ in range(3)),
+            "description": " ".join(rnd.choice(WORDS) for _ in range(30)),
+            "base_price": round(rnd.uniform(100, 5000), 2),
+            "promo_price": 0,
+            "photos": [f"AgACAgIAAxkBAAI{pid:08d}"],
+            "category": cat,
+            "sub_category": sub,
+        })
+        cats.setdefault(cat, {}).setdefault(sub, []).append(pid)
+
+    orders = []
+    for oid in range(1, n + 1):
+        orders.append({
+            "id": oid,
+            "user_id": 100000 + oid % 500,
+            "items": [{"pid": rnd.randint(1, n), "qty": rnd.randint(1, 3), "sku": "SKU", "name": "Футболка"}],
+            "total": round(rnd.uniform(100, 9000), 2),
+            "status": rnd.choice(["paid", "prepay", "in_work", "shipped", "done"]),
+            "created_ts": 1700000000 + oid,
+            "delivery": {"name": "Олена Ковальчук", "phone": "+380501234567", "city": "Київ", "np_branch": "№12"},
+            "events": [{"ts": 1700000000 + oid, "code": "order_created", "title": "Замовлення створено"}],
+        })
+
+    users = {str(100000 + i): {"id": 100000 + i, "username": f"u{i}", "full_name": "Іван Петренко"} for i in range(n // 2)}
+    carts = {str(100000 + i): {str(rnd.randint(1, n)): 1} for i in range(n // 4)}
+    # int-ключі теж трапляються (старі дані)
+    hits_map = {pid: pid % 3 for pid in range(1, min(n, 50))}
+    return {"categories": cats, "products": products, "orders": orders, "users": users,
+            "carts": carts, "hits": list(range(1, 20)), "extras": hits_map}
+
+
+def bench(fn, arg, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(arg)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="100,1000,5000")
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    codecs = ["json"] + (["orjson"] if jsoncodec.orjson is not None else [])
+    print(f"active codec: {jsoncodec.CODEC}")
+    print(f"{'size':>6} {'codec':>7} {'bytes':>10} {'encode ms':>10} {'decode ms':>10} {'fp ms':>8}")
+
+    for n in [int(x) for x in args.sizes.split(",") if x.strip()]:
+        state = make_state(n)
+        ref = None
+        for name in codecs:
+            dumps, dumps_sorted, loads = jsoncodec.get_codec(name)
+            payload = dumps(state)
+            decoded = loads(payload)
+            if ref is None:
+                ref = decoded
+            elif decoded != ref:
+                raise SystemExit(f"{name}: round-trip differs from stdlib json")
+
+            enc = bench(dumps, state, args.repeat)
+            dec = bench(loads, payload, args.repeat)
+            fp = bench(lambda s: [dumps_sorted(p) for p in s["products"]], state, args.repeat)
+            print(f"{n:>6} {name:>7} {len(payload.encode('utf-8')):>10} {enc * 1000:>10.2f} {dec * 1000:>10.2f} {fp * 1000:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
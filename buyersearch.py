@@ -0,0 +1,222 @@
+# buyersearch.py
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy import select
+
+import metrics
+from db import session_scope
+from models import ShopUser, ShopOrder
+from textsearch import TrigramIndex, norm, tokens, digits
+
+
+# =========================================================
+# BUYER SEARCH (адмінка: 🔎 Пошук покупця)
+#
+# Індекс покупців: id, username, імʼя, телефони з доставки замовлень.
+# Живе в памʼяті процесу і доповнюється інкрементально прямо з таблиць:
+#   shop_users  — рядки з last_seen_ts >= водяного знака (upsert_user його оновлює)
+#   shop_orders — замовлення з id > водяного знака
+# Тож нові покупці з інших реплік теж підтягуються, без повного перебору.
+#
+# Рядки комітяться не в порядку ключа: id замовлення видає sequence ще до
+# транзакції, last_seen_ts ставить хендлер до commit. Тому кожен refresh
+# перечитує хвіст перед водяним знаком (ORDER_RESCAN_IDS / USER_RESCAN_S) —
+# пізній commit у межах вікна не губиться. Замовлення рахуються один раз
+# (памʼятаємо id у вікні), повторний add_user нічого не ламає.
+# =========================================================
+
+MIN_PHONE_FULL = 9  # стільки цифр вважаємо "повним" номером
+
+ORDER_RESCAN_IDS = 500   # скільки останніх id замовлень перечитувати
+USER_RESCAN_S = 600      # на скільки секунд назад перечитувати last_seen_ts
+
+
+def order_phone(o: Dict[str, Any]) -> str:
+    for k in ("phone", "user_phone", "tel", "telephone", "contact_phone", "buyer_phone"):
+        v = (o.get(k) or "").strip()
+        if v:
+            return v
+    ship = o.get("shipping") or o.get("delivery") or {}
+    if isinstance(ship, dict):
+        for k in ("phone", "tel"):
+            v = (ship.get(k) or "").strip()
+            if v:
+                return v
+    return ""
+
+
+class BuyerIndex:
+    def __init__(self):
+        self.docs: Dict[int, Dict[str, Any]] = {}
+        self._idx = TrigramIndex()
+        self._wm_user_ts = 0
+        self._wm_order_id = 0
+        self._order_ids: Set[int] = set()   # уже враховані замовлення у вікні перечитування
+        self._lock = asyncio.Lock()
+
+    def reset(self) -> None:
+        self.docs = {}
+        self._idx = TrigramIndex()
+        self._wm_user_ts = 0
+        self._wm_order_id = 0
+        self._order_ids = set()
+
+    # ---------- наповнення ----------
+
+    def _doc(self, uid: int) -> Dict[str, Any]:
+        doc = self.docs.get(uid)
+        if doc is None:
+            doc = {
+                "id": uid,
+                "username": "",
+                "full_name": "",
+                "phones": set(),
+                "first_seen_ts": 0,
+                "last_seen_ts": 0,
+                "orders": 0,
+                "known_user": False,
+            }
+            self.docs[uid] = doc
+        return doc
+
+    def _reindex(self, doc: Dict[str, Any]) -> None:
+        toks: Set[str] = {str(doc["id"])}
+        uname = norm(doc["username"]).lstrip("@")
+        if uname:
+            toks.add(uname)
+        toks.update(tokens(doc["full_name"]))
+        toks.update(doc["phones"])
+        self._idx.set_doc(doc["id"], toks)
+
+    def add_user(self, uid: int, u: Dict[str, Any]) -> None:
+        doc = self._doc(uid)
+        doc["known_user"] = True
+        doc["username"] = str(u.get("username") or "")
+        doc["full_name"] = str(u.get("full_name") or "")
+        doc["first_seen_ts"] = int(u.get("first_seen_ts", 0) or 0)
+        doc["last_seen_ts"] = max(doc["last_seen_ts"], int(u.get("last_seen_ts", 0) or 0))
+        self._reindex(doc)
+
+    def add_order(self, o: Dict[str, Any]) -> None:
+        try:
+            uid = int(o.get("user_id", -1))
+        except Exception:
+            return
+        if uid <= 0:
+            return
+
+        doc = self._doc(uid)
+        doc["orders"] += 1
+        ph = digits(order_phone(o))
+        if ph:
+            doc["phones"].add(ph)
+        if not doc["known_user"]:
+            # fallback: дані покупця зі снапшота замовлення
+            doc["username"] = doc["username"] or str(o.get("user_username") or o.get("username") or o.get("from_username") or "")
+            doc["full_name"] = doc["full_name"] or str(o.get("user_full_name") or o.get("full_name") or o.get("name") or "")
+            doc["last_seen_ts"] = max(doc["last_seen_ts"], int(o.get("created_ts", 0) or 0))
+        self._reindex(doc)
+
+    def take_users(self, rows) -> None:
+        for uid, data, ts in rows:
+            self.add_user(int(uid), data or {})
+            self._wm_user_ts = max(self._wm_user_ts, int(ts or 0))
+
+    def take_orders(self, rows) -> None:
+        for oid, data in rows:
+            oid = int(oid)
+            if oid in self._order_ids:
+                continue
+            self._order_ids.add(oid)
+            self.add_order(data or {})
+            self._wm_order_id = max(self._wm_order_id, oid)
+        floor = self._wm_order_id - ORDER_RESCAN_IDS
+        self._order_ids = {x for x in self._order_ids if x > floor}
+
+    async def refresh(self) -> None:
+        async with self._lock:
+            async with session_scope() as session:
+                res = await session.execute(
+                    select(ShopUser.id, ShopUser.data, ShopUser.last_seen_ts)
+                    .where(ShopUser.last_seen_ts >= self._wm_user_ts - USER_RESCAN_S)
+                )
+                self.take_users(res.all())
+
+                res = await session.execute(
+                    select(ShopOrder.id, ShopOrder.data)
+                    .where(ShopOrder.id > self._wm_order_id - ORDER_RESCAN_IDS)
+                    .order_by(ShopOrder.id)
+                )
+                self.take_orders(res.all())
+        metrics.inc("buyer_search.refreshes")
+
+    # ---------- пошук ----------
+
+    def search(self, q_raw: str, limit: int = 10) -> List[Dict[str, Any]]:
+        q_raw = (q_raw or "").strip()
+        q_user = norm(q_raw).lstrip("@")
+        q_digits = digits(q_raw)
+        q_toks = tokens(q_raw.lstrip("@"))
+        if not q_toks and not q_digits:
+            return []
+
+        # запит — номер/ID (цифри з +, пробілами, дужками, дефісами)
+        digit_query = bool(q_digits) and not any(ch.isalpha() for ch in q_raw)
+
+        cands: Optional[Set[int]] = None
+        if digit_query:
+            cands = self._idx.candidates(q_digits)
+        else:
+            for t in q_toks:
+                c = self._idx.candidates(t)
+                cands = c if cands is None else cands & c
+                if not cands:
+                    break
+        if not cands:
+            metrics.inc("buyer_search.misses")
+            return []
+
+        scored = []
+        for uid in cands:
+            doc = self.docs.get(uid)
+            if doc is None:
+                continue
+            scored.append((self._score(doc, q_user, q_toks, q_digits, digit_query), doc))
+
+        scored.sort(key=lambda x: (x[0], x[1]["last_seen_ts"]), reverse=True)
+        metrics.inc("buyer_search.queries")
+        return [doc for _, doc in scored[:max(1, int(limit))]]
+
+    @staticmethod
+    def _score(doc: Dict[str, Any], q_user: str, q_toks: List[str], q_digits: str, digit_query: bool) -> int:
+        score = 0
+        if digit_query:
+            if str(doc["id"]) == q_digits:
+                score = max(score, 100)
+            for ph in doc["phones"]:
+                if len(q_digits) >= MIN_PHONE_FULL and ph.endswith(q_digits):
+                    score = max(score, 90)
+                elif ph.startswith(q_digits):
+                    score = max(score, 60)
+                elif q_digits in ph:
+                    score = max(score, 40)
+            if str(doc["id"]).startswith(q_digits):
+                score = max(score, 50)
+            return score or 10
+
+        uname = norm(doc["username"]).lstrip("@")
+        if uname and uname == q_user:
+            score = max(score, 80)
+        elif uname and uname.startswith(q_user):
+            score = max(score, 55)
+
+        name_toks = tokens(doc["full_name"])
+        if q_toks and all(any(nt.startswith(t) for nt in name_toks) for t in q_toks):
+            score = max(score, 50 + (10 if len(q_toks) > 1 else 0))
+        return score or 30  # лише підрядок
+
+
+buyer_index = BuyerIndex()
@@ -0,0 +1,129 @@
+# catalogids.py
+from __future__ import annotations
+
+from typing import Any, Dict, Optional, Tuple
+
+
+# =========================================================
+# CATALOG IDS (стабільні id категорій / підкатегорій)
+#
+# Кнопки каталогу несуть id, а не позицію в списку і не назву:
+# додали/видалили категорію, поки клавіатура на екрані — кнопка або
+# відкриє те саме, або чесно скаже "не знайдено".
+#
+# Живе в заголовку стану (завжди завантажений):
+#   d["catalog_ids"] = {
+#       "seq":   останній виданий id,
+#       "cats":  {cat: {"id": cid, "subs": {sub: sid}}},
+#       "by_id": {"<id>": [cat, sub | None]},
+#   }
+# storage.save_state викликає sync_ids при кожному записі каталогу,
+# тож хендлерам не треба памʼятати про id при створенні/видаленні.
+#
+# Там само — d["catalog_version"]: версія стану, на якій востаннє
+# змінились рядки каталогу. Записи кошиків/обраного її не чіпають,
+# тож індекси каталогу (пошук, ціни, списки pid) звіряються по ній.
+# =========================================================
+
+CATALOG_IDS_KEY = "catalog_ids"
+CATALOG_VERSION_KEY = "catalog_version"
+
+
+def _ids(d: Dict[str, Any]) -> Dict[str, Any]:
+    ids = d.get(CATALOG_IDS_KEY)
+    if not isinstance(ids, dict):
+        ids = {}
+        d[CATALOG_IDS_KEY] = ids
+    ids.setdefault("seq", 0)
+    ids.setdefault("cats", {})
+    ids.setdefault("by_id", {})
+    return ids
+
+
+def _next(ids: Dict[str, Any]) -> int:
+    ids["seq"] = int(ids.get("seq", 0) or 0) + 1
+    return ids["seq"]
+
+
+def sync_ids(d: Dict[str, Any]) -> None:
+    """Видає id новим категоріям/підкатегоріям і прибирає id видалених."""
+    cats = d.get("categories") or {}
+    if not isinstance(cats, dict):
+        return
+    ids = _ids(d)
+    known: Dict[str, Any] = ids["cats"]
+    by_id: Dict[str, Any] = ids["by_id"]
+
+    for cat, subs in cats.items():
+        cat = str(cat)
+        ent = known.get(cat)
+        if ent is None:
+            ent = {"id": _next(ids), "subs": {}}
+            known[cat] = ent
+            by_id[str(ent["id"])] = [cat, None]
+
+        subs = subs if isinstance(subs, dict) else {}
+        for sub in subs.keys():
+            sub = str(sub)
+            if sub not in ent["subs"]:
+                sid = _next(ids)
+                ent["subs"][sub] = sid
+                by_id[str(sid)] = [cat, sub]
+
+        for sub in [s for s in ent["subs"] if s not in subs]:
+            by_id.pop(str(ent["subs"].pop(sub)), None)
+
+    for cat in [c for c in known if c not in cats]:
+        ent = known.pop(cat)
+        by_id.pop(str(ent.get("id")), None)
+        for sid in (ent.get("subs") or {}).values():
+            by_id.pop(str(sid), None)
+
+
+def catalog_version(d: Dict[str, Any]) -> Optional[int]:
+    """
+    Версія каталогу для звірки індексів.
+    None — dict без версії стану (звіряти щоразу).
+    """
+    if getattr(d, "version", None) is None:
+        return None
+    try:
+        return int(d.get(CATALOG_VERSION_KEY) or 0)
+    except Exception:
+        return 0
+
+
+def cat_id(d: Dict[str, Any], cat: str) -> Optional[int]:
+    ent = (d.get(CATALOG_IDS_KEY) or {}).get("cats", {}).get(str(cat))
+    return int(ent["id"]) if ent else None
+
+
+def sub_id(d: Dict[str, Any], cat: str, sub: str) -> Optional[int]:
+    ent = (d.get(CATALOG_IDS_KEY) or {}).get("cats", {}).get(str(cat))
+    if not ent:
+        return None
+    sid = (ent.get("subs") or {}).get(str(sub))
+    return int(sid) if sid is not None else None
+
+
+def _by_id(d: Dict[str, Any], xid: Any) -> Optional[Tuple[str, Optional[str]]]:
+    ent = (d.get(CATALOG_IDS_KEY) or {}).get("by_id", {}).get(str(xid).strip())
+    if not ent:
+        return None
+    return ent[0], ent[1]
+
+
+def cat_by_id(d: Dict[str, Any], cid: Any) -> Optional[str]:
+    ent = _by_id(d, cid)
+    if ent is None or ent[1] is not None:
+        return None
+    return ent[0]
+
+
+def sub_by_id(d: Dict[str, Any], cid: Any, sid: Any) -> Optional[str]:
+    """Підкатегорія sid, але тільки якщо вона справді з категорії cid."""
+    cat = cat_by_id(d, cid)
+    ent = _by_id(d, sid)
+    if cat is None or ent is None or ent[0] != cat or ent[1] is None:
+        return None
+    return ent[1]
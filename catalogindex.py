@@ -0,0 +1,156 @@
+# catalogindex.py
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import metrics
+from catalogids import catalog_version
+
+
+# =========================================================
+# CATALOG INDEX (готові списки pid по (категорія, підкатегорія))
+#
+# Один на процес. categories[cat][sub] нормалізується (dict/int → int,
+# без дублів) один раз; сторінка N каталогу — це pids[N], а кількість
+# товарів у підкатегорії — len(pids) для підписів кнопок.
+#
+# sync(d) перебудовує тільки змінені підкатегорії і тільки коли версія
+# каталогу змінилась (catalogids.catalog_version; записи carts/orders її
+# не чіпають). Що список pid змінився — видно з відбитків рядків
+# subcategories у знімку стану (d.snapshot), тож перевірка — це
+# порівняння рядків, без проходу по товарах. Для "простого" dict
+# без знімка відбиток — сам сирий список.
+# =========================================================
+
+NO_SUB = "_"  # системна підкатегорія (як у хендлерах)
+
+Key = Tuple[str, str]
+
+_EMPTY: List[int] = []
+
+
+def _int(x: Any) -> Optional[int]:
+    try:
+        return int(x)
+    except Exception:
+        return None
+
+
+def _raw_id(x: Any) -> Any:
+    # старий формат списку pid — dict товару
+    return x.get("id") if isinstance(x, dict) else x
+
+
+def _norm(arr: Any) -> List[int]:
+    out: List[int] = []
+    seen = set()
+    for x in (arr if isinstance(arr, list) else []):
+        pid = _int(_raw_id(x))
+        if pid is None or pid in seen:
+            continue
+        seen.add(pid)
+        out.append(pid)
+    return out
+
+
+def _fingerprints(d: Dict[str, Any]) -> Dict[Key, Any]:
+    snap = getattr(d, "snapshot", None)
+    fps = snap.get("subcategories") if isinstance(snap, dict) else None
+    if isinstance(fps, dict):
+        return fps
+    out: Dict[Key, Any] = {}
+    for cat, subs in (d.get("categories") or {}).items():
+        if not isinstance(subs, dict):
+            continue
+        for sub, arr in subs.items():
+            out[(str(cat), str(sub))] = tuple(_raw_id(x) for x in arr) if isinstance(arr, list) else ()
+    return out
+
+
+class CatalogIndex:
+    def __init__(self):
+        self._pids: Dict[Key, List[int]] = {}
+        self._fp: Dict[Key, Any] = {}
+        self._by_product: Optional[Dict[Key, List[int]]] = None
+        self._version: Optional[int] = None
+
+    def sync(self, d: Dict[str, Any]) -> None:
+        """Перебудувати підкатегорії, що змінились (тільки якщо версія каталогу змінилась)."""
+        version = catalog_version(d)
+        if version is not None and version == self._version:
+            return
+        secs = getattr(d, "sections", None)
+        if secs is not None and "catalog" not in secs:
+            # каталог не завантажений (інша секція): categories тут —
+            # порожня заглушка, звірка стерла б усі підкатегорії
+            return
+        cats = d.get("categories")
+        if not isinstance(cats, dict):
+            return
+
+        fps = _fingerprints(d)
+        rebuilt = 0
+        for key, fp in fps.items():
+            if self._fp.get(key) == fp and key in self._pids:
+                continue
+            cat, sub = key
+            self._pids[key] = _norm((cats.get(cat) or {}).get(sub))
+            self._fp[key] = fp
+            rebuilt += 1
+        for key in [k for k in self._pids if k not in fps]:
+            self._pids.pop(key, None)
+            self._fp.pop(key, None)
+
+        self._by_product = None
+        self._version = version
+        if rebuilt:
+            metrics.inc("catalog_index.rebuilt", rebuilt)
+
+    def pids(self, d: Dict[str, Any], cat: str, sub: str, *, by_product: bool = False) -> List[int]:
+        """
+        pid товарів підкатегорії в порядку каталогу (готовий список — не змінювати).
+        by_product=True: якщо список pid порожній — шукаємо по product.category/sub_category
+        (для старих даних, де список pid не заповнений).
+        """
+        self.sync(d)
+        out = self._pids.get((str(cat), str(sub)), _EMPTY)
+        if out or not by_product:
+            return out
+        return self._products_map(d).get((str(cat), str(sub)), _EMPTY)
+
+    def count(self, d: Dict[str, Any], cat: str, sub: str) -> int:
+        return len(self.pids(d, cat, sub))
+
+    def _products_map(self, d: Dict[str, Any]) -> Dict[Key, List[int]]:
+        # рідкісний шлях (адмінка) — будується раз на версію каталогу
+        if self._by_product is not None and getattr(d, "version", None) is not None:
+            return self._by_product
+        out: Dict[Key, List[int]] = {}
+        seen = set()
+        for p in (d.get("products") or []):
+            if not isinstance(p, dict):
+                continue
+            pid = _int(p.get("id"))
+            if pid is None:
+                continue
+            key = (
+                str(p.get("category", "") or ""),
+                str(p.get("sub_category", p.get("subcategory", "")) or NO_SUB),
+            )
+            if (key, pid) in seen:
+                continue
+            seen.add((key, pid))
+            out.setdefault(key, []).append(pid)
+        self._by_product = out
+        return out
+
+
+catalog_index = CatalogIndex()
+
+
+def sub_pids(d: Dict[str, Any], cat: str, sub: str, *, by_product: bool = False) -> List[int]:
+    return catalog_index.pids(d, cat, sub, by_product=by_product)
+
+
+def sub_count(d: Dict[str, Any], cat: str, sub: str) -> int:
+    return catalog_index.count(d, cat, sub)
@@ -14,4 +14,49 @@ DATABASE_URL = os.getenv("DATABASE_URL", "")
 SHOP_STATE_KEY = os.getenv("SHOP_STATE_KEY", "shop_state")
 
 # передплата (наложка)
-PREPAY_AMOUNT = int(os.getenv("PREPAY_AMOUNT", "200"))
\ No newline at end of file
+PREPAY_AMOUNT = int(os.getenv("PREPAY_AMOUNT", "200"))
+
+# скільки разів перезапускати мутацію при конфлікті версій (update_data)
+SHOP_CAS_RETRIES = int(os.getenv("SHOP_CAS_RETRIES", "3"))
+
+# вікно злиття частих записів (кошик/обране), мс; 0 — писати одразу
+WRITE_COALESCE_MS = int(os.getenv("WRITE_COALESCE_MS", "200"))
+
+# кеш стану в памʼяті процесу (інвалідація по версії kv_store); 0 — вимкнути
+SHOP_CACHE_ENABLED = os.getenv("SHOP_CACHE_ENABLED", "1") not in ("0", "false", "False", "")
+
+# крос-репліка інвалідація кешу: канал NOTIFY і період запасного опитування версії, с
+SHOP_NOTIFY_CHANNEL = os.getenv("SHOP_NOTIFY_CHANNEL", "shop_state_changed")
+SHOP_SYNC_POLL_S = float(os.getenv("SHOP_SYNC_POLL_S", "5"))
+
+# JSON-кодек для JSONB (engine) і відбитків рядків: auto | orjson | json
+SHOP_JSON_CODEC = os.getenv("SHOP_JSON_CODEC", "auto")
+
+# пул зʼєднань до Postgres (SQLAlchemy + asyncpg)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))      # с, очікування вільного зʼєднання
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))      # с, -1 — не перевідкривати
+# pre-ping = зайвий round trip на кожен checkout; з recycle зазвичай не потрібен
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") not in ("0", "false", "False", "")
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))  # 0 — без ліміту
+# кеш prepared statements asyncpg (за pgbouncer у transaction mode — ставити 0)
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+
+# сповіщення "ціна знизилась" тим, хто додав товар в обране:
+# правки одного товару за вікно зливаються в одне повідомлення; швидкість розсилки, повід./с
+PRICE_DROP_COALESCE_S = float(os.getenv("PRICE_DROP_COALESCE_S", "120"))
+PRICE_DROP_RATE = float(os.getenv("PRICE_DROP_RATE", "20"))
+# кеш готового HTML карток товарів/замовлень (LRU): записів і сумарно символів; 0 записів — вимкнути
+RENDER_CACHE_MAX_ENTRIES = int(os.getenv("RENDER_CACHE_MAX_ENTRIES", "5000"))
+RENDER_CACHE_MAX_CHARS = int(os.getenv("RENDER_CACHE_MAX_CHARS", "4000000"))
+
+# черга вихідних повідомлень: загальний темп (повід./с), пауза між повідомленнями в один чат (с),
+# максимум у черзі, спроб на повідомлення, стеля backoff (с), паралельних запитів, дочікування на shutdown (с)
+SEND_RATE = float(os.getenv("SEND_RATE", "30"))
+SEND_CHAT_INTERVAL_S = float(os.getenv("SEND_CHAT_INTERVAL_S", "1"))
+SEND_QUEUE_MAX = int(os.getenv("SEND_QUEUE_MAX", "10000"))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "5"))
+SEND_BACKOFF_MAX_S = float(os.getenv("SEND_BACKOFF_MAX_S", "30"))
+SEND_CONCURRENCY = int(os.getenv("SEND_CONCURRENCY", "8"))
+SEND_DRAIN_S = float(os.getenv("SEND_DRAIN_S", "5"))
@@ -1,13 +1,25 @@
 from __future__ import annotations
 
-from typing import Dict, Any, Optional
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, Callable, TypeVar, AsyncIterator, Sequence, List, Set, Tuple
+
+import catalogids
+import metrics
+import promos
+import shopindex
+from config import SHOP_CAS_RETRIES, WRITE_COALESCE_MS, SHOP_CACHE_ENABLED
+from db import session_scope
+from storage import load_state, save_state, import_legacy_blob, ShopConflict, ShopState
+from storage import lock_state, read_version, norm_sections, alloc_id, seed_id_sequences, favorited_by
+from storage import orders_keyset
+from statecache import StateCache
+from statesync import watch
+from writebehind import WriteBehind
 
-from sqlalchemy.dialects.postgresql import insert
+T = TypeVar("T")
 
-from text import is_promo_active
-from config import SHOP_STATE_KEY
-from db import session_scope
-from models import KVStore
+# версія формату стану; піднімати, коли в _migrate з'являється новий крок
+SCHEMA_VERSION = 2
 
 
 # =========================================================
@@ -92,45 +104,277 @@ def _migrate(d: Dict[str, Any]) -> Dict[str, Any]:
     # 5️⃣ нормалізація списків
     d["hits"] = [int(x) for x in d.get("hits", []) if str(x).isdigit()]
 
+    # 6️⃣ стабільні id категорій/підкатегорій (для кнопок каталогу)
+    catalogids.sync_ids(d)
+
+    d["schema_version"] = SCHEMA_VERSION
     return d
 
 
+def _ensure_current(d: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Гаряча гілка load/save: якщо стан уже в поточній схемі — нічого не робимо
+    (тільки дешево гарантуємо ключі). Повна _migrate — лише для старих даних.
+    """
+    if isinstance(d, dict) and d.get("schema_version") == SCHEMA_VERSION:
+        for k, v in default_data().items():
+            d.setdefault(k, v)
+        return d
+
+    metrics.inc("shop.migrate.runs")
+    return _migrate(d)
+
+
 # =========================================================
 # LOAD / SAVE
 # =========================================================
 
-async def load_data() -> Dict[str, Any]:
+# Набори секцій для типових хендлерів (див. storage.SECTIONS).
+# None = усе (експорт, міграції).
+CATALOG = ("catalog",)
+STOREFRONT = ("catalog", "carts", "favorites")
+ORDERS = ("catalog", "orders")
+CHECKOUT = ("catalog", "carts", "orders")
+ORDER_EDIT = ("catalog", "orders", "audit")
+CATALOG_EDIT = ("catalog", "audit")
+AUDIT = ("audit",)
+USERS = ("users",)
+
+
+_cache = StateCache()
+
+
+def on_state_version(version: int) -> None:
+    """
+    Нова версія стану (NOTIFY від іншої репліки, опитування або власний запис).
+    Кеш, зібраний для іншої версії, більше не валідний.
+    Індекси процесу скидати не треба — вони звіряються самі: каталожні
+    по catalog_version у заголовку, buyer_index — перечитуючи хвіст таблиць.
+    """
+    if _cache.version is not None and _cache.version != int(version):
+        _cache.clear()
+        metrics.inc("shop.cache.invalidations")
+
+
+def _cache_after_save(d: Dict[str, Any], prev_version: Optional[int], saved: bool) -> None:
+    # викликати ПІСЛЯ commit
+    if not SHOP_CACHE_ENABLED:
+        return
+    if not isinstance(d, ShopState):
+        _cache.clear()  # повна заміна (default_data() тощо)
+        watch.reset()
+        return
+    _cache.put(d, prev_version if saved else None)
+    if saved and d.version is not None:
+        watch.seen(d.version)
+
+
+def _cache_get_live(secs, writes=None) -> Optional[ShopState]:
+    # LISTEN живий → версію знаємо без запиту в БД
+    if not (SHOP_CACHE_ENABLED and watch.live and watch.known is not None):
+        return None
+    if _cache.version != watch.known or not secs <= _cache.sections:
+        return None
+    return _cache.get(watch.known, secs, writes)
+
+
+async def load_data(
+    sections: Optional[Sequence[str]] = None,
+    *,
+    writes: Optional[Sequence[str]] = None,
+) -> Dict[str, Any]:
+    """
+    sections — які домени стану читати (None = усі).
+    Напр. load_data(CATALOG) не чіпає замовлення/кошики/аудит.
+    Якщо версія в БД не змінилась — секції беруться з кешу процесу.
+
+    writes — які з них викликач змінюватиме (None = усі; () = лише читання).
+    Решта секцій з кешу — спільні обʼєкти: їх НЕ мутувати і не зберігати.
+    """
+    secs = norm_sections(sections)
+    wsecs = None if writes is None else norm_sections(writes)
+    d = _cache_get_live(secs, wsecs)
+    if d is not None:
+        return _ensure_current(d)
+
     async with session_scope() as session:
-        row = await session.get(KVStore, SHOP_STATE_KEY)
-        if not row:
-            d = default_data()
-            session.add(KVStore(key=SHOP_STATE_KEY, value=d))
-            return d
-        return _migrate(row.value)
+        if SHOP_CACHE_ENABLED:
+            d = _cache.get(await read_version(session), secs, wsecs)
+        if d is None:
+            d = await load_state(session, secs)
+            if SHOP_CACHE_ENABLED:
+                _cache.put(d)
+    return _ensure_current(d)
 
 
 async def save_data(data: Dict[str, Any]) -> None:
-    data = _migrate(data)
+    """
+    Сумісний шим: пише в таблиці тільки ті рядки, які змінились
+    відносно завантаженого стану (див. storage.save_state).
+    """
+    data = _ensure_current(data)
+    prev = getattr(data, "version", None)
+
+    async with session_scope() as session:
+        saved = await save_state(session, data)
+    _cache_after_save(data, prev, saved)
+
+
+async def update_data(
+    mutate: Callable[[Dict[str, Any]], T],
+    sections: Optional[Sequence[str]] = None,
+    *,
+    retries: Optional[int] = None,
+) -> T:
+    """
+    Оптимістичне оновлення: load → mutate(d) → CAS save.
+    Якщо між load і save стан встиг змінитись — перезапускаємо mutate
+    на свіжому стані (не більше retries разів). Після вичерпання спроб
+    останній запис робимо без CAS (по рядках, last-writer-wins).
+
+    mutate може бути викликаний кілька разів — без побічних ефектів назовні!
+    """
+    retries = SHOP_CAS_RETRIES if retries is None else max(0, int(retries))
+
+    for attempt in range(retries + 1):
+        d = await load_data(sections)
+        result = mutate(d)
+        prev = d.version
+        try:
+            async with session_scope() as session:
+                saved = await save_state(session, d, strict=True)
+            _cache_after_save(d, prev, saved)
+            return result
+        except ShopConflict:
+            metrics.inc("shop.cas.retries")
+            # наш кеш відстав (NOTIFY ще не дійшов) — наступна спроба читає з БД
+            _cache.clear()
+            watch.reset()
+            continue
+
+    metrics.inc("shop.cas.exhausted")
+    d = await load_data(sections)
+    result = mutate(d)
+    await save_data(d)
+    return result
+
+
+@asynccontextmanager
+async def shop_tx(sections: Optional[Sequence[str]] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Unit of work: load (з блокуванням рядка стану) → зміни → save,
+    все в ОДНІЙ транзакції. Паралельні записи чекають на commit.
+    Використання:
+        async with shop_tx() as d:
+            ...міняємо d...
+        # тут уже збережено — тепер можна відповідати в Telegram
+
+    Виняток усередині блоку = rollback, нічого не записано.
+    Не шліть повідомлення всередині блоку — це тримає блокування.
+    """
+    secs = norm_sections(sections)
+    async with session_scope() as session:
+        # під блокуванням версія вже не зміниться — кешу можна довіряти
+        row = await lock_state(session)
+        d = _cache.get(int(row.version or 0), secs) if SHOP_CACHE_ENABLED else None
+        if d is None:
+            d = await load_state(session, secs, for_update=True)
+        d = _ensure_current(d)
+        prev = d.version
+        yield d
+        saved = await save_state(session, d)
+    _cache_after_save(d, prev, saved)
+
+
+@asynccontextmanager
+async def shop_read(sections: Optional[Sequence[str]] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Стан тільки для читання: без блокувань і без збереження на виході.
+    Секції з кешу — спільні (без копії), тож d не мутувати.
+    """
+    yield await load_data(sections, writes=())
+
+
+# =========================================================
+# COALESCED WRITES (кошик / обране)
+# =========================================================
+
+async def _apply_batch(
+    mutations: List[Callable[[Dict[str, Any]], Any]],
+    sections: Optional[Set[str]],
+) -> List[Tuple[bool, Any]]:
+    results: List[Tuple[bool, Any]] = []
+    async with shop_tx(sections) as d:
+        for mutate in mutations:
+            try:
+                results.append((True, mutate(d)))
+            except Exception as e:
+                results.append((False, e))
+    return results
+
+
+_writer = WriteBehind(_apply_batch, window_ms=WRITE_COALESCE_MS)
+
+
+async def update_data_coalesced(
+    mutate: Callable[[Dict[str, Any]], T],
+    sections: Optional[Sequence[str]] = None,
+) -> T:
+    """
+    Як update_data, але мутації за вікно WRITE_COALESCE_MS зливаються
+    в одну транзакцію з одним записом. Повертає результат mutate
+    після того, як запис зафіксовано.
+    Для частих дрібних дій (тапи +/- , ⭐). Замовлення/оплата — НЕ сюди.
+    """
+    return await _writer.submit(mutate, sections)
+
+
+async def flush_writes() -> None:
+    """Негайно записати накопичені мутації (перед оформленням/оплатою)."""
+    await _writer.flush()
+
+
+async def close_writes() -> None:
+    """Shutdown: нічого з черги не губимо."""
+    await _writer.close()
+
+
+async def init_storage() -> None:
+    """
+    Викликається на старті (init_db):
+    1) переносить старий єдиний JSONB у таблиці (один раз);
+    2) проганяє _migrate по всьому стану, якщо schema_version застаріла,
+       і штампує поточну — далі load/save міграцію пропускають.
+    """
+    async with session_scope() as session:
+        await import_legacy_blob(session, _migrate)
 
     async with session_scope() as session:
-        stmt = insert(KVStore).values(key=SHOP_STATE_KEY, value=data)
-        stmt = stmt.on_conflict_do_update(
-            index_elements=[KVStore.key],
-            set_={"value": data},
-        )
-        await session.execute(stmt)
+        d = await load_state(session, for_update=True)
+        if d.get("schema_version") != SCHEMA_VERSION:
+            metrics.inc("shop.migrate.startup")
+            await save_state(session, _migrate(d))
+    _cache.clear()
+
+    # лічильники id стартують з поточного максимуму
+    async with session_scope() as session:
+        await seed_id_sequences(session)
 
 
 # =========================================================
 # IDS
 # =========================================================
 
-def next_product_id(data: Dict[str, Any]) -> int:
-    return max((int(p.get("id", 0)) for p in data.get("products", [])), default=0) + 1
+async def alloc_product_id() -> int:
+    """Новий id товару (Postgres sequence, O(1), без дублів між репліками)."""
+    async with session_scope() as session:
+        return await alloc_id(session, "product")
 
 
-def next_order_id(data: Dict[str, Any]) -> int:
-    return max((int(o.get("id", 0)) for o in data.get("orders", [])), default=0) + 1
+async def alloc_order_id() -> int:
+    """Новий id замовлення. Викликати ДО shop_tx — не тримаємо друге зʼєднання під блокуванням."""
+    async with session_scope() as session:
+        return await alloc_id(session, "order")
 
 
 # =========================================================
@@ -138,13 +382,92 @@ def next_order_id(data: Dict[str, Any]) -> int:
 # =========================================================
 
 def find_product(data: Dict[str, Any], pid: int) -> Optional[Dict[str, Any]]:
-    for p in data.get("products", []):
-        try:
-            if int(p.get("id")) == int(pid):
-                return p
-        except Exception:
-            continue
-    return None
+    # O(1) через ShopIndex (будується раз на стан)
+    return shopindex.by_id(data, pid)
+
+
+def find_product_by_sku(data: Dict[str, Any], sku: str) -> Optional[Dict[str, Any]]:
+    return shopindex.by_sku(data, sku)
+
+
+def find_product_by_barcode(data: Dict[str, Any], barcode: str) -> Optional[Dict[str, Any]]:
+    return shopindex.by_barcode(data, barcode)
+
+
+# =========================================================
+# ORDERS (індекс по покупцю)
+# =========================================================
+
+def find_order_by_id(data: Dict[str, Any], oid: int) -> Optional[Dict[str, Any]]:
+    return shopindex.order_by_id(data, oid)
+
+
+def orders_of_user(data: Dict[str, Any], uid: int) -> list:
+    """Замовлення покупця, новіші першими."""
+    return shopindex.orders_of_user(data, uid)
+
+
+def orders_count_of_user(data: Dict[str, Any], uid: int) -> int:
+    return shopindex.orders_count_of_user(data, uid)
+
+
+def orders_by_status(data: Dict[str, Any], statuses, *, newest_first: bool = False) -> list:
+    return shopindex.orders_by_status(data, statuses, newest_first=newest_first)
+
+
+def order_status_counts(data: Dict[str, Any]) -> Dict[str, int]:
+    return shopindex.status_counts(data)
+
+
+def order_status_changed(data: Dict[str, Any], order: Dict[str, Any]) -> None:
+    """Після прямої зміни order["status"] (поза order_set_status)."""
+    shopindex.order_status_changed(data, order)
+
+
+def add_order(data: Dict[str, Any], order: Dict[str, Any]) -> None:
+    """Дописати нове замовлення і оновити індекси."""
+    data.setdefault("orders", []).append(order)
+    shopindex.order_added(data, order)
+
+
+async def orders_page(
+    *,
+    statuses: Optional[Sequence[str]] = None,
+    user_id: Optional[int] = None,
+    older_than: Optional[Tuple[int, int]] = None,
+    newer_than: Optional[Tuple[int, int]] = None,
+    limit: int = 10,
+) -> Tuple[List[Dict[str, Any]], bool, bool]:
+    """
+    Сторінка списку замовлень для адмінки, новіші першими — запит по індексу
+    created_ts, без load_data(ORDERS). Повертає (рядки, є_новіші, є_старіші).
+    """
+    async with session_scope() as session:
+        if newer_than is not None:
+            rows = await orders_keyset(session, statuses=statuses, user_id=user_id,
+                                       newer_than=newer_than, limit=limit)
+            if rows:
+                has_newer = len(rows) > limit
+                return list(reversed(rows[:limit])), has_newer, True
+            # новіших не лишилось (видалили/змінили фільтр) — перша сторінка
+            older_than = None
+
+        rows = await orders_keyset(session, statuses=statuses, user_id=user_id,
+                                   older_than=older_than, limit=limit)
+        return rows[:limit], older_than is not None, len(rows) > limit
+
+
+# =========================================================
+# FAVORITES (зворотний індекс: товар → покупці)
+# =========================================================
+
+async def fans_of_product(pid: int) -> List[int]:
+    """
+    Хто тримає товар в обраному. Запит по індексу shop_favorites.product_id —
+    актуально одразу після fav_toggle (на будь-якій репліці) і без load_data.
+    """
+    async with session_scope() as session:
+        return await favorited_by(session, pid)
 
 
 # =========================================================
@@ -152,12 +475,7 @@ def find_product(data: Dict[str, Any], pid: int) -> Optional[Dict[str, Any]]:
 # =========================================================
 
 def _unit_price(p: dict) -> float:
-    try:
-        if is_promo_active(p):
-            return float(p.get("promo_price") or 0)
-        return float(p.get("base_price", p.get("price", 0)) or 0)
-    except Exception:
-        return 0.0
+    return promos.unit_price(p)
 
 
 def cart_total(d: dict, cart) -> float:
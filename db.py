@@ -1,11 +1,26 @@
 from __future__ import annotations
 
+import time
 from contextlib import asynccontextmanager
+from typing import Any, Dict
 
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-from config import DATABASE_URL
+from config import (
+    DATABASE_URL,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING,
+    DB_STATEMENT_TIMEOUT_MS,
+    DB_STATEMENT_CACHE_SIZE,
+)
+import jsoncodec
+import metrics
 
 
 def make_async_url(url: str) -> str:
@@ -21,12 +36,88 @@ if not DATABASE_URL:
 
 ASYNC_DATABASE_URL = make_async_url(DATABASE_URL)
 
+
+class MeteredPool(AsyncAdaptedQueuePool):
+    """Пул, що міряє, скільки чекали на вільне зʼєднання."""
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.observe_ms("db.pool.wait", (time.perf_counter() - t0) * 1000.0)
+
+
+def _connect_args() -> Dict[str, Any]:
+    args: Dict[str, Any] = {
+        # кеш asyncpg на рівні зʼєднання + кеш діалекту SQLAlchemy
+        "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+        "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+    }
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+    return args
+
+
 engine = create_async_engine(
     ASYNC_DATABASE_URL,
     echo=False,
-    pool_pre_ping=True,
+    poolclass=MeteredPool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    connect_args=_connect_args(),
+    json_serializer=jsoncodec.dumps,
+    json_deserializer=jsoncodec.loads,
 )
 
+
+# =========================================================
+# POOL METRICS (db.pool.* у /stats)
+# =========================================================
+
+def pool_status() -> Dict[str, int]:
+    pool = engine.sync_engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(0, pool.overflow()),
+    }
+
+
+def _update_pool_gauges() -> None:
+    st = pool_status()
+    metrics.set_gauge("db.pool.checked_out", st["checked_out"])
+    metrics.set_gauge("db.pool.overflow", st["overflow"])
+    if st["checked_out"] > metrics.get_gauge("db.pool.peak_checked_out"):
+        metrics.set_gauge("db.pool.peak_checked_out", st["checked_out"])
+
+
+@event.listens_for(engine.sync_engine.pool, "connect")
+def _on_pool_connect(dbapi_conn, conn_record):
+    metrics.inc("db.pool.connects")
+
+
+@event.listens_for(engine.sync_engine.pool, "checkout")
+def _on_pool_checkout(dbapi_conn, conn_record, conn_proxy):
+    metrics.inc("db.pool.checkouts")
+    _update_pool_gauges()
+    if engine.sync_engine.pool.overflow() > 0:
+        metrics.inc("db.pool.overflow_checkouts")
+
+
+@event.listens_for(engine.sync_engine.pool, "checkin")
+def _on_pool_checkin(dbapi_conn, conn_record):
+    _update_pool_gauges()
+
+
+@event.listens_for(engine.sync_engine.pool, "invalidate")
+def _on_pool_invalidate(dbapi_conn, conn_record, exception):
+    metrics.inc("db.pool.invalidated")
+
 SessionLocal = async_sessionmaker(
     engine,
     class_=AsyncSession,
@@ -14,11 +14,21 @@ from aiogram.fsm.context import FSMContext
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 from data import default_data, save_data, load_data
-from data import load_data, save_data, next_product_id, find_product
+from data import load_data, save_data, shop_tx, alloc_product_id, find_product, find_product_by_barcode
+from data import find_order_by_id, orders_of_user, orders_by_status, order_status_counts
+from data import AUDIT, CATALOG, CATALOG_EDIT, ORDERS, ORDER_EDIT, orders_page
+from buyersearch import buyer_index, order_phone
+from productsearch import product_search
+from catalogindex import sub_pids, sub_count
+from promos import price_table, unit_price
+from pricewatch import price_watch
+from rendercache import render_cache, invalidate_product, invalidate_order
+from catalogids import cat_id, sub_id, cat_by_id, sub_by_id
 from states import AdminFSM, EditProductFSM
 from utils import is_admin, is_staff, notify_user, format_order_text
-from text import order_premium_text, product_card
+from text import order_premium_text, product_card, money_uah, split_message, ORDER_STATUS_LABELS
 
+import metrics
 from audit import fmt_ts, audit_add, pick_fields
 from orders_timeline import (
     order_set_status,
@@ -122,6 +132,13 @@ def _ensure_product_schema(p: dict) -> None:
         p["barcode"] = ""
 
 
+def _product_view(p: dict) -> dict:
+    # копія з усіма полями: зі спільного (writes=()) стану p не чіпаємо
+    pp = dict(p)
+    _ensure_product_schema(pp)
+    return pp
+
+
 def _order_products(d: dict, o: dict) -> list[dict]:
     """
     items може бути:
@@ -148,41 +165,30 @@ def _order_products(d: dict, o: dict) -> list[dict]:
 
         p = find_product(d, pid_int)
         if p:
-            _ensure_product_schema(p)
-            pp = dict(p)
+            pp = _product_view(p)
             pp["_qty"] = max(1, qty)
             products.append(pp)
     return products
 
 
-async def _cat_by_index(cat_i: int) -> str | None:
-    d = await load_data()
-    cats = list((d.get("categories", {}) or {}).keys())
-    if 0 <= cat_i < len(cats):
-        return cats[cat_i]
-    return None
+def _cat_by_id(d: dict, cid: str) -> str | None:
+    return cat_by_id(d, cid)
 
 
-async def _sub_by_index(cat_i: int, sub_i: str) -> str | None:
-    cat = await _cat_by_index(cat_i)
-    if not cat:
+def _sub_by_id(d: dict, cid: str, sub_token: str) -> str | None:
+    # "n" = 🧷 Утлет (NO_SUB), інакше — id підкатегорії
+    if _cat_by_id(d, cid) is None:
         return None
-
-    d = await load_data()
-    subs = (d.get("categories", {}) or {}).get(cat, {}) or {}
-    subs_list = [s for s in subs.keys() if s != NO_SUB]
-
-    if sub_i == "n":
+    if sub_token == "n":
         return NO_SUB
+    return sub_by_id(d, cid, sub_token)
 
-    try:
-        j = int(sub_i)
-    except Exception:
-        return None
 
-    if 0 <= j < len(subs_list):
-        return subs_list[j]
-    return None
+def _sub_token(d: dict, cat: str, sub: str) -> str | None:
+    if sub == NO_SUB:
+        return "n"
+    sid = sub_id(d, cat, sub)
+    return str(sid) if sid is not None else None
 
 
 def _ttn_norm(s: str) -> str:
@@ -196,34 +202,37 @@ def _ttn_norm(s: str) -> str:
 # INLINE KB
 # =========================================================
 
-async def cats_inline(action: str) -> types.InlineKeyboardMarkup:
-    d = await load_data()
+def cats_inline(d: dict, action: str) -> types.InlineKeyboardMarkup:
     cats = list((d.get("categories", {}) or {}).keys())
 
     kb = InlineKeyboardBuilder()
-    for i, c in enumerate(cats):
-        kb.button(text=str(c), callback_data=f"adm:{action}:cat_i:{i}")
+    for c in cats:
+        cid = cat_id(d, c)
+        if cid is None:
+            continue
+        kb.button(text=str(c), callback_data=f"adm:{action}:cid:{cid}")
     kb.adjust(2)
     return kb.as_markup()
 
 
-async def subs_inline(cat_i: int, action: str, include_no_sub: bool = False) -> types.InlineKeyboardMarkup:
-    d = await load_data()
-    cats = list((d.get("categories", {}) or {}).keys())
-    if cat_i < 0 or cat_i >= len(cats):
+def subs_inline(d: dict, cid: str, action: str, include_no_sub: bool = False) -> types.InlineKeyboardMarkup:
+    cat = _cat_by_id(d, cid)
+    if cat is None:
         return InlineKeyboardBuilder().as_markup()
 
-    cat = cats[cat_i]
     subs = (d.get("categories", {}) or {}).get(cat, {}) or {}
     subs_list = [s for s in subs.keys() if s != NO_SUB]
 
     kb = InlineKeyboardBuilder()
 
     if include_no_sub:
-        kb.button(text="🧷 Утлет", callback_data=f"adm:{action}:sub_i:{cat_i}:n")
+        kb.button(text=f"🧷 Утлет ({sub_count(d, cat, NO_SUB)})", callback_data=f"adm:{action}:sid:{cid}:n")
 
-    for j, s in enumerate(subs_list):
-        kb.button(text=str(s), callback_data=f"adm:{action}:sub_i:{cat_i}:{j}")
+    for s in subs_list:
+        tok = _sub_token(d, cat, s)
+        if tok is None:
+            continue
+        kb.button(text=f"{s} ({sub_count(d, cat, s)})", callback_data=f"adm:{action}:sid:{cid}:{tok}")
 
     kb.adjust(1)
     return kb.as_markup()
@@ -263,7 +272,7 @@ def edit_menu_kb(pid: int) -> types.InlineKeyboardMarkup:
 
 
 async def product_actions_kb(pid: int) -> types.InlineKeyboardMarkup:
-    d = await load_data()
+    d = await load_data(())
     hits = _hits_set(d)
 
     kb = InlineKeyboardBuilder()
@@ -305,11 +314,23 @@ def panel_catalog_kb() -> types.InlineKeyboardMarkup:
     return kb.as_markup()
 
 
-def panel_orders_kb() -> types.InlineKeyboardMarkup:
+# черги замовлень (статуси)
+QUEUE_PAID = ("paid", "prepay")
+QUEUE_PICKLIST = ("pending", "paid", "prepay", "new", "in_work")
+
+
+def _badge(counts: Dict[str, int] | None, statuses) -> str:
+    if counts is None:
+        return ""
+    n = sum(counts.get(s, 0) for s in statuses)
+    return f" ({n})" if n else ""
+
+
+def panel_orders_kb(counts: Dict[str, int] | None = None) -> types.InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
-    kb.button(text="📄 Накладна (нові)", callback_data="adm:panel:picklist_new")
-    kb.button(text="📋 Нові (оплачені)", callback_data="adm:panel:orders_paid")
-    kb.button(text="📦 Усі замовлення", callback_data="adm:panel:orders_all")
+    kb.button(text="📄 Накладна (нові)" + _badge(counts, QUEUE_PICKLIST), callback_data="adm:panel:picklist_new")
+    kb.button(text="📋 Нові (оплачені)" + _badge(counts, QUEUE_PAID), callback_data="adm:panel:orders_paid")
+    kb.button(text="📦 Усі замовлення" + _badge(counts, counts or ()), callback_data="adm:panel:orders_all")
     kb.button(text="🔎 Пошук покупця", callback_data="adm:panel:buyer_search")
     kb.button(text="⬅️ Назад", callback_data="adm:panel:back")
     kb.adjust(1)
@@ -333,7 +354,7 @@ def panel_settings_kb(uid: int) -> types.InlineKeyboardMarkup:
 
 @router.callback_query(F.data.startswith("adm:audit:last:"))
 async def audit_show(cb: types.CallbackQuery):
-    d = await load_data()
+    d = await load_data(AUDIT, writes=())
     if not is_staff(d, cb.from_user.id):
         return await cb.answer("Немає доступу", show_alert=True)
 
@@ -406,7 +427,7 @@ async def audit_show(cb: types.CallbackQuery):
 
 @router.message(Command("admin"))
 async def admin_cmd(m: types.Message, state: FSMContext):
-    d = await load_data()
+    d = await load_data(())
     if not is_staff(d, m.from_user.id):
         return await m.answer("⛔️ Немає доступу")
     await state.clear()
@@ -415,7 +436,7 @@ async def admin_cmd(m: types.Message, state: FSMContext):
 
 @router.callback_query(F.data == "adm:cancel")
 async def cancel_cb(cb: types.CallbackQuery, state: FSMContext):
-    d = await load_data()
+    d = await load_data(())
     if not is_staff(d, cb.from_user.id):
         return await cb.answer("Немає доступу", show_alert=True)
 
@@ -430,7 +451,8 @@ async def cancel_cb(cb: types.CallbackQuery, state: FSMContext):
 
 @router.callback_query(F.data.startswith("adm:panel:"))
 async def panel_nav(cb: types.CallbackQuery, state: FSMContext):
-    d = await load_data()
+    # шапка (ролі) + замовлення для бейджів; каталог — лише діям, яким він потрібен
+    d = await load_data(("orders",), writes=())
     if not is_staff(d, cb.from_user.id):
         return await cb.answer("Немає доступу", show_alert=True)
 
@@ -446,7 +468,7 @@ async def panel_nav(cb: types.CallbackQuery, state: FSMContext):
         return await cb.answer()
 
     if action == "orders":
-        await cb.message.answer("📑 Замовлення:", reply_markup=panel_orders_kb())
+        await cb.message.answer("📑 Замовлення:", reply_markup=panel_orders_kb(order_status_counts(d)))
         return await cb.answer()
 
     if action == "settings":
@@ -465,82 +487,44 @@ async def panel_nav(cb: types.CallbackQuery, state: FSMContext):
         if not can_edit_catalog(d, cb.from_user.id):
             return await cb.answer("⛔️ Недостатньо прав", show_alert=True)
         await state.set_state(AdminFSM.add_sub_cat)
-        await cb.message.answer("Оберіть категорію:", reply_markup=await cats_inline("sub_add"))
+        d = await load_data(CATALOG, writes=())
+        await cb.message.answer("Оберіть категорію:", reply_markup=cats_inline(d, "sub_add"))
         return await cb.answer()
 
     if action == "cats":
-        await cb.message.answer("Оберіть категорію:", reply_markup=await cats_inline("catmgmt"))
+        d = await load_data(CATALOG, writes=())
+        await cb.message.answer("Оберіть категорію:", reply_markup=cats_inline(d, "catmgmt"))
         return await cb.answer()
 
     if action == "products":
-        await cb.message.answer("Оберіть категорію:", reply_markup=await cats_inline("plist_cat"))
+        d = await load_data(CATALOG, writes=())
+        await cb.message.answer("Оберіть категорію:", reply_markup=cats_inline(d, "plist_cat"))
         return await cb.answer()
 
     if action == "add_product":
         if not can_edit_catalog(d, cb.from_user.id):
             return await cb.answer("⛔️ Недостатньо прав", show_alert=True)
         await state.set_state(AdminFSM.prod_cat)
-        await cb.message.answer("Оберіть категорію:", reply_markup=await cats_inline("prod_cat"))
+        d = await load_data(CATALOG, writes=())
+        await cb.message.answer("Оберіть категорію:", reply_markup=cats_inline(d, "prod_cat"))
         return await cb.answer()
 
     # ----- ORDERS -----
-    if action == "orders_paid":
+    if action in ("orders_paid", "orders_all"):
         if not can_manage_orders(d, cb.from_user.id):
             return await cb.answer("⛔️ Недостатньо прав", show_alert=True)
 
-        paid = [o for o in (d.get("orders", []) or []) if (o.get("status") or "").strip().lower() in ("paid", "prepay")]
-        if not paid:
-            await cb.message.answer("Немає нових оплачених/передплачених замовлень.")
-            return await cb.answer()
-
-        for o in paid:
-            products = _order_products(d, o)
-            await cb.message.answer(
-                order_premium_text(d, o, products),
-                parse_mode="HTML",
-                reply_markup=order_actions_kb(int(o["id"]), str(o.get("status", "")), d=d, uid=cb.from_user.id)
-            )
+        txt, kb = await _orders_list_view("pay" if action == "orders_paid" else "all", 0)
+        await _show_orders_list(cb, txt, kb, edit=False)
         return await cb.answer()
 
-    if action == "orders_all":
-        if not can_manage_orders(d, cb.from_user.id):
-            return await cb.answer("⛔️ Недостатньо прав", show_alert=True)
-
-        orders = d.get("orders", []) or []
-        if not orders:
-            await cb.message.answer("Замовлень ще немає.")
-            return await cb.answer()
-
-        orders = d.get("orders", []) or []
-        orders_sorted = sorted(orders, key=lambda x: int(x.get("created_ts", 0) or 0))
-
-        for o in orders_sorted:
-            products = _order_products(d, o)
-            await cb.message.answer(
-                order_premium_text(d, o, products),
-                parse_mode="HTML",
-                reply_markup=order_actions_kb(int(o["id"]), str(o.get("status", "")), d=d, uid=cb.from_user.id)
-            )
-        return await cb.answer()
-        
     if action == "picklist_new":
         if not can_manage_orders(d, cb.from_user.id):
             return await cb.answer("⛔️ Недостатньо прав", show_alert=True)
 
-        orders = d.get("orders", []) or []
-    # “нові/в роботі” — налаштуй під себе:
-        new_orders = [o for o in orders if (o.get("status") or "").strip().lower() in ("pending", "paid", "prepay", "new", "in_work")]
-
-        if not new_orders:
-            await cb.message.answer("✅ Немає нових замовлень для складу.")
-            return await cb.answer()
-
-    # найновіші зверху:
-        new_orders.sort(key=lambda x: int(x.get("created_ts", 0) or 0), reverse=True)
-
-        for o in new_orders:
-            await cb.message.answer(picklist_order_text(d, o), parse_mode="HTML")
-
+        # “нові/в роботі” (QUEUE_PICKLIST) одним зведеним списком; по замовленнях — кнопкою
+        d = await load_data(ORDERS, writes=())
+        await _send_wave(cb.message, d, "sku")
         return await cb.answer()
 
     if action == "buyer_search":
@@ -624,180 +608,307 @@ def order_actions_kb(
 
 
 def _find_order(d: dict, oid: int) -> dict | None:
-    for o in (d.get("orders", []) or []):
-        try:
-            if int(o.get("id", -1)) == int(oid):
-                return o
-        except Exception:
-            continue
-    return None
+    return find_order_by_id(d, oid)
 
 
 # =========================================================
-# ORDERS: CHANGE STATUS + TTN + TIMELINE + HISTORY
+# ORDERS LIST (одне повідомлення, редагується на місці)
+# Сторінки — keyset по (created_ts, id), новіші першими:
+#   adm:ol:{filter}:{uid}            — перша сторінка
+#   adm:ol:{filter}:{uid}:o:{ts}:{id} — старіші за ключ
+#   adm:ol:{filter}:{uid}:n:{ts}:{id} — новіші за ключ
+# uid = 0 — усі покупці, інакше — історія одного покупця.
 # =========================================================
 
-@router.callback_query(F.data.startswith("adm:order:"))
-async def order_change_status(cb: types.CallbackQuery, bot: Bot, state: FSMContext):
-    d = await load_data()
-    if not is_staff(d, cb.from_user.id):
-        return await cb.answer("Немає доступу", show_alert=True)
+ORDERS_PER_PAGE = 8
 
-    _, _, action, oid_str = cb.data.split(":")
-    oid = int(oid_str)
+# чипи фільтра: ключ -> (підпис, статуси | None = усі)
+ORDER_FILTERS: Dict[str, tuple] = {
+    "all": ("📦 Усі", None),
+    "pay": ("💳 Оплачені", QUEUE_PAID),
+    "wait": ("⏳ Очікують", ("pending", "new")),
+    "work": ("🟡 В роботі", ("in_work", "picking", "packed")),
+    "ship": ("🚚 В дорозі", ("shipped", "arrived")),
+    # результат видачі: забрав (received/picked) — окремо від not_picked у "bad"
+    "got": ("📬 Отримані", ("received", "picked")),
+    "end": ("✅ Закриті", ("done",)),
+    "bad": ("❌ Проблемні", ("not_picked", "returned", "canceled")),
+}
 
-    order = _find_order(d, oid)
-    if not order:
-        await cb.message.answer("❌ Замовлення не знайдено.")
-        return await cb.answer()
 
-    before = pick_fields(order, ["status", "ttn", "np_ttn"])
+def _order_status_label(status: str) -> str:
+    st = (status or "").strip().lower()
+    return ORDER_STATUS_LABELS.get(st, st or "—")
 
-    async def _reply_updated(prefix_text: str):
-        products = _order_products(d, order)
-        kb = order_actions_kb(oid, str(order.get("status", "")), d=d, uid=cb.from_user.id)
-        await cb.message.answer(prefix_text + "\n\n" + order_premium_text(d, order, products), parse_mode="HTML", reply_markup=kb)
 
-    st = (order.get("status") or "").strip().lower()
+def _order_row(o: dict) -> str:
+    try:
+        when = datetime.fromtimestamp(int(o.get("created_ts", 0) or 0)).strftime("%d.%m %H:%M")
+    except Exception:
+        when = "-"
+    return (
+        f"<code>#{o['id']}</code> · {when} · {_order_status_label(o.get('status', ''))}"
+        f" · <b>{money_uah(o.get('total', 0))}</b>"
+    )
 
-    if action == "in_work":
-        if not can_manage_orders(d, cb.from_user.id):
-            return await cb.answer("⛔️ Недостатньо прав", show_alert=True)
-        if st not in ("paid", "prepay"):
-            return await cb.answer("Тільки paid/prepay можна взяти в роботу", show_alert=True)
 
-        order_set_status(order, "in_work", who=str(cb.from_user.id), details="Взято в роботу")
-        after = pick_fields(order, ["status", "ttn", "np_ttn"])
-        audit_add(d, actor_id=cb.from_user.id, actor_role=_role_of(d, cb.from_user.id),
-                  action="order.in_work", entity_type="order", entity_id=oid, entity_name=f"#{oid}",
-                  before=before, after=after)
+def _rows_of(n: int, width: int = 4) -> list[int]:
+    # розміри рядків для kb.adjust: по width кнопок, залишок — окремим рядком
+    return [width] * (n // width) + ([n % width] if n % width else [])
 
-        await save_data(d)
-        await _reply_updated(f"🟡 Замовлення #{oid} взято в роботу.")
-        await _notify_buyer(bot, d, order, f"🟡 Ваше замовлення #{oid} взято в роботу ✅")
-        return await cb.answer()
 
-    if action == "packed":
-        if not can_mark_packing(d, cb.from_user.id):
-            return await cb.answer("⛔️ Недостатньо прав", show_alert=True)
-        if st not in ("paid", "prepay", "in_work", "packed"):
-            return await cb.answer("Запакувати можна після paid/prepay/in_work", show_alert=True)
+def orders_list_kb(rows: list[dict], flt: str, uid: int, has_newer: bool, has_older: bool) -> types.InlineKeyboardMarkup:
+    kb = InlineKeyboardBuilder()
 
-        order_set_status(order, "packed", who=str(cb.from_user.id), details="Запаковано")
-        after = pick_fields(order, ["status", "ttn", "np_ttn"])
-        audit_add(d, actor_id=cb.from_user.id, actor_role=_role_of(d, cb.from_user.id),
-                  action="order.packed", entity_type="order", entity_id=oid, entity_name=f"#{oid}",
-                  before=before, after=after)
+    for o in rows:
+        kb.button(text=f"📂 #{o['id']}", callback_data=f"adm:oo:{o['id']}")
+    sizes = _rows_of(len(rows))
+
+    nav = 0
+    if has_newer:
+        first = rows[0]
+        kb.button(text="⬅️ Новіші", callback_data=f"adm:ol:{flt}:{uid}:n:{first['created_ts']}:{first['id']}")
+        nav += 1
+    if has_older:
+        last = rows[-1]
+        kb.button(text="Старіші ➡️", callback_data=f"adm:ol:{flt}:{uid}:o:{last['created_ts']}:{last['id']}")
+        nav += 1
+    if nav:
+        sizes.append(nav)
+
+    for key, (label, _) in ORDER_FILTERS.items():
+        kb.button(text=("• " + label if key == flt else label), callback_data=f"adm:ol:{key}:{uid}")
+    sizes += _rows_of(len(ORDER_FILTERS))
+
+    kb.button(text="⬅️ Назад", callback_data="adm:panel:orders")
+    sizes.append(1)
+
+    kb.adjust(*sizes)
+    return kb.as_markup()
 
-        await save_data(d)
-        await _reply_updated(f"📦 Замовлення #{oid} запаковано.")
-        await _notify_buyer(bot, d, order, f"📦 Ваше замовлення #{oid} запаковано ✅")
-        return await cb.answer()
 
-    if action == "shipped":
-        if not can_mark_logistics(d, cb.from_user.id):
-            return await cb.answer("⛔️ Недостатньо прав", show_alert=True)
-        if st not in ("paid", "prepay", "in_work", "packed", "shipped"):
-            return await cb.answer("Неможливо позначити як відправлено", show_alert=True)
+async def _orders_list_view(flt: str, uid: int, older_than=None, newer_than=None) -> tuple[str, types.InlineKeyboardMarkup]:
+    label, statuses = ORDER_FILTERS.get(flt, ORDER_FILTERS["all"])
+    rows, has_newer, has_older = await orders_page(
+        statuses=statuses, user_id=uid or None,
+        older_than=older_than, newer_than=newer_than, limit=ORDERS_PER_PAGE,
+    )
 
-        order_set_status(order, "shipped", who=str(cb.from_user.id), details="Позначено як відправлено (очікуємо ТТН)")
-        after = pick_fields(order, ["status", "ttn", "np_ttn"])
-        audit_add(d, actor_id=cb.from_user.id, actor_role=_role_of(d, cb.from_user.id),
-                  action="order.shipped", entity_type="order", entity_id=oid, entity_name=f"#{oid}",
-                  before=before, after=after)
+    head = f'<a href="tg://user?id={uid}">👤 Покупець</a> · ' if uid else ""
+    lines = [f"{head}<b>📑 Замовлення</b> · {label}", "<i>новіші першими</i>", ""]
+    if rows:
+        lines += [_order_row(o) for o in rows]
+    else:
+        lines.append("Замовлень немає.")
+        has_newer = has_older = False
 
-        await save_data(d)
-        await _reply_updated(f"🚚 Замовлення #{oid} позначено як ВІДПРАВЛЕНО.")
+    return "\n".join(lines), orders_list_kb(rows, flt, uid, has_newer, has_older)
 
-        await state.clear()
-        await state.set_state(AdminFSM.order_ttn)
-        await state.update_data(oid=oid)
-        await cb.message.answer("📮 Введіть ТТН для цього замовлення (або '-' щоб без ТТН):")
-        return await cb.answer()
 
-    if action == "arrived":
-        if not can_mark_logistics(d, cb.from_user.id):
-            return await cb.answer("⛔️ Недостатньо прав", show_alert=True)
-        if st not in ("shipped", "arrived"):
-            return await cb.answer("Прибуло доречно тільки після 'Відправлено'", show_alert=True)
+async def _show_orders_list(cb: types.CallbackQuery, txt: str, kb: types.InlineKeyboardMarkup, edit: bool):
+    if edit:
+        try:
+            await cb.message.edit_text(txt, parse_mode="HTML", reply_markup=kb, disable_web_page_preview=True)
+            return
+        except Exception:
+            # "message is not modified" або старе повідомлення з фото — шлемо нове
+            pass
+    await cb.message.answer(txt, parse_mode="HTML", reply_markup=kb, disable_web_page_preview=True)
 
-        order_set_status(order, "arrived", who=str(cb.from_user.id), details="Прибуло у відділення")
-        after = pick_fields(order, ["status", "ttn", "np_ttn"])
-        audit_add(d, actor_id=cb.from_user.id, actor_role=_role_of(d, cb.from_user.id),
-                  action="order.arrived", entity_type="order", entity_id=oid, entity_name=f"#{oid}",
-                  before=before, after=after)
 
-        await save_data(d)
-        await _reply_updated(f"📍 Замовлення #{oid}: прибуло у відділення.")
-        await _notify_buyer(bot, d, order, f"📍 Замовлення #{oid}: прибуло у відділення ✅")
-        return await cb.answer()
+@router.callback_query(F.data.startswith("adm:ol:"))
+async def orders_list_nav(cb: types.CallbackQuery):
+    d = await load_data(())
+    parts = cb.data.split(":")
+    flt = parts[2] if len(parts) > 2 and parts[2] in ORDER_FILTERS else "all"
+    try:
+        uid = int(parts[3]) if len(parts) > 3 else 0
+    except ValueError:
+        uid = 0
 
-    if action == "received":
-        if not can_mark_logistics(d, cb.from_user.id):
-            return await cb.answer("⛔️ Недостатньо прав", show_alert=True)
-        if st not in ("shipped", "arrived", "received"):
-            return await cb.answer("Отримано доречно після shipped/arrived", show_alert=True)
+    allowed = is_staff(d, cb.from_user.id) if uid else can_manage_orders(d, cb.from_user.id)
+    if not allowed:
+        return await cb.answer("⛔️ Недостатньо прав", show_alert=True)
 
-        order_set_status(order, "received", who=str(cb.from_user.id), details="Клієнт отримав/забрав")
-        after = pick_fields(order, ["status", "ttn", "np_ttn"])
-        audit_add(d, actor_id=cb.from_user.id, actor_role=_role_of(d, cb.from_user.id),
-                  action="order.received", entity_type="order", entity_id=oid, entity_name=f"#{oid}",
-                  before=before, after=after)
+    older_than = newer_than = None
+    if len(parts) >= 7:
+        try:
+            key = (int(parts[5]), int(parts[6]))
+        except ValueError:
+            key = None
+        if key is not None:
+            if parts[4] == "n":
+                newer_than = key
+            else:
+                older_than = key
+
+    txt, kb = await _orders_list_view(flt, uid, older_than, newer_than)
+    await _show_orders_list(cb, txt, kb, edit=True)
+    return await cb.answer()
 
-        await save_data(d)
-        await _reply_updated(f"✅ Замовлення #{oid}: клієнт ОТРИМАВ.")
-        await _notify_buyer(bot, d, order, f"✅ Замовлення #{oid}: отримано. Дякуємо! 🙌")
-        return await cb.answer()
 
-    if action == "not_picked":
-        if not can_mark_logistics(d, cb.from_user.id):
-            return await cb.answer("⛔️ Недостатньо прав", show_alert=True)
-        if st not in ("shipped", "arrived", "not_picked"):
-            return await cb.answer("Не забрав доречно після shipped/arrived", show_alert=True)
+@router.callback_query(F.data.startswith("adm:oo:"))
+async def orders_list_open(cb: types.CallbackQuery):
+    d = await load_data(ORDERS, writes=())
+    if not is_staff(d, cb.from_user.id):
+        return await cb.answer("Немає доступу", show_alert=True)
 
-        order_set_status(order, "not_picked", who=str(cb.from_user.id), details="Клієнт не забрав")
-        after = pick_fields(order, ["status", "ttn", "np_ttn"])
-        audit_add(d, actor_id=cb.from_user.id, actor_role=_role_of(d, cb.from_user.id),
-                  action="order.not_picked", entity_type="order", entity_id=oid, entity_name=f"#{oid}",
-                  before=before, after=after)
+    order = _find_order(d, int(cb.data.split(":")[2]))
+    if not order:
+        return await cb.answer("Замовлення не знайдено", show_alert=True)
 
-        await save_data(d)
-        await _reply_updated(f"❌ Замовлення #{oid}: НЕ ЗАБРАВ.")
-        await _notify_buyer(bot, d, order, f"❌ Замовлення #{oid}: не забрано. Напишіть нам — допоможемо 🤝")
-        return await cb.answer()
+    await cb.message.answer(
+        order_premium_text(d, order, _order_products(d, order)),
+        parse_mode="HTML",
+        reply_markup=order_actions_kb(int(order["id"]), str(order.get("status", "")), d=d, uid=cb.from_user.id),
+    )
+    return await cb.answer()
 
-    if action == "returned":
-        if not can_mark_logistics(d, cb.from_user.id):
-            return await cb.answer("⛔️ Недостатньо прав", show_alert=True)
-        if st not in ("shipped", "arrived", "not_picked", "returned", "received"):
-            return await cb.answer("Повернення ставимо після логістики", show_alert=True)
 
-        order_set_status(order, "returned", who=str(cb.from_user.id), details="Повернено")
-        after = pick_fields(order, ["status", "ttn", "np_ttn"])
-        audit_add(d, actor_id=cb.from_user.id, actor_role=_role_of(d, cb.from_user.id),
-                  action="order.returned", entity_type="order", entity_id=oid, entity_name=f"#{oid}",
-                  before=before, after=after)
+# =========================================================
+# ORDERS: CHANGE STATUS + TTN + TIMELINE + HISTORY
+# =========================================================
 
-        await save_data(d)
-        await _reply_updated(f"🔁 Замовлення #{oid}: ПОВЕРНУТО.")
-        await _notify_buyer(bot, d, order, f"🔁 Замовлення #{oid}: повернено. Якщо є питання — пишіть 🙏")
+# Переходи статусів: хто може, з яких статусів, що пишемо в таймлайн/покупцю.
+# "from" — дозволені поточні статуси; "not_from" — заборонені (для done).
+ORDER_TRANSITIONS: Dict[str, Dict[str, Any]] = {
+    "in_work": {
+        "perm": can_manage_orders,
+        "from": ("paid", "prepay"),
+        "deny": "Тільки paid/prepay можна взяти в роботу",
+        "details": "Взято в роботу",
+        "reply": "🟡 Замовлення #{oid} взято в роботу.",
+        "buyer": "🟡 Ваше замовлення #{oid} взято в роботу ✅",
+    },
+    "packed": {
+        "perm": can_mark_packing,
+        "from": ("paid", "prepay", "in_work", "packed"),
+        "deny": "Запакувати можна після paid/prepay/in_work",
+        "details": "Запаковано",
+        "reply": "📦 Замовлення #{oid} запаковано.",
+        "buyer": "📦 Ваше замовлення #{oid} запаковано ✅",
+    },
+    "shipped": {
+        "perm": can_mark_logistics,
+        "from": ("paid", "prepay", "in_work", "packed", "shipped"),
+        "deny": "Неможливо позначити як відправлено",
+        "details": "Позначено як відправлено (очікуємо ТТН)",
+        "reply": "🚚 Замовлення #{oid} позначено як ВІДПРАВЛЕНО.",
+        "buyer": None,  # покупця повідомимо після введення ТТН
+    },
+    "arrived": {
+        "perm": can_mark_logistics,
+        "from": ("shipped", "arrived"),
+        "deny": "Прибуло доречно тільки після 'Відправлено'",
+        "details": "Прибуло у відділення",
+        "reply": "📍 Замовлення #{oid}: прибуло у відділення.",
+        "buyer": "📍 Замовлення #{oid}: прибуло у відділення ✅",
+    },
+    "received": {
+        "perm": can_mark_logistics,
+        "from": ("shipped", "arrived", "received"),
+        "deny": "Отримано доречно після shipped/arrived",
+        "details": "Клієнт отримав/забрав",
+        "reply": "✅ Замовлення #{oid}: клієнт ОТРИМАВ.",
+        "buyer": "✅ Замовлення #{oid}: отримано. Дякуємо! 🙌",
+    },
+    "not_picked": {
+        "perm": can_mark_logistics,
+        "from": ("shipped", "arrived", "not_picked"),
+        "deny": "Не забрав доречно після shipped/arrived",
+        "details": "Клієнт не забрав",
+        "reply": "❌ Замовлення #{oid}: НЕ ЗАБРАВ.",
+        "buyer": "❌ Замовлення #{oid}: не забрано. Напишіть нам — допоможемо 🤝",
+    },
+    "returned": {
+        "perm": can_mark_logistics,
+        "from": ("shipped", "arrived", "not_picked", "returned", "received"),
+        "deny": "Повернення ставимо після логістики",
+        "details": "Повернено",
+        "reply": "🔁 Замовлення #{oid}: ПОВЕРНУТО.",
+        "buyer": "🔁 Замовлення #{oid}: повернено. Якщо є питання — пишіть 🙏",
+    },
+    "done": {
+        "perm": can_mark_logistics,
+        "not_from": ("done", "canceled"),
+        "deny": "Вже закрито",
+        "details": "Закрито (done)",
+        "reply": "✅ Замовлення #{oid} закрито.",
+        "buyer": "✅ Замовлення #{oid} завершено 🎉",
+    },
+}
+
+
+async def _order_transition(cb: types.CallbackQuery, bot: Bot, state: FSMContext, action: str, oid: int):
+    """
+    Зміна статусу в одній транзакції: перевірка прав/статусу і запис
+    робляться під блокуванням стану, повідомлення — вже після commit.
+    """
+    tr = ORDER_TRANSITIONS[action]
+    uid = cb.from_user.id
+
+    alert = ""
+    async with shop_tx(ORDER_EDIT) as d:
+        order = None
+        if not is_staff(d, uid):
+            alert = "Немає доступу"
+        else:
+            order = _find_order(d, oid)
+            st = ((order or {}).get("status") or "").strip().lower()
+            if not order:
+                pass
+            elif not tr["perm"](d, uid):
+                alert = "⛔️ Недостатньо прав"
+            elif ("from" in tr and st not in tr["from"]) or st in tr.get("not_from", ()):
+                alert = tr["deny"]
+            else:
+                before = pick_fields(order, ["status", "ttn", "np_ttn"])
+                order_set_status(order, action, who=str(uid), details=tr["details"], d=d)
+                after = pick_fields(order, ["status", "ttn", "np_ttn"])
+                audit_add(d, actor_id=uid, actor_role=_role_of(d, uid),
+                          action=f"order.{action}", entity_type="order", entity_id=oid, entity_name=f"#{oid}",
+                          before=before, after=after)
+
+    if alert:
+        return await cb.answer(alert, show_alert=True)
+    if not order:
+        await cb.message.answer("❌ Замовлення не знайдено.")
         return await cb.answer()
 
-    if action == "done":
-        if not can_mark_logistics(d, cb.from_user.id):
-            return await cb.answer("⛔️ Недостатньо прав", show_alert=True)
-        if st in ("done", "canceled"):
-            return await cb.answer("Вже закрито", show_alert=True)
+    invalidate_order(oid)
+    products = _order_products(d, order)
+    kb = order_actions_kb(oid, str(order.get("status", "")), d=d, uid=uid)
+    await cb.message.answer(
+        tr["reply"].format(oid=oid) + "\n\n" + order_premium_text(d, order, products),
+        parse_mode="HTML", reply_markup=kb,
+    )
 
-        order_set_status(order, "done", who=str(cb.from_user.id), details="Закрито (done)")
-        after = pick_fields(order, ["status", "ttn", "np_ttn"])
-        audit_add(d, actor_id=cb.from_user.id, actor_role=_role_of(d, cb.from_user.id),
-                  action="order.done", entity_type="order", entity_id=oid, entity_name=f"#{oid}",
-                  before=before, after=after)
+    if action == "shipped":
+        await state.clear()
+        await state.set_state(AdminFSM.order_ttn)
+        await state.update_data(oid=oid)
+        await cb.message.answer("📮 Введіть ТТН для цього замовлення (або '-' щоб без ТТН):")
+    elif tr["buyer"]:
+        await _notify_buyer(bot, d, order, tr["buyer"].format(oid=oid))
+    return await cb.answer()
 
-        await save_data(d)
-        await _reply_updated(f"✅ Замовлення #{oid} закрито.")
-        await _notify_buyer(bot, d, order, f"✅ Замовлення #{oid} завершено 🎉")
+
+@router.callback_query(F.data.startswith("adm:order:"))
+async def order_change_status(cb: types.CallbackQuery, bot: Bot, state: FSMContext):
+    _, _, action, oid_str = cb.data.split(":")
+    oid = int(oid_str)
+
+    if action in ORDER_TRANSITIONS:
+        return await _order_transition(cb, bot, state, action, oid)
+
+    # далі — тільки читання
+    d = await load_data(ORDERS, writes=())
+    if not is_staff(d, cb.from_user.id):
+        return await cb.answer("Немає доступу", show_alert=True)
+
+    order = _find_order(d, oid)
+    if not order:
+        await cb.message.answer("❌ Замовлення не знайдено.")
         return await cb.answer()
 
     if action == "set_ttn":
@@ -830,21 +941,8 @@ async def order_change_status(cb: types.CallbackQuery, bot: Bot, state: FSMConte
             await cb.message.answer("❌ У замовлення немає user_id.")
             return await cb.answer()
 
-        user_orders = [o for o in (d.get("orders", []) or []) if int(o.get("user_id", -1)) == uid]
-        if not user_orders:
-            await cb.message.answer("Історія порожня.")
-            return await cb.answer()
-
-        user_link = f'<a href="tg://user?id={uid}">👤 Покупець</a>'
-        await cb.message.answer(user_link + "\n<b>📜 Історія замовлень покупця:</b>", parse_mode="HTML")
-
-        for o in reversed(user_orders):
-            products = _order_products(d, o)
-            await cb.message.answer(
-                order_premium_text(d, o, products),
-                parse_mode="HTML",
-                reply_markup=order_actions_kb(int(o["id"]), str(o.get("status", "")), d=d, uid=cb.from_user.id)
-            )
+        txt, kb = await _orders_list_view("all", uid)
+        await _show_orders_list(cb, txt, kb, edit=False)
         return await cb.answer()
 
     return await cb.answer("Невідома дія", show_alert=True)
@@ -862,31 +960,30 @@ async def admin_set_ttn_msg(m: types.Message, state: FSMContext, bot: Bot):
     raw = (m.text or "").strip()
     ttn = _ttn_norm(raw)
 
-    d = await load_data()
-    order = _find_order(d, oid)
-    if not order:
-        await state.clear()
-        return await m.answer("❌ Замовлення не знайдено.")
-
-    before = pick_fields(order, ["ttn", "np_ttn"])
-    order_set_ttn(order, ttn, who=str(m.from_user.id), details="TTN set from admin panel")
-    after = pick_fields(order, ["ttn", "np_ttn"])
-
-    audit_add(
-        d,
-        actor_id=m.from_user.id,
-        actor_role=_role_of(d, m.from_user.id),
-        action="order.ttn.set",
-        entity_type="order",
-        entity_id=oid,
-        entity_name=f"#{oid}",
-        before=before,
-        after=after,
-        note="TTN updated from admin panel",
-    )
+    async with shop_tx(ORDER_EDIT) as d:
+        order = _find_order(d, oid)
+        if order:
+            before = pick_fields(order, ["ttn", "np_ttn"])
+            order_set_ttn(order, ttn, who=str(m.from_user.id), details="TTN set from admin panel")
+            after = pick_fields(order, ["ttn", "np_ttn"])
+
+            audit_add(
+                d,
+                actor_id=m.from_user.id,
+                actor_role=_role_of(d, m.from_user.id),
+                action="order.ttn.set",
+                entity_type="order",
+                entity_id=oid,
+                entity_name=f"#{oid}",
+                before=before,
+                after=after,
+                note="TTN updated from admin panel",
+            )
 
-    await save_data(d)
     await state.clear()
+    invalidate_order(oid)
+    if not order:
+        return await m.answer("❌ Замовлення не знайдено.")
 
     if not ttn:
         await m.answer("✅ ТТН очищено.")
@@ -900,47 +997,18 @@ async def admin_set_ttn_msg(m: types.Message, state: FSMContext, bot: Bot):
 # =========================================================
 
 def _pids_in_sub(d: dict, cat: str, sub: str) -> list[int]:
-    out: list[int] = []
-
-    cats_map = (d.get("categories", {}) or {})
-    subs_map = (cats_map.get(cat, {}) or {})
-    bucket = subs_map.get(sub)
-
-    if isinstance(bucket, list):
-        for x in bucket:
-            try:
-                out.append(int(x))
-            except Exception:
-                pass
-
-    # fallback: по товару
-    if not out:
-        for p in (d.get("products", []) or []):
-            try:
-                pc = str(p.get("category", "") or "")
-                ps = str(p.get("sub_category", p.get("subcategory", "")) or NO_SUB)
-                if pc == str(cat) and ps == str(sub):
-                    out.append(int(p.get("id")))
-            except Exception:
-                continue
-
-    seen = set()
-    uniq: list[int] = []
-    for pid in out:
-        if pid not in seen:
-            seen.add(pid)
-            uniq.append(pid)
-    return uniq
+    # копія: викликачі можуть її змінювати, а список індексу спільний
+    return list(sub_pids(d, cat, sub, by_product=True))
 
 
-@router.callback_query(F.data.startswith("adm:catmgmt:cat_i:"))
+@router.callback_query(F.data.startswith("adm:catmgmt:cid:"))
 async def cat_mgmt_choose(cb: types.CallbackQuery):
-    d = await load_data()
+    d = await load_data(CATALOG, writes=())
     if not is_staff(d, cb.from_user.id) or not can_edit_catalog(d, cb.from_user.id):
         return await cb.answer("⛔️ Немає доступу", show_alert=True)
 
-    cat_i = int(cb.data.split(":")[3])
-    cat = await _cat_by_index(cat_i)
+    cid = cb.data.split(":")[3]
+    cat = _cat_by_id(d, cid)
     if not cat:
         return await cb.answer("Категорію не знайдено", show_alert=True)
 
@@ -955,15 +1023,17 @@ async def cat_mgmt_choose(cb: types.CallbackQuery):
 
     kb = InlineKeyboardBuilder()
 
-    kb.button(text="🧷 Утлет", callback_data=f"adm:catmgmt:sub_i:{cat_i}:n")
-    for j, s in enumerate(subs_list):
-        kb.button(text=str(s), callback_data=f"adm:catmgmt:sub_i:{cat_i}:{j}")
+    kb.button(text="🧷 Утлет", callback_data=f"adm:catmgmt:sid:{cid}:n")
+    for s in subs_list:
+        tok = _sub_token(d, cat, s)
+        if tok is not None:
+            kb.button(text=str(s), callback_data=f"adm:catmgmt:sid:{cid}:{tok}")
 
     kb.adjust(1)
 
-    kb.button(text="➕ Додати підкатегорію", callback_data=f"adm:sub_add:cat_i:{cat_i}")
-    kb.button(text="📦 Товари в категорії", callback_data=f"adm:plist_cat:cat_i:{cat_i}")
-    kb.button(text="🗑 Видалити категорію", callback_data=f"adm:catdelask:{cat_i}")
+    kb.button(text="➕ Додати підкатегорію", callback_data=f"adm:sub_add:cid:{cid}")
+    kb.button(text="📦 Товари в категорії", callback_data=f"adm:plist_cat:cid:{cid}")
+    kb.button(text="🗑 Видалити категорію", callback_data=f"adm:catdelask:{cid}")
     kb.button(text="⬅️ Назад", callback_data="adm:panel:cats")
     kb.adjust(1)
 
@@ -971,41 +1041,37 @@ async def cat_mgmt_choose(cb: types.CallbackQuery):
     await cb.answer()
 
 
-@router.callback_query(F.data.startswith("adm:catmgmt:sub_i:"))
+@router.callback_query(F.data.startswith("adm:catmgmt:sid:"))
 async def adm_submgmt_open(cb: types.CallbackQuery):
-    d = await load_data()
+    d = await load_data(CATALOG, writes=())
     if not is_staff(d, cb.from_user.id):
         return await cb.answer("Немає доступу", show_alert=True)
 
     parts = cb.data.split(":")
-    cat_i = int(parts[-2])
+    cid = parts[-2]
     sub_token = parts[-1]
 
-    cats = list((d.get("categories", {}) or {}).keys())
-    if cat_i < 0 or cat_i >= len(cats):
+    cat = _cat_by_id(d, cid)
+    if cat is None:
         return await cb.answer("Категорію не знайдено", show_alert=True)
-    cat = cats[cat_i]
 
     if sub_token == "n":
         sub_title = "🧷 Утлет"
         can_delete_sub = False
     else:
-        subs_map = (d.get("categories", {}) or {}).get(cat, {}) or {}
-        subs_list = [s for s in subs_map.keys() if s != NO_SUB]
-        try:
-            j = int(sub_token)
-            sub_title = str(subs_list[j])
-        except Exception:
+        sub = _sub_by_id(d, cid, sub_token)
+        if sub is None:
             return await cb.answer("Підкатегорію не знайдено", show_alert=True)
+        sub_title = str(sub)
         can_delete_sub = True
 
     kb = InlineKeyboardBuilder()
-    kb.button(text="📦 Товари в підкатегорії", callback_data=f"adm:plist_sub:sub_i:{cat_i}:{sub_token}")
+    kb.button(text="📦 Товари в підкатегорії", callback_data=f"adm:plist_sub:sid:{cid}:{sub_token}")
 
     if can_delete_sub:
-        kb.button(text="🗑 Видалити підкатегорію", callback_data=f"adm:subdelask:{cat_i}:{sub_token}")
+        kb.button(text="🗑 Видалити підкатегорію", callback_data=f"adm:subdelask:{cid}:{sub_token}")
 
-    kb.button(text="🗑 Видалити категорію", callback_data=f"adm:catdelask:{cat_i}")
+    kb.button(text="🗑 Видалити категорію", callback_data=f"adm:catdelask:{cid}")
     kb.button(text="⬅️ Назад", callback_data="adm:panel:cats")
     kb.adjust(1)
 
@@ -1023,17 +1089,15 @@ async def adm_submgmt_open(cb: types.CallbackQuery):
 
 @router.callback_query(F.data.startswith("adm:catdelask:"))
 async def cat_delete_ask(cb: types.CallbackQuery):
-    d = await load_data()
+    d = await load_data(CATALOG, writes=())
     if not is_staff(d, cb.from_user.id) or not can_edit_catalog(d, cb.from_user.id):
         return await cb.answer("⛔️ Немає доступу", show_alert=True)
 
-    cat_i = int(cb.data.split(":")[2])
-    cats = list((d.get("categories", {}) or {}).keys())
-
-    if cat_i < 0 or cat_i >= len(cats):
+    cid = cb.data.split(":")[2]
+    cat = _cat_by_id(d, cid)
+    if cat is None:
         return await cb.answer("Категорію не знайдено", show_alert=True)
 
-    cat = cats[cat_i]
     subs = (d.get("categories", {}) or {}).get(cat, {}) or {}
 
     total_pids: list[int] = []
@@ -1048,7 +1112,7 @@ async def cat_delete_ask(cb: types.CallbackQuery):
     total = len(set(total_pids))
 
     kb = InlineKeyboardBuilder()
-    kb.button(text="✅ Так, видалити (товари → 🧷 Утлет)", callback_data=f"adm:catdeldo:{cat_i}")
+    kb.button(text="✅ Так, видалити (товари → 🧷 Утлет)", callback_data=f"adm:catdeldo:{cid}")
     kb.button(text="❌ Ні", callback_data="adm:cancel")
     kb.adjust(1)
 
@@ -1064,17 +1128,15 @@ async def cat_delete_ask(cb: types.CallbackQuery):
 
 @router.callback_query(F.data.startswith("adm:catdeldo:"))
 async def cat_delete_do(cb: types.CallbackQuery):
-    d = await load_data()
+    d = await load_data(CATALOG_EDIT)
     if not is_staff(d, cb.from_user.id) or not can_edit_catalog(d, cb.from_user.id):
         return await cb.answer("⛔️ Немає доступу", show_alert=True)
 
-    cat_i = int(cb.data.split(":")[2])
-    cats = list((d.get("categories", {}) or {}).keys())
-
-    if cat_i < 0 or cat_i >= len(cats):
+    cid = cb.data.split(":")[2]
+    cat = _cat_by_id(d, cid)
+    if cat is None:
         return await cb.answer("Категорію не знайдено", show_alert=True)
 
-    cat = cats[cat_i]
     subs = d.get("categories", {}).get(cat, {}) or {}
 
     # зібрати всі pid
@@ -1141,16 +1203,16 @@ async def cat_delete_do(cb: types.CallbackQuery):
 
 @router.callback_query(F.data.startswith("adm:subdelask:"))
 async def sub_delete_ask(cb: types.CallbackQuery):
-    d = await load_data()
+    d = await load_data(CATALOG, writes=())
     if not is_staff(d, cb.from_user.id) or not can_edit_catalog(d, cb.from_user.id):
         return await cb.answer("⛔️ Немає доступу", show_alert=True)
 
     parts = cb.data.split(":")
-    cat_i = int(parts[2])
+    cid = parts[2]
     sub_token = parts[3]
 
-    cat = await _cat_by_index(cat_i)
-    sub = await _sub_by_index(cat_i, sub_token)
+    cat = _cat_by_id(d, cid)
+    sub = _sub_by_id(d, cid, sub_token)
 
     if not cat or sub is None:
         return await cb.answer("Не знайдено", show_alert=True)
@@ -1164,7 +1226,7 @@ async def sub_delete_ask(cb: types.CallbackQuery):
     kb = InlineKeyboardBuilder()
     if cnt > 0:
         kb.button(text=f"✅ Так, видалити і перенести {cnt} товар(ів) в 🧷 Утлет",
-                  callback_data=f"adm:subdeldo:{cat_i}:{sub_token}:mv")
+                  callback_data=f"adm:subdeldo:{cid}:{sub_token}:mv")
         kb.button(text="❌ Ні", callback_data="adm:cancel")
         kb.adjust(1)
 
@@ -1176,7 +1238,7 @@ async def sub_delete_ask(cb: types.CallbackQuery):
         )
         return await cb.answer()
 
-    kb.button(text="✅ Так, видалити", callback_data=f"adm:subdeldo:{cat_i}:{sub_token}:del")
+    kb.button(text="✅ Так, видалити", callback_data=f"adm:subdeldo:{cid}:{sub_token}:del")
     kb.button(text="❌ Ні", callback_data="adm:cancel")
     kb.adjust(2)
 
@@ -1190,17 +1252,17 @@ async def sub_delete_ask(cb: types.CallbackQuery):
 
 @router.callback_query(F.data.startswith("adm:subdeldo:"))
 async def sub_delete_do(cb: types.CallbackQuery):
-    d = await load_data()
+    d = await load_data(CATALOG_EDIT)
     if not is_staff(d, cb.from_user.id) or not can_edit_catalog(d, cb.from_user.id):
         return await cb.answer("⛔️ Немає доступу", show_alert=True)
 
     parts = cb.data.split(":")
-    cat_i = int(parts[2])
+    cid = parts[2]
     sub_token = parts[3]
     mode = parts[4] if len(parts) > 4 else "del"
 
-    cat = await _cat_by_index(cat_i)
-    sub = await _sub_by_index(cat_i, sub_token)
+    cat = _cat_by_id(d, cid)
+    sub = _sub_by_id(d, cid, sub_token)
 
     if not cat or sub is None:
         return await cb.answer("Не знайдено", show_alert=True)
@@ -1264,57 +1326,106 @@ async def sub_delete_do(cb: types.CallbackQuery):
 # PRODUCTS LIST BY CATEGORY/SUBCATEGORY
 # =========================================================
 
-@router.callback_query(F.data.startswith("adm:plist_cat:cat_i:"))
+@router.callback_query(F.data.startswith("adm:plist_cat:cid:"))
 async def adm_products_choose_cat(cb: types.CallbackQuery):
-    d = await load_data()
+    d = await load_data(CATALOG, writes=())
     if not is_staff(d, cb.from_user.id):
         return await cb.answer("Немає доступу", show_alert=True)
 
-    cat_i = int(cb.data.split(":")[-1])
-    cats = list((d.get("categories", {}) or {}).keys())
-    if cat_i < 0 or cat_i >= len(cats):
+    cid = cb.data.split(":")[-1]
+    cat = _cat_by_id(d, cid)
+    if cat is None:
         return await cb.answer("Категорію не знайдено", show_alert=True)
 
-    cat = cats[cat_i]
     await cb.message.answer(
         f"📦 <b>Товари</b>\nКатегорія: <b>{escape(str(cat))}</b>\n\nОберіть підкатегорію:",
         parse_mode="HTML",
-        reply_markup=await subs_inline(cat_i, "plist_sub", include_no_sub=True),
+        reply_markup=subs_inline(d, cid, "plist_sub", include_no_sub=True),
     )
     return await cb.answer()
 
 
-@router.callback_query(F.data.startswith("adm:plist_sub:sub_i:"))
-async def plist_sub(cb: types.CallbackQuery):
-    d = await load_data()
-    if not is_staff(d, cb.from_user.id):
-        return await cb.answer("Немає доступу", show_alert=True)
+PRODUCTS_PER_PAGE = 10
 
-    parts = cb.data.split(":")
-    cat_i = int(parts[-2])
-    sub_token = parts[-1]
 
-    cat = await _cat_by_index(cat_i)
-    sub = await _sub_by_index(cat_i, sub_token)
+def _plist_view(d: dict, cid: str, sub_token: str, page: int) -> tuple[str, types.InlineKeyboardMarkup | None]:
+    cat = _cat_by_id(d, cid)
+    sub = _sub_by_id(d, cid, sub_token)
     if not cat or sub is None:
-        return await cb.answer("Не знайдено", show_alert=True)
+        return "Каталог оновився — оберіть підкатегорію ще раз.", None
 
-    pids = _pids_in_sub(d, cat, sub)
+    pids = sub_pids(d, cat, sub, by_product=True)
+    sub_title = "🧷 Утлет" if sub == NO_SUB else str(sub)
+    head = f"📦 <b>{escape(str(cat))}</b> / <b>{escape(sub_title)}</b>"
     if not pids:
-        await cb.message.answer("Товарів тут ще немає.")
-        return await cb.answer()
+        return head + "\n\nТоварів тут ще немає.", None
+
+    pages = (len(pids) + PRODUCTS_PER_PAGE - 1) // PRODUCTS_PER_PAGE
+    page = max(0, min(page, pages - 1))
+    chunk = pids[page * PRODUCTS_PER_PAGE:(page + 1) * PRODUCTS_PER_PAGE]
 
-    for pid in pids:
-        p = find_product(d, int(pid))
+    lines = [head, f"<i>Товарів: {len(pids)} · Сторінка: {page + 1}/{pages}</i>", ""]
+    kb = InlineKeyboardBuilder()
+    for pid in chunk:
+        p = find_product(d, pid)
         if not p:
             continue
-        _ensure_product_schema(p)
-        await cb.message.answer(
-            product_card(p),
-            parse_mode="HTML",
-            reply_markup=await product_actions_kb(int(p.get("id", 0) or 0))
+        name = str(p.get("name", "Товар"))
+        lines.append(f"<code>{pid}</code> · {escape(name)} · <b>{money_uah(unit_price(p))}</b>")
+        kb.button(text=f"📂 {name[:24] + '…' if len(name) > 24 else name}", callback_data=f"adm:po:{pid}")
+    kb.adjust(2)
+
+    if pages > 1:
+        kb.row(
+            types.InlineKeyboardButton(text="⬅️", callback_data=f"adm:pl:{cid}:{sub_token}:{page - 1}" if page > 0 else "noop"),
+            types.InlineKeyboardButton(text=f"{page + 1}/{pages}", callback_data="noop"),
+            types.InlineKeyboardButton(text="➡️", callback_data=f"adm:pl:{cid}:{sub_token}:{page + 1}" if page < pages - 1 else "noop"),
         )
+    return "\n".join(lines), kb.as_markup()
+
+
+@router.callback_query(F.data.startswith("adm:plist_sub:sid:"))
+async def plist_sub(cb: types.CallbackQuery):
+    d = await load_data(CATALOG, writes=())
+    if not is_staff(d, cb.from_user.id):
+        return await cb.answer("Немає доступу", show_alert=True)
+
+    parts = cb.data.split(":")
+    txt, kb = _plist_view(d, parts[-2], parts[-1], 0)
+    await cb.message.answer(txt, parse_mode="HTML", reply_markup=kb)
+    await cb.answer()
+
 
+@router.callback_query(F.data.startswith("adm:pl:"))
+async def plist_page(cb: types.CallbackQuery):
+    d = await load_data(CATALOG, writes=())
+    if not is_staff(d, cb.from_user.id):
+        return await cb.answer("Немає доступу", show_alert=True)
+
+    _, _, cid, sub_token, page = cb.data.split(":")
+    txt, kb = _plist_view(d, cid, sub_token, int(page))
+    try:
+        await cb.message.edit_text(txt, parse_mode="HTML", reply_markup=kb)
+    except Exception:
+        await cb.message.answer(txt, parse_mode="HTML", reply_markup=kb)
+    await cb.answer()
+
+
+@router.callback_query(F.data.startswith("adm:po:"))
+async def plist_open(cb: types.CallbackQuery):
+    d = await load_data(CATALOG, writes=())
+    if not is_staff(d, cb.from_user.id):
+        return await cb.answer("Немає доступу", show_alert=True)
+
+    p = find_product(d, int(cb.data.split(":")[2]))
+    if not p:
+        return await cb.answer("Товар не знайдено", show_alert=True)
+
+    await cb.message.answer(
+        product_card(_product_view(p)),
+        parse_mode="HTML",
+        reply_markup=await product_actions_kb(int(p.get("id", 0) or 0))
+    )
     await cb.answer()
 
 
@@ -1324,7 +1435,7 @@ async def plist_sub(cb: types.CallbackQuery):
 
 @router.callback_query(F.data.startswith("adm:hit:"))
 async def hit_toggle(cb: types.CallbackQuery):
-    d = await load_data()
+    d = await load_data(AUDIT)
     if not is_staff(d, cb.from_user.id) or not can_edit_catalog(d, cb.from_user.id):
         return await cb.answer("⛔️ Немає доступу", show_alert=True)
 
@@ -1364,7 +1475,7 @@ async def hit_toggle(cb: types.CallbackQuery):
 
 @router.callback_query(F.data.startswith("adm:delask:"))
 async def product_delete_ask(cb: types.CallbackQuery):
-    d = await load_data()
+    d = await load_data(CATALOG, writes=())
     if not is_staff(d, cb.from_user.id) or not can_edit_catalog(d, cb.from_user.id):
         return await cb.answer("⛔️ Немає доступу", show_alert=True)
 
@@ -1383,7 +1494,7 @@ async def product_delete_ask(cb: types.CallbackQuery):
 
 @router.callback_query(F.data.startswith("adm:del:"))
 async def product_delete_do(cb: types.CallbackQuery):
-    d = await load_data()
+    d = await load_data(CATALOG_EDIT)
     if not is_staff(d, cb.from_user.id) or not can_edit_catalog(d, cb.from_user.id):
         return await cb.answer("⛔️ Немає доступу", show_alert=True)
 
@@ -1424,13 +1535,16 @@ async def product_delete_do(cb: types.CallbackQuery):
     )
 
     await save_data(d)
+    product_search.remove(pid)
+    price_table.remove(pid)
+    invalidate_product(pid)
     await cb.message.answer(f"✅ Товар <code>{pid}</code> видалено.", parse_mode="HTML")
     await cb.answer()
 
 
 @router.callback_query(F.data.startswith("adm:editmenu:"))
 async def product_editmenu(cb: types.CallbackQuery):
-    d = await load_data()
+    d = await load_data(CATALOG, writes=())
     if not is_staff(d, cb.from_user.id) or not can_edit_catalog(d, cb.from_user.id):
         return await cb.answer("⛔️ Немає доступу", show_alert=True)
 
@@ -1439,8 +1553,7 @@ async def product_editmenu(cb: types.CallbackQuery):
     if not p:
         return await cb.answer("Товар не знайдено", show_alert=True)
 
-    _ensure_product_schema(p)
-    await cb.message.answer(product_card(p), parse_mode="HTML", reply_markup=edit_menu_kb(pid))
+    await cb.message.answer(product_card(_product_view(p)), parse_mode="HTML", reply_markup=edit_menu_kb(pid))
     await cb.answer()
 
 
@@ -1457,13 +1570,7 @@ def _ensure_unique_barcode(d: dict, candidate: str) -> str:
     if not cand:
         cand = _gen_barcode_ean13_like()
 
-    used = set()
-    for p in (d.get("products", []) or []):
-        bc = (p.get("barcode") or "").strip()
-        if bc:
-            used.add(bc)
-
-    while cand in used:
+    while find_product_by_barcode(d, cand) is not None:
         cand = _gen_barcode_ean13_like()
     return cand
 
@@ -1473,13 +1580,7 @@ def _normalize_sku(s: str) -> str:
 
 
 def _find_product_by_id(d: dict, pid: int) -> dict | None:
-    for p in (d.get("products", []) or []):
-        try:
-            if int(p.get("id", -1)) == int(pid):
-                return p
-        except Exception:
-            continue
-    return None
+    return find_product(d, pid)
 
 
 # =========================================================
@@ -1488,7 +1589,7 @@ def _find_product_by_id(d: dict, pid: int) -> dict | None:
 
 @router.message(AdminFSM.add_cat)
 async def add_cat_name(m: types.Message, state: FSMContext):
-    d = await load_data()
+    d = await load_data(CATALOG_EDIT)
     if not is_staff(d, m.from_user.id) or not can_edit_catalog(d, m.from_user.id):
         return await m.answer("⛔️ Немає доступу")
 
@@ -1523,32 +1624,31 @@ async def add_cat_name(m: types.Message, state: FSMContext):
 # ADD SUBCATEGORY (FSM)
 # =========================================================
 
-@router.callback_query(F.data.startswith("adm:sub_add:cat_i:"))
+@router.callback_query(F.data.startswith("adm:sub_add:cid:"))
 async def add_sub_choose_cat(cb: types.CallbackQuery, state: FSMContext):
-    d = await load_data()
+    d = await load_data(CATALOG, writes=())
     if not is_staff(d, cb.from_user.id) or not can_edit_catalog(d, cb.from_user.id):
         return await cb.answer("⛔️ Немає доступу", show_alert=True)
 
-    cat_i = int(cb.data.split(":")[3])
-    cat = await _cat_by_index(cat_i)
+    cid = cb.data.split(":")[3]
+    cat = _cat_by_id(d, cid)
     if not cat:
         return await cb.answer("Категорію не знайдено", show_alert=True)
 
     await state.set_state(AdminFSM.add_sub_name)
-    await state.update_data(cat_i=cat_i)
+    await state.update_data(cid=cid)
     await cb.message.answer(f"Введіть назву підкатегорії для <b>{escape(str(cat))}</b>:", parse_mode="HTML")
     await cb.answer()
 
 
 @router.message(AdminFSM.add_sub_name)
 async def add_sub_name(m: types.Message, state: FSMContext):
-    d = await load_data()
+    d = await load_data(CATALOG_EDIT)
     if not is_staff(d, m.from_user.id) or not can_edit_catalog(d, m.from_user.id):
         return await m.answer("⛔️ Немає доступу")
 
     st = await state.get_data()
-    cat_i = int(st.get("cat_i", -1))
-    cat = await _cat_by_index(cat_i)
+    cat = _cat_by_id(d, str(st.get("cid", "")))
     if not cat:
         await state.clear()
         return await m.answer("Категорію не знайдено.")
@@ -1585,40 +1685,40 @@ async def add_sub_name(m: types.Message, state: FSMContext):
 # ADD PRODUCT (FSM)
 # =========================================================
 
-@router.callback_query(F.data.startswith("adm:prod_cat:cat_i:"))
+@router.callback_query(F.data.startswith("adm:prod_cat:cid:"))
 async def prod_choose_cat(cb: types.CallbackQuery, state: FSMContext):
-    d = await load_data()
+    d = await load_data(CATALOG, writes=())
     if not is_staff(d, cb.from_user.id) or not can_edit_catalog(d, cb.from_user.id):
         return await cb.answer("⛔️ Немає доступу", show_alert=True)
 
-    cat_i = int(cb.data.split(":")[3])
-    cat = await _cat_by_index(cat_i)
+    cid = cb.data.split(":")[3]
+    cat = _cat_by_id(d, cid)
     if not cat:
         return await cb.answer("Категорію не знайдено", show_alert=True)
 
     await state.set_state(AdminFSM.prod_sub)
-    await state.update_data(cat_i=cat_i)
+    await state.update_data(cid=cid)
 
     await cb.message.answer(
         f"Оберіть підкатегорію для <b>{escape(str(cat))}</b>:",
         parse_mode="HTML",
-        reply_markup=await subs_inline(cat_i, "prod_sub", include_no_sub=True)
+        reply_markup=subs_inline(d, cid, "prod_sub", include_no_sub=True)
     )
     await cb.answer()
 
 
-@router.callback_query(F.data.startswith("adm:prod_sub:sub_i:"))
+@router.callback_query(F.data.startswith("adm:prod_sub:sid:"))
 async def prod_choose_sub(cb: types.CallbackQuery, state: FSMContext):
-    d = await load_data()
+    d = await load_data(CATALOG, writes=())
     if not is_staff(d, cb.from_user.id) or not can_edit_catalog(d, cb.from_user.id):
         return await cb.answer("⛔️ Немає доступу", show_alert=True)
 
     parts = cb.data.split(":")
-    cat_i = int(parts[3])
-    sub_i = parts[4]
+    cid = parts[3]
+    sub_token = parts[4]
 
-    cat = await _cat_by_index(cat_i)
-    sub = await _sub_by_index(cat_i, sub_i)
+    cat = _cat_by_id(d, cid)
+    sub = _sub_by_id(d, cid, sub_token)
     if not cat or sub is None:
         return await cb.answer("Не знайдено", show_alert=True)
 
@@ -1632,7 +1732,7 @@ async def prod_choose_sub(cb: types.CallbackQuery, state: FSMContext):
 
 @router.message(AdminFSM.prod_name)
 async def prod_set_name(m: types.Message, state: FSMContext):
-    d = await load_data()
+    d = await load_data(())
     if not is_staff(d, m.from_user.id) or not can_edit_catalog(d, m.from_user.id):
         return await m.answer("⛔️ Немає доступу")
 
@@ -1647,7 +1747,7 @@ async def prod_set_name(m: types.Message, state: FSMContext):
 
 @router.message(AdminFSM.prod_sku)
 async def prod_set_sku(m: types.Message, state: FSMContext):
-    d = await load_data()
+    d = await load_data(())
     if not is_staff(d, m.from_user.id) or not can_edit_catalog(d, m.from_user.id):
         return await m.answer("⛔️ Немає доступу")
 
@@ -1661,7 +1761,7 @@ async def prod_set_sku(m: types.Message, state: FSMContext):
 
 @router.message(AdminFSM.prod_price)
 async def prod_set_price(m: types.Message, state: FSMContext):
-    d = await load_data()
+    d = await load_data(())
     if not is_staff(d, m.from_user.id) or not can_edit_catalog(d, m.from_user.id):
         return await m.answer("⛔️ Немає доступу")
 
@@ -1681,7 +1781,7 @@ async def prod_set_price(m: types.Message, state: FSMContext):
 
 @router.message(AdminFSM.prod_desc)
 async def prod_set_desc(m: types.Message, state: FSMContext):
-    d = await load_data()
+    d = await load_data(())
     if not is_staff(d, m.from_user.id) or not can_edit_catalog(d, m.from_user.id):
         return await m.answer("⛔️ Немає доступу")
 
@@ -1695,7 +1795,7 @@ async def prod_set_desc(m: types.Message, state: FSMContext):
 
 @router.message(AdminFSM.prod_photos)
 async def prod_photos_collect(m: types.Message, state: FSMContext):
-    d = await load_data()
+    d = await load_data(CATALOG_EDIT)
     if not is_staff(d, m.from_user.id) or not can_edit_catalog(d, m.from_user.id):
         return await m.answer("⛔️ Немає доступу")
 
@@ -1714,7 +1814,7 @@ async def prod_photos_collect(m: types.Message, state: FSMContext):
         price = int(st.get("price", 0) or 0)
         desc = st.get("desc", "")
 
-        pid = next_product_id(d)
+        pid = await alloc_product_id()
         barcode = _ensure_unique_barcode(d, "")
 
         p = {
@@ -1753,6 +1853,9 @@ async def prod_photos_collect(m: types.Message, state: FSMContext):
         )
 
         await save_data(d)
+        product_search.update(p)
+        price_table.update(p)
+        invalidate_product(p.get("id"))
         await state.clear()
 
         sub_name = "🧷 Утлет" if sub == NO_SUB else sub
@@ -1778,7 +1881,7 @@ async def prod_photos_collect(m: types.Message, state: FSMContext):
         price = int(st.get("price", 0) or 0)
         desc = st.get("desc", "")
 
-        pid = next_product_id(d)
+        pid = await alloc_product_id()
         barcode = _ensure_unique_barcode(d, "")
 
         p = {
@@ -1818,6 +1921,9 @@ async def prod_photos_collect(m: types.Message, state: FSMContext):
         )
 
         await save_data(d)
+        product_search.update(p)
+        price_table.update(p)
+        invalidate_product(p.get("id"))
         await state.clear()
 
         await m.answer("✅ Товар створено (без фото).", reply_markup=panel_main_kb(m.from_user.id))
@@ -1899,13 +2005,123 @@ def picklist_order_text(d: dict, o: dict) -> str:
 
     return "\n".join(lines).strip()
 
+
+
+# ---------- хвиля (wave picking): усі відкриті замовлення одним списком ----------
+
+WAVE_REFS_PER_LINE = 12  # скільки "#oid×qty" в одному рядку (щоб рядок не ріс безмежно)
+
+
+def picklist_wave(d: dict, orders: list[dict]) -> list[dict]:
+    """
+    Один прохід по items замовлень: позиція (SKU, або pid/назва без SKU) ->
+    сумарна кількість і в які замовлення скільки.
+    """
+    agg: Dict[tuple, dict] = {}
+    for o in orders:
+        oid = int(o.get("id", 0) or 0)
+        for it in (o.get("items") or []):
+            if not isinstance(it, dict):
+                continue
+            sku, pname, qty = _item_sku_name_qty(d, it)
+            if qty <= 0:
+                continue
+            key = ("sku", sku) if sku else ("pid", it.get("pid"), pname)
+            row = agg.get(key)
+            if row is None:
+                p = find_product(d, it.get("pid"))
+                row = agg[key] = {
+                    "sku": sku,
+                    "name": pname,
+                    "category": str((p or {}).get("category") or ""),
+                    "sub": str((p or {}).get("sub_category") or ""),
+                    "qty": 0,
+                    "orders": {},
+                }
+            row["qty"] += qty
+            row["orders"][oid] = row["orders"].get(oid, 0) + qty
+    return list(agg.values())
+
+
+def picklist_wave_messages(d: dict, orders: list[dict], sort: str = "sku") -> list[str]:
+    rows = picklist_wave(d, orders)
+    by_cat = sort == "cat"
+    if by_cat:
+        rows.sort(key=lambda r: (r["category"].casefold(), r["sub"].casefold(), r["sku"].casefold(), r["name"].casefold()))
+    else:
+        rows.sort(key=lambda r: (not r["sku"], r["sku"].casefold(), r["name"].casefold()))
+
+    total = sum(r["qty"] for r in rows)
+    lines = [
+        f"🌊 <b>ХВИЛЯ · {len(orders)} замовл. · {len(rows)} позицій · {total} шт</b>",
+        "<i>" + ("по категоріях" if by_cat else "по SKU") + "</i>",
+    ]
+    group = None
+    for r in rows:
+        if by_cat:
+            g = (r["category"], r["sub"])
+            if g != group:
+                group = g
+                sub = "" if not r["sub"] or r["sub"] == NO_SUB else f" / {escape(r['sub'])}"
+                lines.append("")
+                lines.append(f"🗂 <b>{escape(r['category'] or '—')}</b>{sub}")
+        sku_txt = escape(r["sku"]) if r["sku"] else "—"
+        lines.append(f"• <code>{sku_txt}</code> — <b>{r['qty']}</b> шт — {escape(r['name'] or 'Товар')}")
+        refs = [f"#{oid}×{q}" if q > 1 else f"#{oid}" for oid, q in r["orders"].items()]
+        for i in range(0, len(refs), WAVE_REFS_PER_LINE):
+            lines.append("   ↳ " + ", ".join(refs[i:i + WAVE_REFS_PER_LINE]))
+
+    return split_message(lines)
+
+
+def picklist_wave_kb(sort: str) -> types.InlineKeyboardMarkup:
+    kb = InlineKeyboardBuilder()
+    if sort == "cat":
+        kb.button(text="🔤 По SKU", callback_data="adm:wave:sku")
+    else:
+        kb.button(text="🗂 По категоріях", callback_data="adm:wave:cat")
+    kb.button(text="📄 Накладні по замовленнях", callback_data="adm:wave:orders")
+    kb.adjust(1)
+    return kb.as_markup()
+
+
+async def _send_wave(m: types.Message, d: dict, sort: str) -> None:
+    new_orders = orders_by_status(d, QUEUE_PICKLIST, newest_first=True)
+    if not new_orders:
+        await m.answer("✅ Немає нових замовлень для складу.")
+        return
+
+    parts = picklist_wave_messages(d, new_orders, sort)
+    for n, txt in enumerate(parts):
+        last = n == len(parts) - 1
+        await m.answer(txt, parse_mode="HTML", reply_markup=picklist_wave_kb(sort) if last else None)
+
+
+@router.callback_query(F.data.startswith("adm:wave:"))
+async def picklist_wave_cb(cb: types.CallbackQuery):
+    d = await load_data(ORDERS, writes=())
+    if not can_manage_orders(d, cb.from_user.id):
+        return await cb.answer("⛔️ Недостатньо прав", show_alert=True)
+
+    mode = cb.data.split(":")[2]
+    if mode == "orders":
+        new_orders = orders_by_status(d, QUEUE_PICKLIST, newest_first=True)
+        if not new_orders:
+            await cb.message.answer("✅ Немає нових замовлень для складу.")
+        for o in new_orders:
+            await cb.message.answer(picklist_order_text(d, o), parse_mode="HTML")
+        return await cb.answer()
+
+    await _send_wave(cb.message, d, "cat" if mode == "cat" else "sku")
+    return await cb.answer()
+
 # =========================================================
 # EDIT PRODUCT (FSM)
 # =========================================================
 
 @router.callback_query(F.data.startswith("adm:edit:"))
 async def edit_product_router(cb: types.CallbackQuery, state: FSMContext):
-    d = await load_data()
+    d = await load_data(CATALOG_EDIT)
     if not is_staff(d, cb.from_user.id) or not can_edit_catalog(d, cb.from_user.id):
         return await cb.answer("⛔️ Немає доступу", show_alert=True)
 
@@ -1962,6 +2178,8 @@ async def edit_product_router(cb: types.CallbackQuery, state: FSMContext):
         )
 
         await save_data(d)
+        price_table.update(p)
+        invalidate_product(p.get("id"))
         await cb.message.answer("✅ Акцію прибрано.")
         await cb.message.answer(product_card(p), parse_mode="HTML", reply_markup=edit_menu_kb(pid))
         return await cb.answer()
@@ -1983,7 +2201,7 @@ async def edit_product_router(cb: types.CallbackQuery, state: FSMContext):
 
 @router.message(EditProductFSM.name)
 async def edit_name_or_meta(m: types.Message, state: FSMContext):
-    d = await load_data()
+    d = await load_data(CATALOG_EDIT)
     st = await state.get_data()
     pid = int(st.get("pid", 0) or 0)
 
@@ -2008,6 +2226,8 @@ async def edit_name_or_meta(m: types.Message, state: FSMContext):
                   action="product.edit.sku", entity_type="product", entity_id=pid, entity_name=p.get("name",""),
                   before=before, after=after)
         await save_data(d)
+        product_search.update(p)
+        invalidate_product(p.get("id"))
         await state.clear()
         await m.answer("✅ SKU оновлено.")
         return await m.answer(product_card(p), parse_mode="HTML", reply_markup=edit_menu_kb(pid))
@@ -2035,6 +2255,8 @@ async def edit_name_or_meta(m: types.Message, state: FSMContext):
               action="product.edit.name", entity_type="product", entity_id=pid, entity_name=p.get("name",""),
               before=before, after=after)
     await save_data(d)
+    product_search.update(p)
+    invalidate_product(p.get("id"))
     await state.clear()
     await m.answer("✅ Назву оновлено.")
     await m.answer(product_card(p), parse_mode="HTML", reply_markup=edit_menu_kb(pid))
@@ -2042,7 +2264,7 @@ async def edit_name_or_meta(m: types.Message, state: FSMContext):
 
 @router.message(EditProductFSM.price)
 async def edit_price(m: types.Message, state: FSMContext):
-    d = await load_data()
+    d = await load_data(CATALOG_EDIT)
     st = await state.get_data()
     pid = int(st.get("pid", 0) or 0)
 
@@ -2066,6 +2288,7 @@ async def edit_price(m: types.Message, state: FSMContext):
 
     _ensure_product_schema(p)
     before = pick_fields(p, ["price","base_price","promo_price","promo_until_ts"])
+    old_unit = unit_price(p)
 
     p["base_price"] = price
     if int(p.get("promo_price", 0) or 0) <= 0:
@@ -2077,6 +2300,9 @@ async def edit_price(m: types.Message, state: FSMContext):
               before=before, after=after)
 
     await save_data(d)
+    price_table.update(p)
+    invalidate_product(p.get("id"))
+    price_watch.price_changed(m.bot, pid, old_unit, unit_price(p))
     await state.clear()
     await m.answer("✅ Ціну оновлено.")
     await m.answer(product_card(p), parse_mode="HTML", reply_markup=edit_menu_kb(pid))
@@ -2084,7 +2310,7 @@ async def edit_price(m: types.Message, state: FSMContext):
 
 @router.message(EditProductFSM.desc)
 async def edit_desc(m: types.Message, state: FSMContext):
-    d = await load_data()
+    d = await load_data(CATALOG_EDIT)
     st = await state.get_data()
     pid = int(st.get("pid", 0) or 0)
 
@@ -2114,6 +2340,8 @@ async def edit_desc(m: types.Message, state: FSMContext):
     )
 
     await save_data(d)
+    product_search.update(p)
+    invalidate_product(p.get("id"))
     await state.clear()
     await m.answer("✅ Опис оновлено.")
     await m.answer(product_card(p), parse_mode="HTML", reply_markup=edit_menu_kb(pid))
@@ -2121,7 +2349,7 @@ async def edit_desc(m: types.Message, state: FSMContext):
 
 @router.message(EditProductFSM.promo_price)
 async def edit_promo_price(m: types.Message, state: FSMContext):
-    d = await load_data()
+    d = await load_data(CATALOG_EDIT)
     st = await state.get_data()
     pid = int(st.get("pid", 0) or 0)
 
@@ -2154,20 +2382,21 @@ async def edit_promo_price(m: types.Message, state: FSMContext):
                   before=before, after=after)
 
         await save_data(d)
+        price_table.update(p)
+        invalidate_product(p.get("id"))
         await state.clear()
         await m.answer("✅ Акцію прибрано.")
         return await m.answer(product_card(p), parse_mode="HTML", reply_markup=edit_menu_kb(pid))
 
-    p["promo_price"] = promo
-    p["price"] = promo
+    # збережеться разом із датою (edit_promo_until)
     await state.set_state(EditProductFSM.promo_until)
-    await state.update_data(pid=pid)
+    await state.update_data(pid=pid, promo=promo)
     await m.answer("Введіть дату до якої діє акція <code>YYYY-MM-DD</code> або <code>-</code> (без дати):", parse_mode="HTML")
 
 
 @router.message(EditProductFSM.promo_until)
 async def edit_promo_until(m: types.Message, state: FSMContext):
-    d = await load_data()
+    d = await load_data(CATALOG_EDIT)
     st = await state.get_data()
     pid = int(st.get("pid", 0) or 0)
 
@@ -2184,6 +2413,12 @@ async def edit_promo_until(m: types.Message, state: FSMContext):
     txt = (m.text or "").strip()
 
     before = pick_fields(p, ["promo_price","promo_until_ts","price","base_price"])
+    old_unit = unit_price(p)
+
+    promo = int(st.get("promo", 0) or 0)
+    if promo > 0:
+        p["promo_price"] = promo
+        p["price"] = promo
 
     if txt == "-":
         p["promo_until_ts"] = None
@@ -2193,6 +2428,9 @@ async def edit_promo_until(m: types.Message, state: FSMContext):
                   before=before, after=after, note="no_end_date")
 
         await save_data(d)
+        price_table.update(p)
+        invalidate_product(p.get("id"))
+        price_watch.price_changed(m.bot, pid, old_unit, unit_price(p))
         await state.clear()
         await m.answer("✅ Акцію встановлено (без дати завершення).")
         return await m.answer(product_card(p), parse_mode="HTML", reply_markup=edit_menu_kb(pid))
@@ -2209,6 +2447,9 @@ async def edit_promo_until(m: types.Message, state: FSMContext):
               before=before, after=after)
 
     await save_data(d)
+    price_table.update(p)
+    invalidate_product(p.get("id"))
+    price_watch.price_changed(m.bot, pid, old_unit, unit_price(p))
     await state.clear()
     await m.answer("✅ Дату завершення акції збережено.")
     await m.answer(product_card(p), parse_mode="HTML", reply_markup=edit_menu_kb(pid))
@@ -2220,7 +2461,7 @@ async def edit_promo_until(m: types.Message, state: FSMContext):
 
 @router.message(AdminFSM.add_manager)
 async def add_manager(m: types.Message, state: FSMContext):
-    d = await load_data()
+    d = await load_data(AUDIT)
     if not is_staff(d, m.from_user.id) or not can_manage_staff(d, m.from_user.id):
         await state.clear()
         return await m.answer("⛔️ Тільки адмін")
@@ -2273,7 +2514,7 @@ async def add_manager(m: types.Message, state: FSMContext):
 
 @router.callback_query(F.data.startswith("adm:role:set:"))
 async def set_role(cb: types.CallbackQuery):
-    d = await load_data()
+    d = await load_data(AUDIT)
     if not is_staff(d, cb.from_user.id) or not can_manage_staff(d, cb.from_user.id):
         return await cb.answer("⛔️ Тільки адмін", show_alert=True)
 
@@ -2299,7 +2540,7 @@ async def set_role(cb: types.CallbackQuery):
 
 @router.callback_query(F.data == "adm:roles:list")
 async def roles_list(cb: types.CallbackQuery):
-    d = await load_data()
+    d = await load_data(())
     if not is_staff(d, cb.from_user.id) or not can_manage_staff(d, cb.from_user.id):
         return await cb.answer("⛔️ Тільки адмін", show_alert=True)
 
@@ -2336,42 +2577,12 @@ async def roles_list(cb: types.CallbackQuery):
 # BUYER SEARCH (beautiful карточка + останні замовлення)
 # =========================================================
 
-def _norm_username(s: str) -> str:
-    s = (s or "").strip()
-    if s.startswith("@"):
-        s = s[1:]
-    return s.lower()
-
-
-def _norm_text(s: str) -> str:
-    return re.sub(r"\s+", " ", (s or "").strip()).lower()
-
-
 def _pick_phone_from_order(o: dict) -> str:
-    for k in ("phone", "user_phone", "tel", "telephone", "contact_phone", "buyer_phone"):
-        v = (o.get(k) or "").strip()
-        if v:
-            return v
-    ship = o.get("shipping") or o.get("delivery") or {}
-    if isinstance(ship, dict):
-        for k in ("phone", "tel"):
-            v = (ship.get(k) or "").strip()
-            if v:
-                return v
-    return ""
+    return order_phone(o)
 
 
 def _last_orders_of_user(d: dict, uid: int) -> list[dict]:
-    orders = d.get("orders", []) or []
-    arr = []
-    for o in orders:
-        try:
-            if int(o.get("user_id", -1)) == int(uid):
-                arr.append(o)
-        except Exception:
-            pass
-    arr.sort(key=lambda x: int(x.get("created_ts", 0) or 0), reverse=True)
-    return arr
+    return orders_of_user(d, uid)
 
 
 def buyer_card_text(uid: int, u: dict, last_order: dict | None, total_orders: int) -> str:
@@ -2401,124 +2612,36 @@ def buyer_open_kb(uid: int) -> types.InlineKeyboardMarkup:
 
 @router.message(AdminFSM.search_buyer)
 async def search_buyer_input(m: types.Message, state: FSMContext):
-    d = await load_data()
-
     q_raw = (m.text or "").strip()
-    q = _norm_text(q_raw)
-    q_user = _norm_username(q_raw)
 
-    uid_as_int = None
-    if q_raw.isdigit():
-        try:
-            uid_as_int = int(q_raw)
-        except Exception:
-            uid_as_int = None
-
-    users = d.get("users", {}) or {}
-    orders = d.get("orders", []) or []
-
-    found: dict[int, dict] = {}
-
-    # 1) users
-    for uid_str, u in users.items():
-        if not isinstance(u, dict):
-            continue
-        try:
-            uid_i = int(u.get("id") or uid_str)
-        except Exception:
-            continue
-
-        username = (u.get("username") or "")
-        full_name = (u.get("full_name") or "")
-        username_n = _norm_username(username)
-        full_name_n = _norm_text(full_name)
-
-        ok = False
-        if uid_as_int is not None and uid_i == uid_as_int:
-            ok = True
-        elif q_user and username_n and q_user == username_n:
-            ok = True
-        elif q and (q in full_name_n or q in username_n):
-            ok = True
-
-        if ok:
-            found[uid_i] = {
-                "id": uid_i,
-                "username": username,
-                "full_name": full_name,
-                "first_seen_ts": int(u.get("first_seen_ts", 0) or 0),
-                "last_seen_ts": int(u.get("last_seen_ts", 0) or 0),
-            }
-
-    # 2) fallback orders
-    for o in orders:
-        if not isinstance(o, dict):
-            continue
-        try:
-            uid_i = int(o.get("user_id", -1))
-        except Exception:
-            continue
-        if uid_i <= 0:
-            continue
-
-        username = o.get("user_username") or o.get("username") or o.get("from_username") or ""
-        full_name = o.get("user_full_name") or o.get("full_name") or o.get("name") or ""
-
-        username_n = _norm_username(username)
-        full_name_n = _norm_text(full_name)
-
-        ok = False
-        if uid_as_int is not None and uid_i == uid_as_int:
-            ok = True
-        elif q_user and username_n and q_user == username_n:
-            ok = True
-        elif q and (q in full_name_n or q in username_n):
-            ok = True
-
-        if ok and uid_i not in found:
-            found[uid_i] = {
-                "id": uid_i,
-                "username": username,
-                "full_name": full_name,
-                "first_seen_ts": 0,
-                "last_seen_ts": int(o.get("created_ts", 0) or 0),
-            }
-
-    def orders_count(uid: int) -> int:
-        c = 0
-        for o in orders:
-            try:
-                if int(o.get("user_id", -1)) == int(uid):
-                    c += 1
-            except Exception:
-                pass
-        return c
-
-    found_users = list(found.values())
+    # індекс доповнюється тільки новими users/orders з моменту минулого пошуку
+    await buyer_index.refresh()
+    # вже відсортовано: точний ID > телефон > username > імʼя > підрядок,
+    # при рівності — хто заходив пізніше
+    found_users = buyer_index.search(q_raw, limit=10)
 
     if not found_users:
         await m.answer(
             "❌ Нічого не знайшов.\n\n"
-            f"У базі зараз:\n"
-            f"• users: <b>{len(users)}</b>\n"
-            f"• orders: <b>{len(orders)}</b>\n\n"
+            f"У індексі зараз покупців: <b>{len(buyer_index.docs)}</b>\n\n"
             "Спробуй ввести:\n"
             "• ID (число)\n"
-            "• @username\n"
-            "• частину імені\n\n"
-            "Якщо users = 0 — зайди в бота як юзер і натисни /start.",
+            "• @username або його початок\n"
+            "• частину імені\n"
+            "• телефон (повністю або частину)\n\n"
+            "Якщо покупців 0 — зайди в бота як юзер і натисни /start.",
             parse_mode="HTML",
         )
         await state.clear()
         return
 
-    found_users.sort(key=lambda x: int(x.get("last_seen_ts", 0) or 0), reverse=True)
 
     # якщо 1 збіг — повна карточка + останнє замовлення
     if len(found_users) == 1:
         u = found_users[0]
         uid = int(u["id"])
 
+        d = await load_data(ORDERS, writes=())
         arr = _last_orders_of_user(d, uid)
         last_order = arr[0] if arr else None
         total = len(arr)
@@ -2551,7 +2674,7 @@ async def search_buyer_input(m: types.Message, state: FSMContext):
         uid = int(u["id"])
         uname = u.get("username") or ""
         name = u.get("full_name") or "—"
-        cnt = orders_count(uid)
+        cnt = int(u.get("orders", 0) or 0)
 
         user_link = f'<a href="tg://user?id={uid}">{escape(name)}</a>'
         uname_txt = f"@{escape(uname)}" if uname else "—"
@@ -2566,7 +2689,7 @@ async def search_buyer_input(m: types.Message, state: FSMContext):
 
 @router.callback_query(F.data.startswith("adm:buyer:orders:"))
 async def buyer_orders_cb(cb: types.CallbackQuery):
-    d = await load_data()
+    d = await load_data(ORDERS, writes=())
     if not is_staff(d, cb.from_user.id) or not can_manage_orders(d, cb.from_user.id):
         return await cb.answer("⛔️ Немає доступу", show_alert=True)
 
@@ -2593,7 +2716,7 @@ async def buyer_orders_cb(cb: types.CallbackQuery):
 
 @router.message(Command("reset_shop"))
 async def admin_reset_shop(m: types.Message):
-    d = await load_data()
+    d = await load_data(())
     if not is_admin(m.from_user.id):
         return await m.answer("⛔️ Тільки адмін")
 
@@ -2604,8 +2727,12 @@ async def admin_reset_shop(m: types.Message):
     nd = default_data()
     nd["roles"] = keep_roles
     nd["managers"] = keep_managers
+    # лічильник id категорій не скидаємо: старі кнопки не мають влучити в нові категорії
+    nd["catalog_ids"] = {"seq": int((d.get("catalog_ids") or {}).get("seq", 0) or 0)}
 
     await save_data(nd)
+    buyer_index.reset()
+    render_cache.clear()
 
     await m.answer(
         "✅ Базу магазину очищено.\n\n"
@@ -2614,4 +2741,13 @@ async def admin_reset_shop(m: types.Message):
         f"• managers: {len(keep_managers)}\n\n"
         "Каталог/кошики/замовлення/обране — скинуто.",
         parse_mode="HTML"
-    )
\ No newline at end of file
+    )
+
+
+@router.message(Command("stats"))
+async def admin_stats(m: types.Message):
+    if not is_admin(m.from_user.id):
+        return await m.answer("⛔️ Тільки адмін")
+
+    # лічильники процесу: конфлікти/повтори CAS, збереження і т.д.
+    await m.answer(metrics.render_text(), parse_mode="HTML")
\ No newline at end of file
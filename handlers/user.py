@@ -2,7 +2,8 @@
 import time
 import re
 import math
-from typing import Tuple, List, Dict, Optional
+from html import escape
+from typing import Any, Tuple, List, Dict, Optional
 
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InputMediaPhoto
 from aiogram import Router, F, types, Bot
@@ -11,11 +12,17 @@ from aiogram.fsm.context import FSMContext
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
 
-from data import load_data, save_data, find_product, cart_total, next_order_id
-from states import OrderFSM
+from data import load_data, save_data, update_data_coalesced, flush_writes, shop_tx, find_product, cart_total, alloc_order_id
+from data import CATALOG, STOREFRONT, ORDERS, CHECKOUT, USERS
+from data import add_order, find_order_by_id, orders_of_user, order_status_changed
+from states import OrderFSM, SearchFSM
 from utils import notify_staff, format_order_text
 from text import product_card
 from config import PREPAY_AMOUNT
+from productsearch import product_search
+from catalogids import cat_id, sub_id, cat_by_id, sub_by_id
+from catalogindex import sub_pids, sub_count
+import promos
 
 router = Router()
 
@@ -23,6 +30,7 @@ NO_SUB = "_"
 CART_PER_PAGE = 6
 FAVS_PER_PAGE = 6
 HISTORY_PER_PAGE = 8
+SEARCH_PER_PAGE = 6
 
 
 # ===================== USERS (TRACK) =====================
@@ -83,6 +91,17 @@ def _ensure_events(o: dict) -> None:
         })
 
 
+def _events_view(o: dict) -> List[dict]:
+    """Як _ensure_events, але тільки читання (o може бути спільним станом з кешу)."""
+    evs = o.get("events") or []
+    if evs:
+        return evs
+    created_ts = int(o.get("created_ts", 0) or 0)
+    if not created_ts:
+        return []
+    return [{"ts": created_ts, "code": "created", "title": "Замовлення створено", "details": ""}]
+
+
 def _fmt_dt(ts: int) -> str:
     try:
         t = time.localtime(int(ts))
@@ -92,8 +111,7 @@ def _fmt_dt(ts: int) -> str:
 
 
 def _timeline_text(o: dict) -> str:
-    _ensure_events(o)
-    evs = o.get("events", []) or []
+    evs = _events_view(o)
     if not evs:
         return "🕘 <b>Історія подій</b>\n\nПодій поки що немає."
 
@@ -217,39 +235,64 @@ def is_valid_phone(text: str) -> bool:
 
 # ===================== MENUS =====================
 
+MAIN_MENU_ROWS = [
+    ["🛍 Каталог", "🧺 Кошик"],
+    ["🔥 Хіти/Акції", "⭐ Обране"],
+    ["📦 Історія замовлень", "🆘 Підтримка"],
+    ["🔎 Пошук"],
+]
+MAIN_MENU_TEXTS = {t for row in MAIN_MENU_ROWS for t in row}
+
+
 def main_menu() -> types.ReplyKeyboardMarkup:
     return types.ReplyKeyboardMarkup(
-        keyboard=[
-            [types.KeyboardButton(text="🛍 Каталог"), types.KeyboardButton(text="🧺 Кошик")],
-            [types.KeyboardButton(text="🔥 Хіти/Акції"), types.KeyboardButton(text="⭐ Обране")],
-            [types.KeyboardButton(text="📦 Історія замовлень"), types.KeyboardButton(text="🆘 Підтримка")],
-        ],
+        keyboard=[[types.KeyboardButton(text=t) for t in row] for row in MAIN_MENU_ROWS],
         resize_keyboard=True
     )
 
 
-def catalog_kb(cats):
+def catalog_kb(d: dict):
     kb = InlineKeyboardBuilder()
-    for c in cats:
-        kb.button(text=str(c), callback_data=f"cat:{c}")
+    for c in (d.get("categories") or {}).keys():
+        cid = cat_id(d, c)
+        if cid is None:
+            continue
+        kb.button(text=str(c), callback_data=f"cat:{cid}")
     kb.adjust(1)
     return kb.as_markup()
 
 
-def subcat_kb(cat: str, subs):
+def subcat_kb(d: dict, cat: str):
+    cid = cat_id(d, cat)
     kb = InlineKeyboardBuilder()
     kb.button(text="⬅️ Назад", callback_data="catalog:back")
-    kb.button(text="Утлет 🧷", callback_data=f"sub:{cat}:{NO_SUB}")
+    kb.button(text=f"Утлет 🧷 ({sub_count(d, cat, NO_SUB)})", callback_data=f"sub:{cid}:n")
 
-    for s in subs:
+    for s in ((d.get("categories") or {}).get(cat) or {}).keys():
         if s == NO_SUB:
             continue
-        kb.button(text=str(s), callback_data=f"sub:{cat}:{s}")
+        sid = sub_id(d, cat, s)
+        if sid is None:
+            continue
+        kb.button(text=f"{s} ({sub_count(d, cat, s)})", callback_data=f"sub:{cid}:{sid}")
 
     kb.adjust(1)
     return kb.as_markup()
 
 
+def _resolve_cat(d: dict, cid: str) -> Optional[str]:
+    return cat_by_id(d, cid)
+
+
+def _resolve_sub(d: dict, cid: str, sub_token: str) -> Optional[str]:
+    # "n" = Утлет (NO_SUB), інакше — id підкатегорії
+    if cat_by_id(d, cid) is None:
+        return None
+    if sub_token == "n":
+        return NO_SUB
+    return sub_by_id(d, cid, sub_token)
+
+
 def product_kb(pid: int, fav: bool = False):
     kb = InlineKeyboardBuilder()
     kb.button(text="🛒 В кошик", callback_data=f"add:{pid}")
@@ -272,13 +315,28 @@ def payment_choice_kb(oid: int, total: float):
 # ===================== FAVS =====================
 
 def user_favs(d, uid: int):
+    # для змін (_fav_set); у переглядах — _fav_ids
     d.setdefault("favorites", {})
     return d["favorites"].setdefault(str(uid), [])
 
 
+def _fav_ids(d, uid: int) -> List[int]:
+    # тільки читання: d може бути спільним станом з кешу
+    return [int(x) for x in ((d.get("favorites") or {}).get(str(uid)) or [])]
+
+
 def is_fav(d, uid: int, pid: int) -> bool:
-    favs = set(int(x) for x in user_favs(d, uid))
-    return pid in favs
+    return pid in set(_fav_ids(d, uid))
+
+
+def _fav_set(d, uid: int, pid: int, on: bool):
+    sset = set(int(x) for x in user_favs(d, uid))
+    if on:
+        sset.add(pid)
+    else:
+        sset.discard(pid)
+    d["favorites"][str(uid)] = list(sset)
+    return d
 
 
 # ===================== SAFE DELETE =====================
@@ -304,10 +362,7 @@ async def send_product(message: types.Message, d, uid: int, p: dict):
 
 
 def find_order(d, oid: int):
-    for o in d.get("orders", []):
-        if int(o.get("id", -1)) == int(oid):
-            return o
-    return None
+    return find_order_by_id(d, oid)
 
 
 # ===================== STATUS (UA + EMOJI) =====================
@@ -391,7 +446,7 @@ def ua_status_for_order(o: dict) -> str:
 async def start(m: types.Message, state: FSMContext):
     await state.clear()
 
-    d = await load_data()
+    d = await load_data(USERS)
     upsert_user(d, m.from_user)
     await save_data(d)
 
@@ -408,16 +463,18 @@ async def user_cancel(m: types.Message, state: FSMContext):
 
 @router.message(F.text == "🛍 Каталог")
 async def catalog(m: types.Message):
-    d = await load_data()
+    d = await load_data(CATALOG, writes=())
     if not d.get("categories"):
         return await m.answer("Каталог порожній")
-    await m.answer("Оберіть категорію:", reply_markup=catalog_kb(d["categories"].keys()))
+    await m.answer("Оберіть категорію:", reply_markup=catalog_kb(d))
 
 
 @router.callback_query(F.data.startswith("cat:"))
 async def choose_cat(cb: types.CallbackQuery):
-    d = await load_data()
-    cat = cb.data.split(":", 1)[1]
+    d = await load_data(CATALOG, writes=())
+    cat = _resolve_cat(d, cb.data.split(":", 1)[1])
+    if cat is None:
+        return await cb.answer("Каталог оновився — відкрийте 🛍 Каталог ще раз", show_alert=True)
     subs = d.get("categories", {}).get(cat, {}) or {}
     if not subs:
         await cb.message.answer("У цій категорії поки немає товарів.")
@@ -426,12 +483,12 @@ async def choose_cat(cb: types.CallbackQuery):
     await cb.message.answer(
         f"<b>{cat}</b>\nОберіть підкатегорію:",
         parse_mode="HTML",
-        reply_markup=subcat_kb(cat, subs.keys())
+        reply_markup=subcat_kb(d, cat)
     )
     await cb.answer()
 
 
-def product_page_kb(cat: str, sub: str, i: int, total: int, pid: int, fav: bool):
+def product_page_kb(cid: str, sub_token: str, i: int, total: int, pid: int, fav: bool):
     kb = InlineKeyboardBuilder()
 
     kb.button(text="🛒 В кошик", callback_data=f"add:{pid}")
@@ -440,42 +497,29 @@ def product_page_kb(cat: str, sub: str, i: int, total: int, pid: int, fav: bool)
         callback_data=f"fav:{'off' if fav else 'on'}:{pid}"
     )
 
-    prev_cb = "noop" if i <= 0 else f"page:{cat}:{sub}:{i-1}"
-    next_cb = "noop" if i >= total - 1 else f"page:{cat}:{sub}:{i+1}"
+    prev_cb = "noop" if i <= 0 else f"page:{cid}:{sub_token}:{i-1}"
+    next_cb = "noop" if i >= total - 1 else f"page:{cid}:{sub_token}:{i+1}"
 
     kb.button(text="⬅️", callback_data=prev_cb)
     kb.button(text=f"{i+1}/{total}", callback_data="noop")
     kb.button(text="➡️", callback_data=next_cb)
 
-    kb.button(text="⬅️ Назад", callback_data=f"sub_back:{cat}")
+    kb.button(text="⬅️ Назад", callback_data=f"sub_back:{cid}")
 
     kb.adjust(2, 3, 1)
     return kb.as_markup()
 
 
-async def show_product_page(cb: types.CallbackQuery, cat: str, sub: str, i: int):
-    d = await load_data()
+async def show_product_page(cb: types.CallbackQuery, cid: str, sub_token: str, i: int):
+    d = await load_data(STOREFRONT, writes=())
 
-    raw_items = d.get("categories", {}).get(cat, {}).get(sub, []) or []
-    if not raw_items:
-        await cb.message.answer("Товарів немає.")
+    cat = _resolve_cat(d, cid)
+    sub = _resolve_sub(d, cid, sub_token)
+    if cat is None or sub is None:
+        await cb.message.answer("Каталог оновився — відкрийте 🛍 Каталог ще раз.")
         return
 
-    # нормалізуємо до списку pid
-    pids: List[int] = []
-    for x in raw_items:
-        if isinstance(x, dict):
-            # якщо десь лишився старий формат
-            try:
-                pids.append(int(x.get("id")))
-            except Exception:
-                continue
-        else:
-            try:
-                pids.append(int(x))
-            except Exception:
-                continue
-
+    pids = sub_pids(d, cat, sub)
     if not pids:
         await cb.message.answer("Товарів немає.")
         return
@@ -491,7 +535,7 @@ async def show_product_page(cb: types.CallbackQuery, cat: str, sub: str, i: int)
 
     txt = product_card(p)
     fav = is_fav(d, cb.from_user.id, pid)
-    kb = product_page_kb(cat, sub, i, total, pid, fav)
+    kb = product_page_kb(cid, sub_token, i, total, pid, fav)
 
     photos = p.get("photos", []) or []
     if photos:
@@ -511,22 +555,26 @@ async def show_product_page(cb: types.CallbackQuery, cat: str, sub: str, i: int)
 
 @router.callback_query(F.data.startswith("sub:"))
 async def choose_sub(cb: types.CallbackQuery):
-    d = await load_data()
-    _, cat, sub = cb.data.split(":", 2)
+    d = await load_data(CATALOG, writes=())
+    _, cid, sub_token = cb.data.split(":", 2)
 
-    items = d.get("categories", {}).get(cat, {}).get(sub, []) or []
-    if not items:
+    cat = _resolve_cat(d, cid)
+    sub = _resolve_sub(d, cid, sub_token)
+    if cat is None or sub is None:
+        return await cb.answer("Каталог оновився — відкрийте 🛍 Каталог ще раз", show_alert=True)
+
+    if not sub_count(d, cat, sub):
         await cb.message.answer("Товарів немає.")
         return await cb.answer()
 
-    await show_product_page(cb, cat, sub, 0)
+    await show_product_page(cb, cid, sub_token, 0)
     await cb.answer()
 
 
 @router.callback_query(F.data.startswith("page:"))
 async def page_nav(cb: types.CallbackQuery):
-    _, cat, sub, i_str = cb.data.split(":", 3)
-    await show_product_page(cb, cat, sub, int(i_str))
+    _, cid, sub_token, i_str = cb.data.split(":", 3)
+    await show_product_page(cb, cid, sub_token, int(i_str))
     await cb.answer()
 
 
@@ -537,19 +585,21 @@ async def noop(cb: types.CallbackQuery):
 
 @router.callback_query(F.data == "catalog:back")
 async def catalog_back(cb: types.CallbackQuery):
-    d = await load_data()
+    d = await load_data(CATALOG, writes=())
     if not d.get("categories"):
         await cb.message.answer("Каталог порожній")
         return await cb.answer()
 
-    await cb.message.answer("Оберіть категорію:", reply_markup=catalog_kb(d["categories"].keys()))
+    await cb.message.answer("Оберіть категорію:", reply_markup=catalog_kb(d))
     await cb.answer()
 
 
 @router.callback_query(F.data.startswith("sub_back:"))
 async def sub_back(cb: types.CallbackQuery):
-    d = await load_data()
-    cat = cb.data.split(":", 1)[1]
+    d = await load_data(CATALOG, writes=())
+    cat = _resolve_cat(d, cb.data.split(":", 1)[1])
+    if cat is None:
+        return await cb.answer("Каталог оновився — відкрийте 🛍 Каталог ще раз", show_alert=True)
     subs = d.get("categories", {}).get(cat, {}) or {}
     if not subs:
         await cb.message.answer("У цій категорії поки немає товарів.")
@@ -560,11 +610,190 @@ async def sub_back(cb: types.CallbackQuery):
     await cb.message.answer(
         f"<b>{cat}</b>\nОберіть підкатегорію:",
         parse_mode="HTML",
-        reply_markup=subcat_kb(cat, subs.keys())
+        reply_markup=subcat_kb(d, cat)
     )
     await cb.answer()
 
 
+# ===================== SEARCH (PAGED, ONE MESSAGE) =====================
+
+def _search_pages_count(items_count: int) -> int:
+    return max(1, int(math.ceil(items_count / SEARCH_PER_PAGE)))
+
+
+def search_paged_kb(page_items: List[dict], page: int, pages: int) -> types.InlineKeyboardMarkup:
+    kb = InlineKeyboardBuilder()
+
+    for p in page_items:
+        pid = int(p["id"])
+        name = str(p.get("name", "Товар"))
+        if len(name) > 18:
+            name = name[:18] + "…"
+        kb.button(text=f"🔎 {name}", callback_data=f"srch:open:{pid}:{page}")
+
+    kb.adjust(2)
+
+    if pages > 1:
+        prev_p = page - 1 if page > 0 else None
+        next_p = page + 1 if page < pages - 1 else None
+
+        kb.row(
+            types.InlineKeyboardButton(text="⬅️", callback_data=f"srch:page:{prev_p}" if prev_p is not None else "noop"),
+            types.InlineKeyboardButton(text=f"{page+1}/{pages}", callback_data="noop"),
+            types.InlineKeyboardButton(text="➡️", callback_data=f"srch:page:{next_p}" if next_p is not None else "noop"),
+        )
+
+    return kb.as_markup()
+
+
+def _search_items_all(d: dict, q: str) -> List[dict]:
+    product_search.sync(d)
+    items: List[dict] = []
+    for pid in product_search.search(q):
+        p = find_product(d, pid)
+        if p:
+            items.append(p)
+    return items
+
+
+def _render_search_page(d: dict, q: str, page: int) -> Tuple[str, List[dict], int, int]:
+    all_items = _search_items_all(d, q)
+    q_html = escape(q)
+
+    if not all_items:
+        return (
+            f"🔎 <b>Пошук</b>: <i>{q_html}</i>\n\n"
+            "Нічого не знайдено. Спробуйте інше слово або артикул.",
+            [], 0, 1,
+        )
+
+    pages = _search_pages_count(len(all_items))
+    page = max(0, min(page, pages - 1))
+
+    start = page * SEARCH_PER_PAGE
+    end = start + SEARCH_PER_PAGE
+    page_items = all_items[start:end]
+
+    lines: List[str] = []
+    lines.append(f"🔎 <b>Пошук</b>: <i>{q_html}</i>")
+    if pages > 1:
+        lines.append(f"<i>Знайдено: {len(all_items)} · Сторінка: {page+1}/{pages}</i>")
+    else:
+        lines.append(f"<i>Знайдено: {len(all_items)}</i>")
+    lines.append("")
+    lines.append("Натисніть на товар, щоб відкрити картку 👇")
+
+    return "\n".join(lines), page_items, page, pages
+
+
+async def _edit_search(cb: types.CallbackQuery, state: FSMContext, page: int):
+    q = (await state.get_data()).get("search_q") or ""
+    if not q:
+        await cb.answer("Пошук застарів — натисніть 🔎 Пошук ще раз", show_alert=True)
+        return
+
+    d = await load_data(CATALOG, writes=())
+    txt, page_items, page, pages = _render_search_page(d, q, page)
+    kb = search_paged_kb(page_items, page, pages) if page_items else None
+
+    if cb.message and cb.message.photo:
+        await _safe_delete(cb.message)
+        await cb.message.answer(txt, parse_mode="HTML", reply_markup=kb)
+    else:
+        try:
+            await cb.message.edit_text(txt, parse_mode="HTML", reply_markup=kb)
+        except Exception:
+            pass
+    await cb.answer()
+
+
+def search_card_kb(pid: int, page: int, fav: bool) -> types.InlineKeyboardMarkup:
+    kb = InlineKeyboardBuilder()
+    kb.button(text="🛒 В кошик", callback_data=f"add:{pid}")
+    kb.button(
+        text=("❌ З обраного" if fav else "⭐ В обране"),
+        callback_data=f"fav:{'off' if fav else 'on'}:{pid}"
+    )
+    kb.button(text="⬅️ До результатів", callback_data=f"srch:page:{page}")
+    kb.adjust(2, 1)
+    return kb.as_markup()
+
+
+async def _show_search_card(cb: types.CallbackQuery, pid: int, page: int, d: Optional[dict] = None):
+    if d is None:
+        d = await load_data(STOREFRONT, writes=())
+    p = find_product(d, pid)
+    if not p:
+        await cb.answer("Товар не знайдено", show_alert=True)
+        return
+
+    txt = product_card(p)
+    kb = search_card_kb(pid, page, is_fav(d, cb.from_user.id, pid))
+
+    photos = p.get("photos", []) or []
+    if photos:
+        media = types.InputMediaPhoto(media=photos[0], caption=txt, parse_mode="HTML")
+        try:
+            await cb.message.edit_media(media=media, reply_markup=kb)
+        except Exception:
+            await _safe_delete(cb.message)
+            await cb.message.answer_photo(photos[0], caption=txt, parse_mode="HTML", reply_markup=kb)
+    else:
+        try:
+            await cb.message.edit_text(txt, parse_mode="HTML", reply_markup=kb)
+        except Exception:
+            await _safe_delete(cb.message)
+            await cb.message.answer(txt, parse_mode="HTML", reply_markup=kb)
+
+
+@router.message(F.text == "🔎 Пошук")
+async def search_start(m: types.Message, state: FSMContext):
+    await state.set_state(SearchFSM.query)
+    await m.answer("🔎 Введіть назву, артикул (SKU) або слово з опису:")
+
+
+# кнопки меню і команди під час пошуку обробляються своїми хендлерами
+@router.message(SearchFSM.query, ~F.text.in_(MAIN_MENU_TEXTS), ~F.text.startswith("/"))
+async def search_query(m: types.Message, state: FSMContext):
+    q = (m.text or "").strip()
+    if not q:
+        return await m.answer("Введіть запит текстом.")
+    if len(q) > 64:
+        q = q[:64]
+
+    d = await load_data(CATALOG, writes=())
+    txt, page_items, page, pages = _render_search_page(d, q, 0)
+    kb = search_paged_kb(page_items, page, pages) if page_items else None
+    await m.answer(txt, parse_mode="HTML", reply_markup=kb)
+
+    # результати надіслано — виходимо з режиму пошуку; запит лишаємо для сторінок (srch:page)
+    await state.clear()
+    await state.update_data(search_q=q)
+
+
+@router.callback_query(F.data.startswith("srch:page:"))
+async def search_page(cb: types.CallbackQuery, state: FSMContext):
+    try:
+        page = int(cb.data.split(":")[2])
+    except Exception:
+        page = 0
+    await _edit_search(cb, state, page)
+
+
+@router.callback_query(F.data.startswith("srch:open:"))
+async def search_open(cb: types.CallbackQuery):
+    # srch:open:PID:PAGE
+    try:
+        _, _, pid_str, page_str = cb.data.split(":")
+        pid = int(pid_str)
+        page = int(page_str)
+    except Exception:
+        return await cb.answer("Некоректна дія", show_alert=True)
+
+    await _show_search_card(cb, pid, page)
+    await cb.answer()
+
+
 # ===================== HITS / PROMO (PAGED, ONE MESSAGE) =====================
 
 def hits_menu_kb() -> types.InlineKeyboardMarkup:
@@ -620,19 +849,11 @@ def _hits_ids_list(d: dict) -> List[int]:
 
 
 def _promo_ids_list(d: dict, now_ts: int) -> List[int]:
-    out = []
-    for p in (d.get("products", []) or []):
-        try:
-            pid = int(p.get("id", 0) or 0)
-        except Exception:
-            continue
-        if pid and _promo_active(p, now_ts):
-            out.append(pid)
-    return out
+    return promos.promo_ids(d, now_ts)
 
 
 async def _show_hits_page(cb: types.CallbackQuery, kind: str, i: int):
-    d = await load_data()
+    d = await load_data(STOREFRONT, writes=())
     now_ts = int(time.time())
 
     if kind == "promo":
@@ -759,7 +980,7 @@ async def ha_nav(cb: types.CallbackQuery):
 # ---------- FAVS PAGED ----------
 
 def _favs_items_all(d: dict, uid: int) -> List[dict]:
-    favs = set(int(x) for x in user_favs(d, uid))
+    favs = set(_fav_ids(d, uid))
     items: List[dict] = []
     for pid in sorted(favs):
         p = find_product(d, pid)
@@ -823,7 +1044,7 @@ def _render_favs_page(d: dict, uid: int, page: int) -> Tuple[str, List[dict], in
 
 
 async def _edit_favs(cb: types.CallbackQuery, page: int):
-    d = await load_data()
+    d = await load_data(STOREFRONT, writes=())
     txt, page_items, page, pages = _render_favs_page(d, cb.from_user.id, page)
 
     if not page_items:
@@ -847,7 +1068,7 @@ async def _edit_favs(cb: types.CallbackQuery, page: int):
 
 @router.message(F.text == "⭐ Обране")
 async def show_favs(m: types.Message):
-    d = await load_data()
+    d = await load_data(STOREFRONT, writes=())
     txt, page_items, page, pages = _render_favs_page(d, m.from_user.id, 0)
 
     if not page_items:
@@ -868,24 +1089,17 @@ async def favs_page(cb: types.CallbackQuery):
 
 # ---------- helper: cart dict (потрібен у favs card) ----------
 
-def _cart_dict(d: dict, uid: int) -> dict:
-    d.setdefault("carts", {})
-    key = str(uid)
-    raw = d["carts"].get(key, {})
-
+def _norm_cart(raw: Any) -> Dict[str, int]:
+    # старий формат — список pid, новий — {pid: qty}
+    out: Dict[str, int] = {}
     if isinstance(raw, list):
-        out: Dict[str, int] = {}
         for x in raw:
             try:
                 pid = str(int(x))
             except Exception:
                 continue
             out[pid] = out.get(pid, 0) + 1
-        d["carts"][key] = out
-        return out
-
-    if isinstance(raw, dict):
-        out: Dict[str, int] = {}
+    elif isinstance(raw, dict):
         for k, v in raw.items():
             try:
                 pid = str(int(k))
@@ -894,11 +1108,34 @@ def _cart_dict(d: dict, uid: int) -> dict:
                 continue
             if qty > 0:
                 out[pid] = qty
-        d["carts"][key] = out
-        return out
+    return out
+
+
+def _cart_view(d: dict, uid: int) -> Dict[str, int]:
+    """Тільки читання: нормалізована копія кошика, d (спільний стан з кешу) не змінюється."""
+    return _norm_cart((d.get("carts") or {}).get(str(uid)))
+
+
+def _cart_dict(d: dict, uid: int) -> dict:
+    """Кошик для змін (лише в мутаціях update_data / shop_tx)."""
+    d.setdefault("carts", {})
+    out = _norm_cart(d["carts"].get(str(uid)))
+    d["carts"][str(uid)] = out
+    return out
 
-    d["carts"][key] = {}
-    return d["carts"][key]
+
+def _cart_add(d: dict, uid: int, pid: int, delta: int) -> int:
+    """
+    Змінює кількість товару в кошику на delta (≤0 — прибирає позицію).
+    Повертає нову кількість.
+    """
+    cart = _cart_dict(d, uid)
+    qty = int(cart.get(str(pid), 0) or 0) + int(delta)
+    if qty <= 0:
+        cart.pop(str(pid), None)
+        return 0
+    cart[str(pid)] = qty
+    return qty
 
 
 @router.callback_query(F.data.startswith("favs:open:"))
@@ -911,12 +1148,12 @@ async def favs_open(cb: types.CallbackQuery):
     except Exception:
         return await cb.answer("Некоректна дія", show_alert=True)
 
-    d = await load_data()
+    d = await load_data(STOREFRONT, writes=())
     p = find_product(d, pid)
     if not p:
         return await cb.answer("Товар не знайдено", show_alert=True)
 
-    cart = _cart_dict(d, cb.from_user.id)
+    cart = _cart_view(d, cb.from_user.id)
     qty = int(cart.get(str(pid), 0) or 0)
     txt = product_card(p) + f"\n\n🧺 <b>В кошику</b>: <b>{qty}</b> шт"
 
@@ -956,17 +1193,15 @@ async def favs_add_to_cart(cb: types.CallbackQuery):
     except Exception:
         return await cb.answer("Некоректна дія", show_alert=True)
 
-    d = await load_data()
     uid = cb.from_user.id
-    cart = _cart_dict(d, uid)
-    cart[str(pid)] = int(cart.get(str(pid), 0) or 0) + 1
-    await save_data(d)
+
+    qty = await update_data_coalesced(lambda d: _cart_add(d, uid, pid, +1), ("carts",))
+    d = await load_data(("catalog", "favorites"), writes=())
 
     p = find_product(d, pid)
     if not p:
         return await cb.answer("Товар не знайдено", show_alert=True)
 
-    qty = int(cart.get(str(pid), 0) or 0)
     txt = product_card(p) + f"\n\n🧺 <b>В кошику</b>: <b>{qty}</b> шт"
 
     fav_now = is_fav(d, uid, pid)
@@ -1007,7 +1242,6 @@ async def fav_toggle_from_favs_card(cb: types.CallbackQuery):
     favp:off:PID:PAGE
     Після видалення з обраного — повертаємо список.
     """
-    d = await load_data()
     uid = cb.from_user.id
 
     try:
@@ -1017,19 +1251,13 @@ async def fav_toggle_from_favs_card(cb: types.CallbackQuery):
     except Exception:
         return await cb.answer("Некоректна дія", show_alert=True)
 
-    favs = user_favs(d, uid)
-    sset = set(int(x) for x in favs)
+    await update_data_coalesced(lambda d: _fav_set(d, uid, pid, mode == "on"), ("favorites",))
 
     if mode == "on":
-        sset.add(pid)
         await cb.answer("⭐ Додано в обране")
     else:
-        sset.discard(pid)
         await cb.answer("❌ Прибрано з обраного")
 
-    d["favorites"][str(uid)] = list(sset)
-    await save_data(d)
-
     # якщо прибрали — одразу назад у список обраного
     if mode == "off":
         await _edit_favs(cb, page)
@@ -1042,9 +1270,9 @@ async def fav_toggle(cb: types.CallbackQuery):
     Загальний toggle для:
     - каталогу (product_page_kb)
     - хітів/акцій (send_product)
+    - картки з пошуку (search_card_kb)
     НЕ чіпає картку обраного — там favp:...
     """
-    d = await load_data()
     uid = cb.from_user.id
 
     try:
@@ -1053,19 +1281,14 @@ async def fav_toggle(cb: types.CallbackQuery):
     except Exception:
         return await cb.answer("Некоректна дія", show_alert=True)
 
-    favs = user_favs(d, uid)
-    sset = set(int(x) for x in favs)
+    await update_data_coalesced(lambda d: _fav_set(d, uid, pid, mode == "on"), ("favorites",))
+    d = await load_data(("catalog", "favorites"), writes=())
 
     if mode == "on":
-        sset.add(pid)
         await cb.answer("⭐ Додано в обране")
     else:
-        sset.discard(pid)
         await cb.answer("❌ Прибрано з обраного")
 
-    d["favorites"][str(uid)] = list(sset)
-    await save_data(d)
-
     # оновлюємо кнопки на поточному повідомленні (без “перестрибування”)
     try:
         if cb.message and cb.message.reply_markup:
@@ -1079,8 +1302,8 @@ async def fav_toggle(cb: types.CallbackQuery):
 
             page_btn = next((x for x in all_cb if x.startswith("page:")), None)
             if page_btn:
-                _, cat, sub, i_str = page_btn.split(":", 3)
-                await show_product_page(cb, cat, sub, int(i_str))
+                _, cid, sub_token, i_str = page_btn.split(":", 3)
+                await show_product_page(cb, cid, sub_token, int(i_str))
                 return
             ha_btn = next((x for x in all_cb if x.startswith("ha:nav:") or x.startswith("ha:open:")), None)
             if ha_btn:
@@ -1090,6 +1313,10 @@ async def fav_toggle(cb: types.CallbackQuery):
                 i_str = parts[3]
                 await _show_hits_page(cb, kind, int(i_str))
                 return
+            srch_btn = next((x for x in all_cb if x.startswith("srch:page:")), None)
+            if srch_btn:
+                await _show_search_card(cb, pid, int(srch_btn.split(":")[2]), d=d)
+                return
 
             # інакше просто міняємо клавіатуру як на картці з hits
             p = find_product(d, pid)
@@ -1112,27 +1339,13 @@ def _money_uah(x) -> str:
 
 
 def _promo_active(p: dict, now_ts: int) -> bool:
-    try:
-        promo_price = float(p.get("promo_price") or 0)
-    except Exception:
-        promo_price = 0.0
-    if promo_price <= 0:
-        return False
-
-    until = p.get("promo_until_ts")
-    if until is None:
-        return True
-    try:
-        until_i = int(until)
-    except Exception:
-        return True
-    return now_ts <= until_i
+    return promos.is_active(p, now_ts)
 
 
 def _unit_price_str(p: dict, now_ts: int) -> str:
     base = float(p.get("base_price", p.get("price", 0)) or 0)
     if _promo_active(p, now_ts):
-        promo = float(p.get("promo_price") or 0)
+        promo = promos.unit_price(p, now_ts)
         return f"<s>{_money_uah(base)}</s> → <b>{_money_uah(promo)}</b>"
     return f"<b>{_money_uah(base)}</b>"
 
@@ -1187,7 +1400,7 @@ def cart_paged_kb(cart: dict, page_items: List[dict], page: int, pages: int) ->
 
 
 def _render_cart_page(d: dict, uid: int, page: int) -> Tuple[str, float, List[dict], dict, int, int]:
-    cart = _cart_dict(d, uid)
+    cart = _cart_view(d, uid)
     all_items = _cart_items_all(d, cart)
 
     if not all_items:
@@ -1217,8 +1430,7 @@ def _render_cart_page(d: dict, uid: int, page: int) -> Tuple[str, float, List[di
         if qty <= 0:
             continue
 
-        unit_is_promo = _promo_active(p, now_ts)
-        unit_val = float(p.get("promo_price") or 0) if unit_is_promo else float(p.get("base_price", p.get("price", 0)) or 0)
+        unit_val = promos.unit_price(p, now_ts)
         line_total = unit_val * qty
 
         name = str(p.get("name", "Товар"))
@@ -1233,7 +1445,7 @@ def _render_cart_page(d: dict, uid: int, page: int) -> Tuple[str, float, List[di
 
 
 async def _show_cart_page(cb: types.CallbackQuery, page: int):
-    d = await load_data()
+    d = await load_data(STOREFRONT, writes=())
     txt, total, page_items, cart, page, pages = _render_cart_page(d, cb.from_user.id, page)
 
     if not page_items:
@@ -1268,12 +1480,12 @@ def cart_item_kb(pid: int, qty: int, page: int) -> types.InlineKeyboardMarkup:
 
 
 async def _show_cart_item(cb: types.CallbackQuery, pid: int, page: int):
-    d = await load_data()
+    d = await load_data(STOREFRONT, writes=())
     p = find_product(d, pid)
     if not p:
         return await cb.answer("Товар не знайдено", show_alert=True)
 
-    cart = _cart_dict(d, cb.from_user.id)
+    cart = _cart_view(d, cb.from_user.id)
     qty = int(cart.get(str(pid), 0) or 0)
     if qty <= 0:
         return await cb.answer("Цього товару вже нема в кошику", show_alert=True)
@@ -1301,17 +1513,14 @@ async def _show_cart_item(cb: types.CallbackQuery, pid: int, page: int):
 
 @router.callback_query(F.data.startswith("add:"))
 async def add_cart(cb: types.CallbackQuery):
-    d = await load_data()
     pid = int(cb.data.split(":")[1])
-    cart = _cart_dict(d, cb.from_user.id)
-    cart[str(pid)] = int(cart.get(str(pid), 0) or 0) + 1
-    await save_data(d)
+    await update_data_coalesced(lambda d: _cart_add(d, cb.from_user.id, pid, +1), ("carts",))
     await cb.answer("Додано 🛒")
 
 
 @router.message(F.text == "🧺 Кошик")
 async def show_cart(m: types.Message):
-    d = await load_data()
+    d = await load_data(STOREFRONT, writes=())
     txt, total, page_items, cart, page, pages = _render_cart_page(d, m.from_user.id, 0)
 
     if not page_items:
@@ -1322,10 +1531,11 @@ async def show_cart(m: types.Message):
 
 @router.callback_query(F.data == "clear")
 async def clear_cart(cb: types.CallbackQuery):
-    d = await load_data()
-    d.setdefault("carts", {})
-    d["carts"][str(cb.from_user.id)] = {}
-    await save_data(d)
+    def _clear(d: dict) -> None:
+        d.setdefault("carts", {})
+        d["carts"][str(cb.from_user.id)] = {}
+
+    await update_data_coalesced(_clear, ("carts",))
     await cb.answer("Очищено 🗑")
 
     if cb.message and cb.message.photo:
@@ -1371,10 +1581,7 @@ async def cart_inc(cb: types.CallbackQuery):
     except Exception:
         return await cb.answer()
 
-    d = await load_data()
-    cart = _cart_dict(d, cb.from_user.id)
-    cart[str(pid)] = int(cart.get(str(pid), 0) or 0) + 1
-    await save_data(d)
+    await update_data_coalesced(lambda d: _cart_add(d, cb.from_user.id, pid, +1), ("carts",))
 
     # якщо це картка — оновлюємо картку, інакше сторінку
     is_card = bool(cb.message and (
@@ -1398,17 +1605,10 @@ async def cart_dec(cb: types.CallbackQuery):
     except Exception:
         return await cb.answer()
 
-    d = await load_data()
-    cart = _cart_dict(d, cb.from_user.id)
-    cur = int(cart.get(str(pid), 0) or 0)
-    if cur <= 1:
-        cart.pop(str(pid), None)
-    else:
-        cart[str(pid)] = cur - 1
-    await save_data(d)
+    left = await update_data_coalesced(lambda d: _cart_add(d, cb.from_user.id, pid, -1), ("carts",))
 
     # якщо товар видалився — назад в кошик
-    if int(_cart_dict(d, cb.from_user.id).get(str(pid), 0) or 0) <= 0:
+    if left <= 0:
         await _show_cart_page(cb, page)
         return await cb.answer()
 
@@ -1433,10 +1633,10 @@ async def cart_rm(cb: types.CallbackQuery):
     except Exception:
         return await cb.answer()
 
-    d = await load_data()
-    cart = _cart_dict(d, cb.from_user.id)
-    cart.pop(str(pid), None)
-    await save_data(d)
+    def _rm(d: dict) -> None:
+        _cart_dict(d, cb.from_user.id).pop(str(pid), None)
+
+    await update_data_coalesced(_rm, ("carts",))
 
     await _show_cart_page(cb, page)
     await cb.answer("Прибрано 🗑")
@@ -1446,8 +1646,8 @@ async def cart_rm(cb: types.CallbackQuery):
 
 @router.callback_query(F.data == "checkout")
 async def checkout(cb: types.CallbackQuery, state: FSMContext):
-    d = await load_data()
-    cart = _cart_dict(d, cb.from_user.id)
+    d = await load_data(("carts",), writes=())
+    cart = _cart_view(d, cb.from_user.id)
     if not cart:
         return await cb.answer("Кошик порожній", show_alert=True)
 
@@ -1515,24 +1715,12 @@ async def order_np(m: types.Message, state: FSMContext):
     await m.answer("📝 Коментар (або '-' щоб пропустити):")
 
 
-@router.message(OrderFSM.comment)
-async def order_finish(m: types.Message, state: FSMContext):
-    comment = (m.text or "").strip()
-    if comment == "-":
-        comment = ""
-
-    st = await state.get_data()
-    st["comment"] = comment
-
-    d = await load_data()
-
-    cart = _cart_dict(d, m.from_user.id)
-    if not cart:
-        await state.clear()
-        return await m.answer("Кошик порожній. Почніть знову.", reply_markup=main_menu())
-
+def _create_order(d: dict, u: types.User, cart: dict, st: dict, oid: int) -> dict:
+    """
+    Створює замовлення з кошика (снапшот позицій) і чистить кошик.
+    Викликати всередині shop_tx().
+    """
     total = cart_total(d, cart)
-    oid = next_order_id(d)
 
     items_pack = []
     for pid_str, qty in (cart or {}).items():
@@ -1556,9 +1744,9 @@ async def order_finish(m: types.Message, state: FSMContext):
     d.setdefault("orders", [])
     order = {
         "id": oid,
-        "user_id": m.from_user.id,
-        "user_username": (m.from_user.username or ""),
-        "user_full_name": (m.from_user.full_name or ""),
+        "user_id": u.id,
+        "user_username": (u.username or ""),
+        "user_full_name": (u.full_name or ""),
 
         "items": items_pack,
         "total": float(total),
@@ -1593,15 +1781,38 @@ async def order_finish(m: types.Message, state: FSMContext):
     # timeline
     _evt(order, "order_created", "Замовлення створено", f"Сума: {float(total):.2f} ₴")
 
-    d["orders"].append(order)
+    add_order(d, order)
 
     # чистимо кошик
     d.setdefault("carts", {})
-    d["carts"][str(m.from_user.id)] = {}
+    d["carts"][str(u.id)] = {}
+    return order
+
+
+@router.message(OrderFSM.comment)
+async def order_finish(m: types.Message, state: FSMContext):
+    comment = (m.text or "").strip()
+    if comment == "-":
+        comment = ""
+
+    st = await state.get_data()
+    st["comment"] = comment
+
+    # кошик/обране могли ще лежати у write-behind — спершу дописуємо
+    await flush_writes()
+    oid = await alloc_order_id()
+    async with shop_tx(CHECKOUT) as d:
+        cart = _cart_dict(d, m.from_user.id)
+        if cart:
+            order = _create_order(d, m.from_user, cart, st, oid)
+
+    if not cart:
+        await state.clear()
+        return await m.answer("Кошик порожній. Почніть знову.", reply_markup=main_menu())
 
-    await save_data(d)
     await state.clear()
 
+    total = float(order["total"])
     await m.answer(
         f"✅ Замовлення створено #{oid}\n"
         f"Сума: {total:.2f} ₴\n\n"
@@ -1614,24 +1825,28 @@ async def order_finish(m: types.Message, state: FSMContext):
 
 @router.callback_query(F.data.startswith("pay_full:"))
 async def pay_full(cb: types.CallbackQuery, bot: Bot):
-    d = await load_data()
     oid = int(cb.data.split(":")[1])
 
-    order = find_order(d, oid)
+    # перевірка статусу і запис — під блокуванням (без подвійної оплати)
+    busy = False
+    async with shop_tx(ORDERS) as d:
+        order = find_order(d, oid)
+        if order and order.get("status") in ("paid", "prepay", "in_work", "done"):
+            busy = True
+        elif order:
+            order["payment_method"] = "full"
+            order["status"] = "paid"
+            order_status_changed(d, order)
+            order["paid_ts"] = int(time.time())
+            _evt(order, "paid_full", "Оплачено повністю", "")
+
     if not order:
         await cb.message.answer("❌ Замовлення не знайдено.")
         return await cb.answer()
 
-    if order.get("status") in ("paid", "prepay", "in_work", "done"):
+    if busy:
         return await cb.answer("Це замовлення вже опрацьовується.", show_alert=True)
 
-    order["payment_method"] = "full"
-    order["status"] = "paid"
-    order["paid_ts"] = int(time.time())
-    _evt(order, "paid_full", "Оплачено повністю", "")
-
-    await save_data(d)
-
     await cb.message.answer(
         "✅ Оплачено (симуляція).\n\n"
         f"Дякуємо! Замовлення #{oid} прийнято.\n"
@@ -1642,34 +1857,38 @@ async def pay_full(cb: types.CallbackQuery, bot: Bot):
 
     user_link = f'<a href="tg://user?id={order["user_id"]}">👤 Покупець</a>'
     txt = "🆕 НОВЕ ОПЛАЧЕНЕ ЗАМОВЛЕННЯ\n\n" + user_link + "\n\n" + format_order_text(d, order)
-    await notify_staff(bot, txt, parse_mode="HTML")
+    await notify_staff(bot, txt, data=d, parse_mode="HTML")
 
 
 @router.callback_query(F.data.startswith("pay_prepay:"))
 async def pay_prepay(cb: types.CallbackQuery, bot: Bot):
-    d = await load_data()
     oid = int(cb.data.split(":")[1])
 
-    order = find_order(d, oid)
+    prepay = int(PREPAY_AMOUNT)
+    rest = 0.0
+    busy = False
+    async with shop_tx(ORDERS) as d:
+        order = find_order(d, oid)
+        if order and order.get("status") in ("paid", "prepay", "in_work", "done"):
+            busy = True
+        elif order:
+            total = float(order.get("total", 0) or 0)
+            rest = max(0.0, total - prepay)
+
+            order["payment_method"] = "np_prepay_200"
+            order["status"] = "prepay"
+            order_status_changed(d, order)
+            order["prepay_amount"] = prepay
+            order["prepay_ts"] = int(time.time())
+            _evt(order, "prepay_fixed", "Передплату зафіксовано", f"{prepay} ₴, залишок {rest:.2f} ₴")
+
     if not order:
         await cb.message.answer("❌ Замовлення не знайдено.")
         return await cb.answer()
 
-    if order.get("status") in ("paid", "prepay", "in_work", "done"):
+    if busy:
         return await cb.answer("Це замовлення вже опрацьовується.", show_alert=True)
 
-    total = float(order.get("total", 0) or 0)
-    prepay = int(PREPAY_AMOUNT)
-    rest = max(0.0, total - prepay)
-
-    order["payment_method"] = "np_prepay_200"
-    order["status"] = "prepay"
-    order["prepay_amount"] = prepay
-    order["prepay_ts"] = int(time.time())
-    _evt(order, "prepay_fixed", "Передплату зафіксовано", f"{prepay} ₴, залишок {rest:.2f} ₴")
-
-    await save_data(d)
-
     await cb.message.answer(
         "✅ Передплату зафіксовано (симуляція).\n\n"
         f"Передплата: {prepay} ₴\n"
@@ -1681,14 +1900,12 @@ async def pay_prepay(cb: types.CallbackQuery, bot: Bot):
 
     user_link = f'<a href="tg://user?id={order["user_id"]}">👤 Покупець</a>'
     txt = "🆕 НОВЕ ЗАМОВЛЕННЯ (ПЕРЕДПЛАТА / НП)\n\n" + user_link + "\n\n" + format_order_text(d, order)
-    await notify_staff(bot, txt, parse_mode="HTML")
+    await notify_staff(bot, txt, data=d, parse_mode="HTML")
 
 # ===================== HISTORY / TIMELINE / SUPPORT =====================
 
 def _orders_all_for_user(d: dict, uid: int) -> List[dict]:
-    orders = [o for o in (d.get("orders", []) or []) if int(o.get("user_id", -1)) == int(uid)]
-    orders.sort(key=lambda x: int(x.get("created_ts", 0) or 0), reverse=True)
-    return orders
+    return orders_of_user(d, uid)
 
 
 def _orders_pages_count(n: int) -> int:
@@ -1756,7 +1973,7 @@ def _render_history_page(d: dict, uid: int, page: int) -> Tuple[str, List[dict],
 
 
 async def _show_history_page_msg(msg: types.Message, page: int):
-    d = await load_data()
+    d = await load_data(ORDERS, writes=())
     txt, page_orders, page, pages = _render_history_page(d, msg.from_user.id, page)
 
     if not page_orders:
@@ -1766,7 +1983,7 @@ async def _show_history_page_msg(msg: types.Message, page: int):
 
 
 async def _edit_history(cb: types.CallbackQuery, page: int):
-    d = await load_data()
+    d = await load_data(ORDERS, writes=())
     txt, page_orders, page, pages = _render_history_page(d, cb.from_user.id, page)
 
     if not page_orders:
@@ -1804,8 +2021,7 @@ async def hist_page(cb: types.CallbackQuery):
 
 
 def _render_timeline(o: dict) -> str:
-    _ensure_events(o)
-    evs = o.get("events", []) or []
+    evs = _events_view(o)
     if not evs:
         return "📜 <b>Хронологія</b>\n\nПоки що подій нема."
 
@@ -1842,7 +2058,7 @@ async def hist_open(cb: types.CallbackQuery):
     except Exception:
         return await cb.answer("Некоректна дія", show_alert=True)
 
-    d = await load_data()
+    d = await load_data(ORDERS, writes=())
     o = find_order(d, oid)
     if not o or int(o.get("user_id", -1)) != int(cb.from_user.id):
         return await cb.answer("Замовлення не знайдено", show_alert=True)
@@ -1899,7 +2115,7 @@ async def hist_timeline(cb: types.CallbackQuery):
     except Exception:
         return await cb.answer("Некоректна дія", show_alert=True)
 
-    d = await load_data()
+    d = await load_data(ORDERS, writes=())
     o = find_order(d, oid)
     if not o or int(o.get("user_id", -1)) != int(cb.from_user.id):
         return await cb.answer("Замовлення не знайдено", show_alert=True)
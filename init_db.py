@@ -1,8 +1,23 @@
 # init_db.py
+from sqlalchemy import text
+
 from db import engine, Base
 import models  # важливо: щоб моделі підвантажились
+from data import init_storage
 
 
 async def init_db():
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
+        await conn.run_sync(Base.metadata.create_all)
+
+        # create_all не додає колонки в уже існуючі таблиці
+        await conn.execute(text(
+            "ALTER TABLE kv_store ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0"
+        ))
+        # ... і не додає індекси
+        await conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_shop_favorites_product_id ON shop_favorites (product_id)"
+        ))
+
+    # старий shop_state (один JSONB) → реляційні таблиці + одноразова міграція схеми
+    await init_storage()
\ No newline at end of file
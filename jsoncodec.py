@@ -0,0 +1,82 @@
+# jsoncodec.py
+from __future__ import annotations
+
+import json
+from typing import Any, Callable, Optional
+
+from config import SHOP_JSON_CODEC
+
+try:
+    import orjson
+except ImportError:  # необовʼязкова залежність
+    orjson = None
+
+
+# =========================================================
+# JSON CODEC (engine json_serializer / json_deserializer + відбитки рядків)
+#
+# SHOP_JSON_CODEC:
+#   auto   — orjson, якщо встановлено, інакше stdlib (за замовчуванням)
+#   orjson — тільки orjson (помилка на старті, якщо нема)
+#   json   — stdlib
+#
+# Сумісність з даними: int-ключі dict стають рядками (як у json.dumps),
+# українські літери пишуться як UTF-8 (JSONB однаково зберігає і \\uXXXX).
+# Те, що orjson не вміє (int > 64 біт тощо), кодуємо stdlib-ом.
+# =========================================================
+
+def _resolve(name: str) -> str:
+    name = (name or "auto").strip().lower()
+    if name == "auto":
+        return "orjson" if orjson is not None else "json"
+    if name == "orjson" and orjson is None:
+        raise RuntimeError("SHOP_JSON_CODEC=orjson, але пакет orjson не встановлено")
+    if name not in ("orjson", "json"):
+        raise RuntimeError(f"Невідомий SHOP_JSON_CODEC: {name}")
+    return name
+
+
+def _std_dumps(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def _std_dumps_sorted(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), sort_keys=True, default=str)
+
+
+if orjson is not None:
+    _OPTS = orjson.OPT_NON_STR_KEYS
+
+    def _orjson_dumps(obj: Any) -> str:
+        try:
+            return orjson.dumps(obj, option=_OPTS).decode("utf-8")
+        except TypeError:
+            return _std_dumps(obj)
+
+    def _orjson_dumps_sorted(obj: Any) -> str:
+        try:
+            return orjson.dumps(obj, option=_OPTS | orjson.OPT_SORT_KEYS, default=str).decode("utf-8")
+        except TypeError:
+            return _std_dumps_sorted(obj)
+
+    def _orjson_loads(s: Any) -> Any:
+        return orjson.loads(s)
+
+
+CODEC = _resolve(SHOP_JSON_CODEC)
+
+dumps: Callable[[Any], str]
+dumps_sorted: Callable[[Any], str]
+loads: Callable[[Any], Any]
+
+if CODEC == "orjson":
+    dumps, dumps_sorted, loads = _orjson_dumps, _orjson_dumps_sorted, _orjson_loads
+else:
+    dumps, dumps_sorted, loads = _std_dumps, _std_dumps_sorted, json.loads
+
+
+def get_codec(name: Optional[str] = None):
+    """(dumps, dumps_sorted, loads) для конкретного кодека — для бенчмарку/тестів."""
+    if _resolve(name or CODEC) == "orjson":
+        return _orjson_dumps, _orjson_dumps_sorted, _orjson_loads
+    return _std_dumps, _std_dumps_sorted, json.loads
@@ -6,6 +6,10 @@ from aiogram.fsm.storage.memory import MemoryStorage
 from config import BOT_TOKEN
 from handlers import user_router, admin_router
 from init_db import init_db
+from data import close_writes, on_state_version
+from statesync import run_state_sync
+from promos import run_promo_expiry
+from sendqueue import close_send_queue
 
 from middlewares.debug import DebugMiddleware
 
@@ -22,7 +26,20 @@ async def main():
     dp.include_router(user_router)
     dp.include_router(admin_router)
 
-    await dp.start_polling(bot)
+    # LISTEN shop_state_changed: інвалідація кешу між репліками
+    sync_task = asyncio.create_task(run_state_sync(on_state_version))
+    # акції з promo_until_ts знімаються з вітрини рівно в момент завершення
+    promo_task = asyncio.create_task(run_promo_expiry())
+
+    try:
+        await dp.start_polling(bot)
+    finally:
+        sync_task.cancel()
+        promo_task.cancel()
+        # дописуємо відкладені записи кошика/обраного
+        await close_writes()
+        # і даємо черзі сповіщень відправити залишок
+        await close_send_queue()
 
 
 if __name__ == "__main__":
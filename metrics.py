@@ -0,0 +1,52 @@
+# metrics.py
+from __future__ import annotations
+
+from collections import Counter
+from typing import Dict, Union
+
+# прості лічильники в памʼяті процесу (для /stats і логів)
+_counters: Counter = Counter()
+
+# миттєві значення (зайняті зʼєднання пулу, максимум очікування, ...)
+_gauges: Dict[str, float] = {}
+
+
+def inc(name: str, n: int = 1) -> None:
+    _counters[name] += n
+
+
+def get(name: str) -> int:
+    return int(_counters.get(name, 0))
+
+
+def set_gauge(name: str, value: float) -> None:
+    _gauges[name] = float(value)
+
+
+def get_gauge(name: str) -> float:
+    return float(_gauges.get(name, 0.0))
+
+
+def observe_ms(name: str, ms: float) -> None:
+    """Тривалість: name.count, name.total_ms і найбільше значення name.max_ms."""
+    _counters[f"{name}.count"] += 1
+    _counters[f"{name}.total_ms"] += int(round(ms))
+    if ms > _gauges.get(f"{name}.max_ms", 0.0):
+        _gauges[f"{name}.max_ms"] = float(ms)
+
+
+def snapshot(prefix: str = "") -> Dict[str, Union[int, float]]:
+    out: Dict[str, Union[int, float]] = {k: int(v) for k, v in _counters.items() if k.startswith(prefix)}
+    out.update({k: v for k, v in _gauges.items() if k.startswith(prefix)})
+    return dict(sorted(out.items()))
+
+
+def render_text(prefix: str = "") -> str:
+    snap = snapshot(prefix)
+    if not snap:
+        return "📊 <b>Метрики</b>\n\n— поки порожньо —"
+    lines = ["📊 <b>Метрики</b>", ""]
+    for k, v in snap.items():
+        val = f"{v:.1f}" if isinstance(v, float) else str(v)
+        lines.append(f"• <code>{k}</code>: <b>{val}</b>")
+    return "\n".join(lines)
@@ -1,8 +1,9 @@
 from __future__ import annotations
 
 from datetime import datetime
+from typing import Any, Optional
 
-from sqlalchemy import String, DateTime, func
+from sqlalchemy import String, DateTime, BigInteger, Integer, Float, func, Index, Sequence
 from sqlalchemy.orm import Mapped, mapped_column
 from sqlalchemy.dialects.postgresql import JSONB
 
@@ -15,8 +16,118 @@ class KVStore(Base):
     key: Mapped[str] = mapped_column(String(64), primary_key=True)
     value: Mapped[dict] = mapped_column(JSONB, nullable=False)
 
+    # росте на кожен запис стану (compare-and-swap у storage.save_state)
+    version: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0, server_default="0")
+
     updated_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
         server_default=func.now(),
         onupdate=func.now()
-    )
\ No newline at end of file
+    )
+
+
+# =========================================================
+# RELATIONAL SHOP STATE
+# Кожен рядок = одна сутність. Повний dict сутності лежить у data (JSONB),
+# а поля для пошуку/фільтрів винесені в окремі колонки.
+# =========================================================
+
+class ShopCategory(Base):
+    __tablename__ = "shop_categories"
+
+    name: Mapped[str] = mapped_column(String, primary_key=True)
+    position: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class ShopSubcategory(Base):
+    __tablename__ = "shop_subcategories"
+
+    category: Mapped[str] = mapped_column(String, primary_key=True)
+    name: Mapped[str] = mapped_column(String, primary_key=True)
+    position: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    # порядок товарів у підкатегорії (список pid)
+    product_ids: Mapped[list] = mapped_column(JSONB, nullable=False, default=list)
+
+
+class ShopProduct(Base):
+    __tablename__ = "shop_products"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    sku: Mapped[str] = mapped_column(String, nullable=False, default="", index=True)
+    barcode: Mapped[str] = mapped_column(String, nullable=False, default="", index=True)
+    category: Mapped[str] = mapped_column(String, nullable=False, default="")
+    sub_category: Mapped[str] = mapped_column(String, nullable=False, default="")
+
+    data: Mapped[dict] = mapped_column(JSONB, nullable=False)
+
+
+class ShopCartItem(Base):
+    __tablename__ = "shop_cart_items"
+
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    product_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    qty: Mapped[int] = mapped_column(Integer, nullable=False, default=1)
+
+
+class ShopFavorite(Base):
+    __tablename__ = "shop_favorites"
+
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    # індекс = "хто додав товар в обране" (сповіщення про знижку)
+    product_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, index=True)
+
+
+class ShopOrder(Base):
+    __tablename__ = "shop_orders"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    user_id: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0, index=True)
+    status: Mapped[str] = mapped_column(String(32), nullable=False, default="", index=True)
+    total: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    created_ts: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0, index=True)
+
+    # усе замовлення без items (delivery, events, np_*, ...)
+    data: Mapped[dict] = mapped_column(JSONB, nullable=False)
+
+
+class ShopOrderItem(Base):
+    __tablename__ = "shop_order_items"
+
+    order_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    position: Mapped[int] = mapped_column(Integer, primary_key=True)
+    product_id: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True, index=True)
+    qty: Mapped[int] = mapped_column(Integer, nullable=False, default=1)
+
+    # item як є: {"pid", "qty", "sku", "name"} або старий формат (просто pid)
+    data: Mapped[Any] = mapped_column(JSONB, nullable=False)
+
+
+class ShopUser(Base):
+    __tablename__ = "shop_users"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    username: Mapped[str] = mapped_column(String, nullable=False, default="")
+    full_name: Mapped[str] = mapped_column(String, nullable=False, default="")
+    last_seen_ts: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+
+    data: Mapped[dict] = mapped_column(JSONB, nullable=False)
+
+
+class ShopAudit(Base):
+    __tablename__ = "shop_audit"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    ts: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    actor_id: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    action: Mapped[str] = mapped_column(String, nullable=False, default="")
+
+    data: Mapped[dict] = mapped_column(JSONB, nullable=False)
+
+
+Index("ix_shop_orders_user_created", ShopOrder.user_id, ShopOrder.created_ts)
+
+
+# лічильники id (nextval атомарний між процесами; засіваються в storage.seed_id_sequences)
+ORDER_ID_SEQ = Sequence("shop_order_id_seq", metadata=Base.metadata)
+PRODUCT_ID_SEQ = Sequence("shop_product_id_seq", metadata=Base.metadata)
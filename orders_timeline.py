@@ -2,7 +2,9 @@
 from __future__ import annotations
 
 import time
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
+
+import shopindex
 
 
 def _evt(order: Dict[str, Any], code: str, title: str, details: str = "") -> None:
@@ -33,11 +35,30 @@ def order_ensure_events(order: Dict[str, Any]) -> None:
         })
 
 
-def order_set_status(order: Dict[str, Any], new_status: str, *, who: str = "", details: str = "") -> None:
+def order_events(order: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Як order_ensure_events, але без змін у order (для показу зі спільного стану)."""
+    evs = order.get("events") or []
+    if evs:
+        return evs
+    created_ts = int(order.get("created_ts", 0) or 0)
+    if not created_ts:
+        return []
+    return [{"ts": created_ts, "code": "created", "title": "Замовлення створено", "details": ""}]
+
+
+def order_set_status(
+    order: Dict[str, Any],
+    new_status: str,
+    *,
+    who: str = "",
+    details: str = "",
+    d: Optional[Dict[str, Any]] = None,
+) -> None:
     """
     ЄДИНИЙ правильний спосіб міняти статус:
     - міняє order["status"]
     - пише подію в events
+    - оновлює індекс статусів стану d (якщо передано)
     """
     old = (order.get("status") or "").strip().lower()
     ns = (new_status or "").strip().lower()
@@ -45,6 +66,8 @@ def order_set_status(order: Dict[str, Any], new_status: str, *, who: str = "", d
         return
 
     order["status"] = ns
+    if d is not None:
+        shopindex.order_status_changed(d, order)
     order_ensure_events(order)
 
     who_line = f"Хто: {who}\n" if who else ""
@@ -97,8 +120,7 @@ def _fmt_dt(ts: int) -> str:
 
 
 def render_timeline_text(order: Dict[str, Any]) -> str:
-    order_ensure_events(order)
-    evs: List[Dict[str, Any]] = order.get("events", []) or []
+    evs = order_events(order)
 
     if not evs:
         return "📜 <b>Хронологія</b>\n\nПодій поки немає."
@@ -0,0 +1,106 @@
+# pricewatch.py
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Dict, List
+
+from aiogram import Bot
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+import metrics
+import promos
+from config import PRICE_DROP_COALESCE_S, PRICE_DROP_RATE
+from data import load_data, find_product, fans_of_product, CATALOG
+from text import esc, money_uah, b, s_
+from sendqueue import LANE_BULK
+from utils import safe_send
+
+log = logging.getLogger(__name__)
+
+
+# =========================================================
+# PRICE DROP (сповіщення тим, у кого товар в обраному)
+#
+# Адмінка повідомляє про зміну ціни: price_changed(bot, pid, old, new).
+# Перша зміна товару відкриває вікно PRICE_DROP_COALESCE_S; усі правки
+# за вікно зливаються — в кінці порівнюємо ціну ДО першої правки з
+# поточною і шлемо одне повідомлення, якщо стало дешевше.
+# Розсилка йде найнижчою смугою черги (sendqueue) і подається в неї
+# не швидше PRICE_DROP_RATE повідомлень/с, щоб не переповнити чергу.
+# =========================================================
+
+
+class PriceDropWatch:
+    def __init__(self, window_s: float = PRICE_DROP_COALESCE_S, rate_per_s: float = PRICE_DROP_RATE):
+        self.window_s = max(0.0, float(window_s))
+        self.interval_s = 1.0 / rate_per_s if rate_per_s > 0 else 0.0
+        self._before: Dict[int, float] = {}     # pid -> ціна до першої правки у вікні
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._notified: Dict[int, float] = {}   # pid -> ціна, про яку вже повідомили
+
+    def price_changed(self, bot: Bot, pid: int, old_unit: float, new_unit: float) -> None:
+        pid = int(pid)
+        if new_unit == old_unit:
+            return
+        if new_unit > self._notified.get(pid, float("inf")):
+            # ціна знову зросла — наступне зниження знову варте повідомлення
+            self._notified.pop(pid, None)
+
+        self._before.setdefault(pid, float(old_unit))
+        if pid in self._tasks:
+            metrics.inc("pricewatch.coalesced")
+            return
+        self._tasks[pid] = asyncio.create_task(self._fire(bot, pid))
+
+    async def _fire(self, bot: Bot, pid: int) -> None:
+        try:
+            await asyncio.sleep(self.window_s)
+        finally:
+            self._tasks.pop(pid, None)
+            old = self._before.pop(pid, None)
+        try:
+            await self._notify(bot, pid, old)
+        except Exception:
+            metrics.inc("pricewatch.errors")
+            log.exception("price drop notify failed for product %s", pid)
+
+    async def _notify(self, bot: Bot, pid: int, old: float | None) -> None:
+        d = await load_data(CATALOG)
+        p = find_product(d, pid)
+        if not p or old is None:
+            return
+
+        new = promos.unit_price(p)
+        if new >= old or new >= self._notified.get(pid, float("inf")):
+            return
+
+        uids = await fans_of_product(pid)
+        self._notified[pid] = new
+        if not uids:
+            return
+
+        off = int(round((1 - new / old) * 100)) if old > 0 else 0
+        txt = (
+            f"🔥 {b('Ціна знизилась!')}\n\n"
+            f"⭐ {b(esc(str(p.get('name', 'Товар'))))}\n"
+            f"💰 {s_(money_uah(old))} → {b(money_uah(new))}"
+            + (f"  {b(f'-{off}%')}" if off > 0 else "")
+        )
+        kb = InlineKeyboardBuilder()
+        kb.button(text="👀 Відкрити", callback_data=f"favs:open:{pid}:0")
+        kb.button(text="🛒 В кошик", callback_data=f"add:{pid}")
+        kb.adjust(2)
+
+        await self._fan_out(bot, uids, txt, kb.as_markup())
+        metrics.inc("pricewatch.drops")
+
+    async def _fan_out(self, bot: Bot, uids: List[int], txt: str, markup) -> None:
+        for uid in uids:
+            await safe_send(bot, uid, txt, lane=LANE_BULK, parse_mode="HTML", reply_markup=markup)
+            metrics.inc("pricewatch.sent")
+            if self.interval_s:
+                await asyncio.sleep(self.interval_s)
+
+
+price_watch = PriceDropWatch()
@@ -0,0 +1,143 @@
+# productsearch.py
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import metrics
+from catalogids import catalog_version
+from textsearch import TrigramIndex, norm, tokens
+
+
+# =========================================================
+# PRODUCT SEARCH (покупець: 🔎 Пошук)
+#
+# Інвертований індекс по name / desc / sku, один на процес.
+# Оновлення інкрементальні:
+#   update(p) / remove(pid) — адмінка викликає одразу після правки;
+#   sync(d) — звіряє підписи (name, desc, sku) з каталогом, але тільки
+#             коли версія каталогу змінилась (правки з інших реплік).
+# Регістр і діакритика не важливі (див. textsearch.norm).
+# =========================================================
+
+FIELDS = ("name", "desc", "sku")
+
+# вага збігу токена запиту: (точно, префікс, підрядок)
+WEIGHTS = {
+    "sku": (100, 40, 15),
+    "name": (30, 20, 10),
+    "desc": (6, 4, 2),
+}
+PHRASE_BONUS = 15  # весь запит — початок назви
+
+
+def _int(x: Any) -> Optional[int]:
+    try:
+        return int(x)
+    except Exception:
+        return None
+
+
+def _sig(p: dict) -> Tuple[str, str, str]:
+    return (str(p.get("name") or ""), str(p.get("desc") or ""), str(p.get("sku") or ""))
+
+
+class ProductSearch:
+    def __init__(self):
+        self._idx: Dict[str, TrigramIndex] = {f: TrigramIndex() for f in FIELDS}
+        self._sig: Dict[int, Tuple[str, str, str]] = {}
+        self._name_n: Dict[int, str] = {}
+        self._version: Optional[int] = None
+
+    def __len__(self) -> int:
+        return len(self._sig)
+
+    def update(self, p: dict) -> None:
+        pid = _int(p.get("id")) if isinstance(p, dict) else None
+        if pid is None:
+            return
+        sig = _sig(p)
+        if self._sig.get(pid) == sig:
+            return
+        name, desc, sku = sig
+        self._idx["name"].set_doc(pid, tokens(name))
+        self._idx["desc"].set_doc(pid, tokens(desc))
+        sku_toks = set(tokens(sku))
+        if norm(sku):
+            sku_toks.add(norm(sku).replace(" ", ""))
+        self._idx["sku"].set_doc(pid, sku_toks)
+        self._sig[pid] = sig
+        self._name_n[pid] = norm(name)
+
+    def remove(self, pid: Any) -> None:
+        pid_i = _int(pid)
+        if pid_i is None or pid_i not in self._sig:
+            return
+        for idx in self._idx.values():
+            idx.remove_doc(pid_i)
+        self._sig.pop(pid_i, None)
+        self._name_n.pop(pid_i, None)
+
+    def sync(self, d: Dict[str, Any]) -> None:
+        version = catalog_version(d)
+        if version is not None and version == self._version:
+            return
+        if "products" not in d:
+            return  # каталог не завантажений — нема з чим звіряти
+        seen: Set[int] = set()
+        for p in d.get("products", []) or []:
+            if not isinstance(p, dict):
+                continue
+            pid = _int(p.get("id"))
+            if pid is None:
+                continue
+            seen.add(pid)
+            self.update(p)
+        for pid in set(self._sig) - seen:
+            self.remove(pid)
+        self._version = version
+        metrics.inc("product_search.syncs")
+
+    def search(self, q_raw: str) -> List[int]:
+        """pid знайдених товарів, найрелевантніші першими. Кожне слово запиту має знайтись."""
+        q_toks = tokens(q_raw)
+        if not q_toks:
+            return []
+
+        cands: Optional[Set[int]] = None
+        for t in q_toks:
+            c: Set[int] = set()
+            for idx in self._idx.values():
+                c |= idx.candidates(t)
+            cands = c if cands is None else cands & c
+            if not cands:
+                break
+        if not cands:
+            metrics.inc("product_search.misses")
+            return []
+
+        q_phrase = " ".join(q_toks)
+        scored = []
+        for pid in cands:
+            score = 0
+            for t in q_toks:
+                best = 0
+                for f in FIELDS:
+                    exact, prefix, sub = WEIGHTS[f]
+                    for dt in self._idx[f].doc_tokens(pid):
+                        if dt == t:
+                            best = max(best, exact)
+                        elif dt.startswith(t):
+                            best = max(best, prefix)
+                        elif t in dt:
+                            best = max(best, sub)
+                score += best
+            if self._name_n.get(pid, "").startswith(q_phrase):
+                score += PHRASE_BONUS
+            scored.append((-score, self._name_n.get(pid, ""), pid))
+
+        scored.sort()
+        metrics.inc("product_search.queries")
+        return [pid for _, _, pid in scored]
+
+
+product_search = ProductSearch()
@@ -0,0 +1,233 @@
+# promos.py
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import metrics
+from catalogids import catalog_version
+
+log = logging.getLogger(__name__)
+
+
+# =========================================================
+# PROMOS (таблиця ефективних цін + множина акцій + планувальник)
+#
+# Один на процес. Для кожного товару тримаємо (base, promo, until),
+# розібрані один раз; ціна/"чи діє акція" — пошук у dict.
+# Запис звіряється з товаром по підпису (base_price/price, promo_price,
+# promo_until_ts): якщо товар змінили — запис оновиться сам при читанні.
+# Адмінка після правок ціни/акції викликає update(p) — так планувальник
+# одразу дізнається нову дату завершення.
+#
+# Планувальник (run_promo_expiry) спить до найближчого promo_until_ts
+# (мін-купа) і прибирає акцію з множини рівно тоді, коли вона закінчилась.
+# Акція діє, поки now <= promo_until_ts (як text.is_promo_active).
+# on_expire(fn) — fn(pid) для кожної акції, що закінчилась (кеш рендеру).
+# =========================================================
+
+MAX_SLEEP_S = 300.0
+
+Entry = Tuple[float, float, Optional[int]]  # base, promo (0 = нема), until
+
+
+def _int(x: Any) -> Optional[int]:
+    try:
+        return int(x)
+    except Exception:
+        return None
+
+
+def _float(x: Any) -> float:
+    try:
+        return float(x or 0)
+    except Exception:
+        return 0.0
+
+
+def _sig(p: dict) -> tuple:
+    return (p.get("base_price"), p.get("price"), p.get("promo_price"), p.get("promo_until_ts"))
+
+
+def _entry(p: dict) -> Entry:
+    base = _float(p.get("base_price", p.get("price", 0)))
+    promo = _float(p.get("promo_price"))
+    if promo <= 0:
+        return base, 0.0, None
+    # непарсибельна дата — вважаємо акцію без дати (як is_promo_active)
+    return base, promo, _int(p.get("promo_until_ts"))
+
+
+class PriceTable:
+    def __init__(self):
+        self._sig: Dict[int, tuple] = {}
+        self._entry: Dict[int, Entry] = {}
+        self._promo: Dict[int, int] = {}      # pid -> позиція в каталозі (для порядку)
+        self._promo_ids: Optional[List[int]] = None
+        self._heap: List[Tuple[int, int]] = []
+        self._pos: Dict[int, int] = {}
+        self._version: Optional[int] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._on_expire: List[Callable[[int], None]] = []
+
+    # ---------- оновлення ----------
+
+    def update(self, p: dict, pos: Optional[int] = None) -> Optional[Entry]:
+        pid = _int(p.get("id")) if isinstance(p, dict) else None
+        if pid is None:
+            return None
+        if pos is not None:
+            self._pos[pid] = pos
+        sig = _sig(p)
+        if self._sig.get(pid) == sig:
+            return self._entry[pid]
+
+        ent = _entry(p)
+        self._sig[pid] = sig
+        self._entry[pid] = ent
+
+        _, promo, until = ent
+        now = int(time.time())
+        if promo > 0 and (until is None or now <= until):
+            if pid not in self._promo:
+                self._promo[pid] = self._pos.get(pid, pid)
+                self._promo_ids = None
+            if until is not None:
+                heapq.heappush(self._heap, (until, pid))
+                if self._wake is not None:
+                    self._wake.set()
+        elif self._promo.pop(pid, None) is not None:
+            self._promo_ids = None
+        return ent
+
+    def remove(self, pid: Any) -> None:
+        pid_i = _int(pid)
+        if pid_i is None:
+            return
+        self._sig.pop(pid_i, None)
+        self._entry.pop(pid_i, None)
+        self._pos.pop(pid_i, None)
+        if self._promo.pop(pid_i, None) is not None:
+            self._promo_ids = None
+
+    def sync(self, d: Dict[str, Any]) -> None:
+        """Звірити з каталогом (тільки якщо версія каталогу змінилась)."""
+        version = catalog_version(d)
+        if version is not None and version == self._version:
+            return
+        if "products" not in d:
+            return  # каталог не завантажений — нема з чим звіряти
+        seen = set()
+        for pos, p in enumerate(d.get("products", []) or []):
+            if not isinstance(p, dict):
+                continue
+            pid = _int(p.get("id"))
+            if pid is None:
+                continue
+            seen.add(pid)
+            if self._pos.get(pid) != pos:
+                self._pos[pid] = pos
+                if pid in self._promo:
+                    self._promo[pid] = pos
+                    self._promo_ids = None
+            self.update(p)
+        for pid in [x for x in self._entry if x not in seen]:
+            self.remove(pid)
+        self._version = version
+
+    # ---------- читання ----------
+
+    def get(self, p: dict) -> Entry:
+        pid = _int(p.get("id"))
+        if pid is not None and self._sig.get(pid) == _sig(p):
+            return self._entry[pid]
+        ent = self.update(p)
+        return ent if ent is not None else _entry(p)
+
+    def is_active(self, p: dict, now_ts: Optional[int] = None) -> bool:
+        _, promo, until = self.get(p)
+        if promo <= 0:
+            return False
+        if until is None:
+            return True
+        return (now_ts if now_ts is not None else int(time.time())) <= until
+
+    def unit_price(self, p: dict, now_ts: Optional[int] = None) -> float:
+        base, promo, until = self.get(p)
+        if promo <= 0:
+            return base
+        if until is None or (now_ts if now_ts is not None else int(time.time())) <= until:
+            return promo
+        return base
+
+    def promo_ids(self, d: Dict[str, Any], now_ts: Optional[int] = None) -> List[int]:
+        """Товари з активною акцією в порядку каталогу (готовий список — не змінювати)."""
+        self.sync(d)
+        self.expire_due(now_ts)
+        if self._promo_ids is None:
+            self._promo_ids = sorted(self._promo, key=lambda pid: (self._promo[pid], pid))
+        return self._promo_ids
+
+    # ---------- завершення акцій ----------
+
+    def on_expire(self, fn: Callable[[int], None]) -> None:
+        self._on_expire.append(fn)
+
+    def expire_due(self, now_ts: Optional[int] = None) -> int:
+        now = now_ts if now_ts is not None else int(time.time())
+        expired = 0
+        while self._heap and self._heap[0][0] < now:
+            until, pid = heapq.heappop(self._heap)
+            ent = self._entry.get(pid)
+            # запис у купі міг застаріти (дату змінили / акцію зняли)
+            if ent is None or ent[2] != until:
+                continue
+            if self._promo.pop(pid, None) is not None:
+                self._promo_ids = None
+                expired += 1
+                for fn in self._on_expire:
+                    fn(pid)
+        if expired:
+            metrics.inc("promo.expired", expired)
+        return expired
+
+    def next_due(self) -> Optional[int]:
+        return self._heap[0][0] if self._heap else None
+
+    async def run_expiry(self) -> None:
+        self._wake = asyncio.Event()
+        while True:
+            due = self.next_due()
+            # акція діє до until включно — прибираємо на наступну секунду
+            sleep_s = MAX_SLEEP_S if due is None else min(MAX_SLEEP_S, max(0.0, due + 1 - time.time()))
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=sleep_s)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                self.expire_due()
+            except Exception:
+                log.exception("promo expiry failed")
+
+
+price_table = PriceTable()
+
+
+def is_active(p: dict, now_ts: Optional[int] = None) -> bool:
+    return price_table.is_active(p, now_ts)
+
+
+def unit_price(p: dict, now_ts: Optional[int] = None) -> float:
+    return price_table.unit_price(p, now_ts)
+
+
+def promo_ids(d: Dict[str, Any], now_ts: Optional[int] = None) -> List[int]:
+    return price_table.promo_ids(d, now_ts)
+
+
+async def run_promo_expiry() -> None:
+    await price_table.run_expiry()
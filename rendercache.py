@@ -0,0 +1,108 @@
+# rendercache.py
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+import metrics
+from config import RENDER_CACHE_MAX_ENTRIES, RENDER_CACHE_MAX_CHARS
+
+
+# =========================================================
+# RENDER CACHE (готовий HTML карток товарів і замовлень)
+#
+# Один на процес, LRU. На сутність ("product"/"order", id) — один запис:
+# (ключ, текст). Ключ — підпис полів, з яких зібрано текст, плюс
+# прапорець "акція діє": змінили товар або акція закінчилась — ключ
+# інший, запис перезапишеться при наступному рендері, тож застарілий
+# текст не віддається навіть без інвалідації.
+# Інвалідація (адмінка після правок, планувальник акцій) просто
+# звільняє місце одразу.
+# Ліміти: кількість записів і сумарна довжина текстів.
+# =========================================================
+
+Slot = Tuple[str, int]
+
+
+def _int(x: Any) -> Optional[int]:
+    try:
+        return int(x)
+    except Exception:
+        return None
+
+
+class RenderCache:
+    def __init__(self, max_entries: int = RENDER_CACHE_MAX_ENTRIES, max_chars: int = RENDER_CACHE_MAX_CHARS):
+        self.max_entries = max(0, int(max_entries))
+        self.max_chars = max(0, int(max_chars))
+        self._lru: "OrderedDict[Slot, Tuple[Any, str]]" = OrderedDict()
+        self._chars = 0
+        self._hits = 0
+        self._misses = 0
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+    def get(self, kind: str, eid: Any, key: Any) -> Optional[str]:
+        slot = (kind, _int(eid))
+        ent = self._lru.get(slot)
+        if ent is not None and ent[0] == key:
+            self._lru.move_to_end(slot)
+            self._hits += 1
+            metrics.inc(f"render_cache.{kind}.hits")
+            self._gauge()
+            return ent[1]
+        self._misses += 1
+        metrics.inc(f"render_cache.{kind}.misses")
+        self._gauge()
+        return None
+
+    def put(self, kind: str, eid: Any, key: Any, text: str) -> str:
+        eid_i = _int(eid)
+        if eid_i is None or not self.max_entries or len(text) > self.max_chars:
+            return text
+        slot = (kind, eid_i)
+        self._drop(slot)
+        self._lru[slot] = (key, text)
+        self._chars += len(text)
+        while self._lru and (len(self._lru) > self.max_entries or self._chars > self.max_chars):
+            _, (_, t) = self._lru.popitem(last=False)
+            self._chars -= len(t)
+            metrics.inc("render_cache.evicted")
+        metrics.set_gauge("render_cache.entries", len(self._lru))
+        return text
+
+    def invalidate(self, kind: str, eid: Any) -> None:
+        if self._drop((kind, _int(eid))):
+            metrics.inc("render_cache.invalidated")
+            metrics.set_gauge("render_cache.entries", len(self._lru))
+
+    def clear(self) -> None:
+        self._lru.clear()
+        self._chars = 0
+        metrics.set_gauge("render_cache.entries", 0)
+
+    def hit_rate(self) -> float:
+        total = self._hits + self._misses
+        return self._hits / total if total else 0.0
+
+    def _drop(self, slot: Slot) -> bool:
+        ent = self._lru.pop(slot, None)
+        if ent is None:
+            return False
+        self._chars -= len(ent[1])
+        return True
+
+    def _gauge(self) -> None:
+        metrics.set_gauge("render_cache.hit_rate", self.hit_rate())
+
+
+render_cache = RenderCache()
+
+
+def invalidate_product(pid: Any) -> None:
+    render_cache.invalidate("product", pid)
+
+
+def invalidate_order(oid: Any) -> None:
+    render_cache.invalidate("order", oid)
@@ -0,0 +1,273 @@
+# sendqueue.py
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+import metrics
+from config import (
+    SEND_RATE,
+    SEND_CHAT_INTERVAL_S,
+    SEND_QUEUE_MAX,
+    SEND_MAX_RETRIES,
+    SEND_BACKOFF_MAX_S,
+    SEND_CONCURRENCY,
+    SEND_DRAIN_S,
+)
+
+log = logging.getLogger(__name__)
+
+
+# =========================================================
+# SEND QUEUE (усі вихідні сповіщення бота — через одну чергу)
+#
+# Хендлер кладе повідомлення в чергу і одразу відповідає користувачу;
+# доставляє фоновий воркер (стартує сам при першому enqueue):
+#   - загальний темп — не більше SEND_RATE повідомлень/с (ліміт Telegram ~30/с);
+#   - в один чат — не частіше за SEND_CHAT_INTERVAL_S;
+#   - смуги пріоритету: відповіді покупцю → персонал → розсилки;
+#   - TelegramRetryAfter — чекаємо retry_after (для цього чату) і повторюємо,
+#     мережеві/5xx — експоненційний backoff; до SEND_MAX_RETRIES спроб;
+#   - у межах чату — по одному: поки повідомлення в дорозі або чекає повтору,
+#     наступні в цей чат відкладені, а повтор зберігає свій seq — тож пізніші
+#     повідомлення його не обганяють;
+#   - решта помилок (бот заблоковано, битий HTML) — повтор не допоможе, відкидаємо.
+# Паралельних запитів до Telegram — не більше SEND_CONCURRENCY (семафор).
+# submit() замість enqueue() — Future з результатом доставки.
+# Лічильники: sendq.queued / sent / retried / dropped, gauge sendq.pending.
+# =========================================================
+
+LANE_REPLY = 0   # покупцю: статус замовлення, ТТН, відповіді
+LANE_STAFF = 1   # персоналу: нові замовлення, оплати
+LANE_BULK = 2    # розсилки ("ціна знизилась")
+
+CHAT_PRUNE_AT = 10000  # скільки чатів тримати в таблиці темпу до чистки
+
+
+class _Job:
+    __slots__ = ("bot", "chat_id", "text", "kwargs", "attempts", "fut", "seq")
+
+    def __init__(self, bot: Bot, chat_id: int, text: str, kwargs: Dict[str, Any]):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.text = text
+        self.kwargs = kwargs
+        self.attempts = 0
+        self.fut: Optional[asyncio.Future] = None
+        self.seq: Optional[int] = None
+
+    def resolve(self, delivered: bool) -> None:
+        if self.fut is not None and not self.fut.done():
+            self.fut.set_result(delivered)
+
+
+class SendQueue:
+    def __init__(
+        self,
+        rate: float = SEND_RATE,
+        chat_interval_s: float = SEND_CHAT_INTERVAL_S,
+        max_pending: int = SEND_QUEUE_MAX,
+        max_retries: int = SEND_MAX_RETRIES,
+        concurrency: int = SEND_CONCURRENCY,
+    ):
+        self.interval_s = 1.0 / rate if rate > 0 else 0.0
+        self.chat_interval_s = max(0.0, float(chat_interval_s))
+        self.max_pending = max(1, int(max_pending))
+        self.max_retries = max(0, int(max_retries))
+        self.concurrency = max(1, int(concurrency))
+
+        self._ready: List[Tuple[int, int, _Job]] = []            # (lane, seq, job)
+        self._delayed: List[Tuple[float, int, int, _Job]] = []   # (due, lane, seq, job)
+        self._seq = itertools.count()
+        self._chat_next: Dict[int, float] = {}
+        self._busy: Dict[int, _Job] = {}                            # чат -> повідомлення в дорозі / на повторі
+        self._parked: Dict[int, List[Tuple[int, int, _Job]]] = {}   # чат -> чекають своєї черги
+        self._next_slot = 0.0
+
+        self._wake: Optional[asyncio.Event] = None
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: Set[asyncio.Task] = set()
+
+    @property
+    def pending(self) -> int:
+        return self._queued() + len(self._inflight)
+
+    def _queued(self) -> int:
+        return len(self._ready) + len(self._delayed) + sum(len(h) for h in self._parked.values())
+
+    # ---------- вхід ----------
+
+    def enqueue(self, bot: Bot, chat_id: int, text: str, *, lane: int = LANE_REPLY, **kwargs) -> bool:
+        """Поставити в чергу (не чекає доставки). False — черга переповнена, відкинуто."""
+        return self._enqueue(_Job(bot, int(chat_id), text, kwargs), lane)
+
+    def submit(self, bot: Bot, chat_id: int, text: str, *, lane: int = LANE_REPLY, **kwargs) -> asyncio.Future:
+        """Як enqueue, але повертає Future: True — доставлено, False — відкинуто."""
+        job = _Job(bot, int(chat_id), text, kwargs)
+        job.fut = asyncio.get_running_loop().create_future()
+        self._enqueue(job, lane)
+        return job.fut
+
+    def _enqueue(self, job: _Job, lane: int) -> bool:
+        if self._queued() >= self.max_pending:
+            metrics.inc("sendq.dropped")
+            metrics.inc("sendq.overflow")
+            log.warning("send queue full, dropping message to %s", job.chat_id)
+            job.resolve(False)
+            return False
+        self._push(lane, job)
+        metrics.inc("sendq.queued")
+        self._start()
+        return True
+
+    def _push(self, lane: int, job: _Job, due: float = 0.0) -> None:
+        if job.seq is None:
+            job.seq = next(self._seq)
+        if due > time.monotonic():
+            heapq.heappush(self._delayed, (due, lane, job.seq, job))
+        else:
+            heapq.heappush(self._ready, (lane, job.seq, job))
+        metrics.set_gauge("sendq.pending", self.pending)
+        if self._wake is not None:
+            self._wake.set()
+
+    def _start(self) -> None:
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._sem = asyncio.Semaphore(self.concurrency)
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    # ---------- воркер ----------
+
+    def _promote(self, now: float) -> None:
+        while self._delayed and self._delayed[0][0] <= now:
+            _, lane, seq, job = heapq.heappop(self._delayed)
+            heapq.heappush(self._ready, (lane, seq, job))
+
+    async def run(self) -> None:
+        assert self._wake is not None and self._sem is not None
+        while True:
+            now = time.monotonic()
+            self._promote(now)
+
+            if not self._ready:
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            lane, seq, job = heapq.heappop(self._ready)
+            owner = self._busy.get(job.chat_id)
+            if owner is not None and owner is not job:
+                # попереднє в цей чат ще не доставлене — чекаємо його
+                heapq.heappush(self._parked.setdefault(job.chat_id, []), (lane, seq, job))
+                continue
+            chat_due = self._chat_next.get(job.chat_id, 0.0)
+            if chat_due > now:
+                # чат ще "остигає" — відкладаємо, порядок у чаті зберігає seq
+                heapq.heappush(self._delayed, (chat_due, lane, seq, job))
+                continue
+
+            if self._next_slot > now:
+                await asyncio.sleep(self._next_slot - now)
+                now = time.monotonic()
+            self._next_slot = max(now, self._next_slot) + self.interval_s
+            self._chat_next[job.chat_id] = now + self.chat_interval_s
+            if len(self._chat_next) > CHAT_PRUNE_AT:
+                self._chat_next = {c: t for c, t in self._chat_next.items() if t > now}
+
+            self._busy[job.chat_id] = job
+            await self._sem.acquire()
+            task = asyncio.create_task(self._deliver(lane, job))
+            self._inflight.add(task)
+            task.add_done_callback(self._done)
+
+    def _done(self, task: asyncio.Task) -> None:
+        self._inflight.discard(task)
+        if self._sem is not None:
+            self._sem.release()
+        metrics.set_gauge("sendq.pending", self.pending)
+
+    async def _deliver(self, lane: int, job: _Job) -> None:
+        try:
+            await job.bot.send_message(job.chat_id, job.text, **job.kwargs)
+            metrics.inc("sendq.sent")
+            self._finish(job, True)
+        except TelegramRetryAfter as e:
+            self._retry(lane, job, float(e.retry_after))
+        except (TelegramNetworkError, TelegramServerError):
+            self._retry(lane, job, min(SEND_BACKOFF_MAX_S, 2.0 ** job.attempts))
+        except Exception as e:
+            metrics.inc("sendq.dropped")
+            log.warning("send to %s dropped: %s", job.chat_id, e)
+            self._finish(job, False)
+
+    def _finish(self, job: _Job, delivered: bool) -> None:
+        # чат вільний — відкладені в нього повідомлення повертаються в чергу зі своїм seq
+        job.resolve(delivered)
+        if self._busy.get(job.chat_id) is job:
+            del self._busy[job.chat_id]
+        for item in self._parked.pop(job.chat_id, []):
+            heapq.heappush(self._ready, item)
+        if self._wake is not None:
+            self._wake.set()
+
+    def _retry(self, lane: int, job: _Job, delay_s: float) -> None:
+        job.attempts += 1
+        if job.attempts > self.max_retries:
+            metrics.inc("sendq.dropped")
+            log.warning("send to %s dropped after %s attempts", job.chat_id, job.attempts)
+            self._finish(job, False)
+            return
+        metrics.inc("sendq.retried")
+        due = time.monotonic() + max(0.0, delay_s)
+        # чат лишається за цим повідомленням (_busy): наступні чекають, поки повтор не пройде
+        self._chat_next[job.chat_id] = max(self._chat_next.get(job.chat_id, 0.0), due)
+        self._push(lane, job, due)
+
+    # ---------- shutdown ----------
+
+    async def close(self, timeout_s: float = SEND_DRAIN_S) -> None:
+        """Shutdown: даємо черзі дописатись (не довше timeout_s), далі — зупиняємо."""
+        deadline = time.monotonic() + max(0.0, timeout_s)
+        while self.pending and self._task is not None and not self._task.done() and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._task is not None:
+            self._task.cancel()
+        if self._inflight:
+            await asyncio.gather(*list(self._inflight), return_exceptions=True)
+
+        left = self._ready + self._delayed + [item for h in self._parked.values() for item in h]
+        self._ready, self._delayed, self._parked = [], [], {}
+        self._busy = {}
+        for item in left:
+            item[-1].resolve(False)
+        if left:
+            metrics.inc("sendq.dropped", len(left))
+            log.warning("send queue closed with %s undelivered messages", len(left))
+
+
+send_queue = SendQueue()
+
+
+def enqueue(bot: Bot, chat_id: int, text: str, *, lane: int = LANE_REPLY, **kwargs) -> bool:
+    return send_queue.enqueue(bot, chat_id, text, lane=lane, **kwargs)
+
+
+def submit(bot: Bot, chat_id: int, text: str, *, lane: int = LANE_REPLY, **kwargs) -> asyncio.Future:
+    return send_queue.submit(bot, chat_id, text, lane=lane, **kwargs)
+
+
+async def close_send_queue() -> None:
+    await send_queue.close()
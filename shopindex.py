@@ -0,0 +1,287 @@
+# shopindex.py
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+
+
+# =========================================================
+# SHOP INDEX (O(1) пошук товару по id / SKU / штрихкоду)
+# ORDER INDEX (замовлення по id, по покупцю і по статусу)
+#
+# Будується один раз на завантажений стан (лінивo, при першому пошуку)
+# і перебудовується сам, якщо список товарів замінили / додали / видалили.
+# Якщо товар відредагували на місці (sku/barcode/id) — знайдений запис
+# не пройде перевірку і індекс теж перебудується. Після масових правок
+# можна явно викликати reindex(d).
+# =========================================================
+
+def _int(x: Any) -> Optional[int]:
+    try:
+        return int(x)
+    except Exception:
+        return None
+
+
+class ShopIndex:
+    __slots__ = ("by_id", "by_sku", "by_barcode", "_products", "_size")
+
+    def __init__(self, products: List[dict]):
+        self._products = products
+        self._size = len(products)
+        self.by_id: Dict[int, dict] = {}
+        self.by_sku: Dict[str, dict] = {}
+        self.by_barcode: Dict[str, dict] = {}
+
+        for p in products:
+            if not isinstance(p, dict):
+                continue
+            pid = _int(p.get("id"))
+            if pid is None:
+                continue
+            # як у лінійному пошуку: при дублях перемагає перший
+            self.by_id.setdefault(pid, p)
+            sku = (p.get("sku") or "").strip()
+            if sku:
+                self.by_sku.setdefault(sku, p)
+            bc = (p.get("barcode") or "").strip()
+            if bc:
+                self.by_barcode.setdefault(bc, p)
+
+    def fresh_for(self, products: List[dict]) -> bool:
+        return self._products is products and self._size == len(products)
+
+
+def _ts(o: dict) -> int:
+    try:
+        return int(o.get("created_ts", 0) or 0)
+    except Exception:
+        return 0
+
+
+def _status(o: dict) -> str:
+    return (o.get("status") or "").strip().lower()
+
+
+class OrderIndex:
+    """
+    by_id: oid -> order; by_user: uid -> замовлення, новіші першими
+    (як стабільний sort по created_ts, reverse=True);
+    by_status: status -> {oid: order} (впорядкована множина).
+    """
+    __slots__ = ("by_id", "by_user", "by_status", "_status_of", "_orders", "_size")
+
+    def __init__(self, orders: List[dict]):
+        self._orders = orders
+        self._size = len(orders)
+        self.by_id: Dict[int, dict] = {}
+        self.by_user: Dict[int, List[dict]] = {}
+        self.by_status: Dict[str, Dict[int, dict]] = {}
+        self._status_of: Dict[int, str] = {}
+
+        for o in orders:
+            self._add(o)
+        for arr in self.by_user.values():
+            arr.sort(key=_ts, reverse=True)
+
+    def _add(self, o: Any) -> Optional[int]:
+        if not isinstance(o, dict):
+            return None
+        oid = _int(o.get("id"))
+        if oid is not None and oid not in self.by_id:
+            self.by_id[oid] = o
+            st = _status(o)
+            self.by_status.setdefault(st, {})[oid] = o
+            self._status_of[oid] = st
+        uid = _int(o.get("user_id"))
+        if uid is None:
+            return None
+        self.by_user.setdefault(uid, []).append(o)
+        return uid
+
+    def added(self, o: dict) -> None:
+        """Інкрементально: o щойно дописано в кінець списку замовлень."""
+        uid = self._add(o)
+        self._size += 1
+        if uid is None:
+            return
+        arr = self.by_user[uid]
+        arr.pop()
+        ts = _ts(o)
+        pos = 0
+        while pos < len(arr) and _ts(arr[pos]) >= ts:
+            pos += 1
+        arr.insert(pos, o)
+
+    def moved(self, o: dict) -> None:
+        """Статус замовлення змінився — переносимо між множинами."""
+        oid = _int(o.get("id"))
+        if oid is None or self.by_id.get(oid) is not o:
+            return
+        new = _status(o)
+        old = self._status_of.get(oid)
+        if old == new:
+            return
+        if old is not None:
+            bucket = self.by_status.get(old)
+            if bucket is not None:
+                bucket.pop(oid, None)
+                if not bucket:
+                    self.by_status.pop(old, None)
+        self.by_status.setdefault(new, {})[oid] = o
+        self._status_of[oid] = new
+
+    def fresh_for(self, orders: List[dict]) -> bool:
+        return self._orders is orders and self._size == len(orders)
+
+
+# останній індекс кожного виду на процес. Секції з кешу стану (load_data(..., writes=()))
+# — ті самі списки від запиту до запиту, тож індекс живе, поки живе список
+# (fresh_for: той самий обʼєкт і та сама довжина), і не перебудовується на кожен тап.
+_last: Dict[str, Any] = {}
+
+
+def _list(d: Dict[str, Any], key: str) -> List[dict]:
+    arr = d.get(key)
+    if not isinstance(arr, list):
+        arr = []
+        d[key] = arr
+    return arr
+
+
+def _store(d: Dict[str, Any], attr: str, idx: Any) -> None:
+    try:
+        setattr(d, attr, idx)  # ShopState
+    except AttributeError:
+        pass
+    _last[attr] = idx
+
+
+def _cached(d: Dict[str, Any], attr: str, arr: List[dict]) -> Any:
+    for idx in (getattr(d, attr, None), _last.get(attr)):
+        if idx is not None and idx.fresh_for(arr):
+            return idx
+    return None
+
+
+def _products(d: Dict[str, Any]) -> List[dict]:
+    return _list(d, "products")
+
+
+def reindex(d: Dict[str, Any]) -> ShopIndex:
+    idx = ShopIndex(_products(d))
+    _store(d, "_shop_index", idx)
+    return idx
+
+
+def get_index(d: Dict[str, Any]) -> ShopIndex:
+    return _cached(d, "_shop_index", _products(d)) or reindex(d)
+
+
+def get_order_index(d: Dict[str, Any]) -> OrderIndex:
+    orders = _list(d, "orders")
+    idx = _cached(d, "_order_index", orders)
+    if idx is None:
+        idx = OrderIndex(orders)
+        _store(d, "_order_index", idx)
+    return idx
+
+
+def by_id(d: Dict[str, Any], pid: Any) -> Optional[dict]:
+    pid_i = _int(pid)
+    if pid_i is None:
+        return None
+    p = get_index(d).by_id.get(pid_i)
+    if p is not None and _int(p.get("id")) != pid_i:
+        p = reindex(d).by_id.get(pid_i)
+    return p
+
+
+def by_sku(d: Dict[str, Any], sku: str) -> Optional[dict]:
+    sku = (sku or "").strip()
+    if not sku:
+        return None
+    p = get_index(d).by_sku.get(sku)
+    if p is None or (p.get("sku") or "").strip() != sku:
+        # SKU міг зʼявитись/змінитись правкою на місці
+        p = reindex(d).by_sku.get(sku)
+    return p
+
+
+def by_barcode(d: Dict[str, Any], barcode: str) -> Optional[dict]:
+    barcode = (barcode or "").strip()
+    if not barcode:
+        return None
+    p = get_index(d).by_barcode.get(barcode)
+    if p is None or (p.get("barcode") or "").strip() != barcode:
+        p = reindex(d).by_barcode.get(barcode)
+    return p
+
+
+# ---------------- orders ----------------
+
+def order_by_id(d: Dict[str, Any], oid: Any) -> Optional[dict]:
+    oid_i = _int(oid)
+    if oid_i is None:
+        return None
+    o = get_order_index(d).by_id.get(oid_i)
+    if o is not None and _int(o.get("id")) != oid_i:
+        return None
+    return o
+
+
+def orders_of_user(d: Dict[str, Any], uid: Any) -> List[dict]:
+    """Замовлення покупця, новіші першими (копія списку — можна різати)."""
+    uid_i = _int(uid)
+    if uid_i is None:
+        return []
+    return list(get_order_index(d).by_user.get(uid_i, ()))
+
+
+def orders_count_of_user(d: Dict[str, Any], uid: Any) -> int:
+    uid_i = _int(uid)
+    if uid_i is None:
+        return 0
+    return len(get_order_index(d).by_user.get(uid_i, ()))
+
+
+def order_added(d: Dict[str, Any], o: dict) -> None:
+    """
+    Викликати одразу після d["orders"].append(o): індекс (якщо вже
+    побудований) оновиться без повного перебору.
+    """
+    orders = _list(d, "orders")
+    for idx in (getattr(d, "_order_index", None), _last.get("_order_index")):
+        if idx is not None and idx._orders is orders and idx._size == len(orders) - 1 and orders and orders[-1] is o:
+            idx.added(o)
+            return
+
+
+def order_status_changed(d: Dict[str, Any], o: dict) -> None:
+    """
+    Викликати після зміни o["status"] (order_set_status і оплата роблять це самі).
+    Якщо індекс ще не побудований — нічого не робимо, він збереться з актуальних даних.
+    """
+    orders = _list(d, "orders")
+    idx = _cached(d, "_order_index", orders)
+    if idx is not None:
+        idx.moved(o)
+
+
+def orders_by_status(d: Dict[str, Any], statuses: Any, *, newest_first: bool = False) -> List[dict]:
+    """
+    Замовлення з будь-яким зі статусів, відсортовані по created_ts.
+    Вартість — O(k log k) від кількості знайдених, а не від усіх замовлень.
+    """
+    if isinstance(statuses, str):
+        statuses = (statuses,)
+    idx = get_order_index(d)
+    out: List[dict] = []
+    for st in statuses:
+        out.extend(idx.by_status.get((st or "").strip().lower(), {}).values())
+    out.sort(key=_ts, reverse=newest_first)
+    return out
+
+
+def status_counts(d: Dict[str, Any]) -> Dict[str, int]:
+    """Лічильники черг (для бейджів у панелі) — без перебору замовлень."""
+    return {st: len(bucket) for st, bucket in get_order_index(d).by_status.items()}
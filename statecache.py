@@ -0,0 +1,97 @@
+# statecache.py
+from __future__ import annotations
+
+import copy
+from typing import Any, Dict, FrozenSet, Optional
+
+import metrics
+from storage import SECTIONS, TABLE_KEYS, ShopState, section_snapshot_keys
+
+
+# =========================================================
+# STATE CACHE (стан у памʼяті процесу, інвалідація по версії)
+#
+# Кеш тримає останній прочитаний/записаний стан по секціях разом
+# із версією рядка kv_store. Якщо версія в БД та сама — секції віддаються
+# з памʼяті. Копіюються (deepcopy) лише шапка і ті секції, які викликач
+# збирається міняти (writes); решта віддається спільною, тільки для читання.
+# Інша репліка записала → версія виросла → кеш скидається.
+# =========================================================
+
+class StateCache:
+    def __init__(self):
+        self.version: Optional[int] = None
+        self.header: Dict[str, Any] = {}
+        self.parts: Dict[str, Dict[str, Any]] = {}   # section -> {state key: value}
+        self.snap: Dict[str, Any] = {}               # ключ знімка -> відбитки
+
+    @property
+    def sections(self) -> FrozenSet[str]:
+        return frozenset(self.parts.keys())
+
+    def clear(self) -> None:
+        self.version = None
+        self.header = {}
+        self.parts = {}
+        self.snap = {}
+
+    def get(
+        self,
+        version: int,
+        sections: FrozenSet[str],
+        writes: Optional[FrozenSet[str]] = None,
+    ) -> Optional[ShopState]:
+        """
+        writes — секції, які викликач мутуватиме (None = усі запитані).
+        Інші секції — ті самі обʼєкти, що й у кеші: їх НЕ можна змінювати.
+        """
+        if self.version != version or not sections <= self.sections:
+            metrics.inc("shop.cache.misses")
+            return None
+
+        metrics.inc("shop.cache.hits")
+        writes = sections if writes is None else writes & sections
+        d = ShopState(copy.deepcopy(self.header))
+        for sec in sections:
+            part = self.parts[sec]
+            d.update(copy.deepcopy(part) if sec in writes else part)
+
+        snap = {k: self.snap[k] for k in section_snapshot_keys(sections)}
+        snap["header"] = self.snap.get("header")
+        d.snapshot = snap
+        d.version = version
+        d.sections = sections
+        return d
+
+    def put(self, d: ShopState, prev_version: Optional[int] = None) -> None:
+        """
+        Кладе в кеш щойно прочитаний (prev_version=None) або записаний стан.
+        Після запису решта секцій кешу валідна лише якщо між нашим load і save
+        ніхто не писав (версія виросла рівно на 1).
+        """
+        version = getattr(d, "version", None)
+        snap = getattr(d, "snapshot", None)
+        if version is None or snap is None:
+            return
+
+        if prev_version is None:
+            keep = self.version == version
+        else:
+            keep = self.version == prev_version and version == int(prev_version) + 1
+        if not keep:
+            self.clear()
+
+        secs = getattr(d, "sections", frozenset())
+        self.version = version
+        self.header = copy.deepcopy({k: v for k, v in d.items() if k not in TABLE_KEYS})
+        self.snap["header"] = snap.get("header")
+        for sec in secs:
+            keys, _ = SECTIONS[sec]
+            part = {k: d[k] for k in keys if k in d}
+            old = self.parts.get(sec)
+            if old is not None and old.keys() == part.keys() and all(old[k] is v for k, v in part.items()):
+                continue  # секцію віддали спільною і не чіпали — копіювати нема чого
+            self.parts[sec] = copy.deepcopy(part)
+        for k in section_snapshot_keys(secs):
+            if k in snap:
+                self.snap[k] = snap[k]
@@ -38,4 +38,8 @@ class OrderFSM(StatesGroup):
     comment = State()
 
     # ✅ нове: вибір оплати (повна / передплата 200)
-    pay_method = State()
\ No newline at end of file
+    pay_method = State()
+
+
+class SearchFSM(StatesGroup):
+    query = State()
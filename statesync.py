@@ -0,0 +1,116 @@
+# statesync.py
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Callable, Optional
+
+from sqlalchemy import select
+
+import metrics
+from config import SHOP_STATE_KEY, SHOP_NOTIFY_CHANNEL, SHOP_SYNC_POLL_S
+from db import engine
+from models import KVStore
+
+log = logging.getLogger(__name__)
+
+
+# =========================================================
+# STATE SYNC (кілька процесів бота на одній БД)
+#
+# save_state() робить NOTIFY shop_state_changed '<version>'.
+# Тут — фоновий LISTEN: кожна нова версія → on_version(v),
+# а data.py скидає кеш стану. Поки LISTEN живий, load_data()
+# навіть не питає версію в БД (watch.live).
+# Якщо зʼєднання впало — опитуємо версію раз на SHOP_SYNC_POLL_S
+# і пробуємо перепідписатись.
+# =========================================================
+
+class VersionWatch:
+    def __init__(self):
+        self.known: Optional[int] = None
+        self.live = False
+
+    def seen(self, version: int) -> bool:
+        """True, якщо версія нова для цього процесу."""
+        v = int(version)
+        if self.known is not None and v <= self.known:
+            return False
+        self.known = v
+        return True
+
+    def reset(self) -> None:
+        self.known = None
+
+
+watch = VersionWatch()
+
+
+async def _poll_version(conn) -> int:
+    res = await conn.execute(select(KVStore.version).where(KVStore.key == SHOP_STATE_KEY))
+    return int(res.scalar_one_or_none() or 0)
+
+
+def _deliver(on_version: Callable[[int], None], version: int) -> None:
+    if watch.seen(version):
+        try:
+            on_version(version)
+        except Exception:
+            log.exception("state sync callback failed")
+
+
+async def _listen(on_version: Callable[[int], None]) -> None:
+    async with engine.connect() as conn:
+        raw = await conn.get_raw_connection()
+        apg = raw.driver_connection  # asyncpg.Connection
+
+        def _on_notify(_conn, _pid, _channel, payload):
+            metrics.inc("shop.sync.notifies")
+            try:
+                _deliver(on_version, int(payload))
+            except ValueError:
+                pass
+
+        await apg.add_listener(SHOP_NOTIFY_CHANNEL, _on_notify)
+        try:
+            # могли пропустити NOTIFY, поки не слухали — звіряємось одразу
+            _deliver(on_version, await _poll_version(conn))
+            await conn.commit()
+
+            watch.live = True
+            metrics.inc("shop.sync.listen_started")
+            while not apg.is_closed():
+                await asyncio.sleep(SHOP_SYNC_POLL_S)
+                # keepalive + підстраховка на випадок загубленого NOTIFY
+                _deliver(on_version, await _poll_version(conn))
+                await conn.commit()
+        finally:
+            watch.live = False
+            if not apg.is_closed():
+                await apg.remove_listener(SHOP_NOTIFY_CHANNEL, _on_notify)
+
+
+async def run_state_sync(on_version: Callable[[int], None]) -> None:
+    """
+    Фонова задача (стартує з main.main()). Не завершується сама.
+    """
+    while True:
+        try:
+            await _listen(on_version)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            metrics.inc("shop.sync.listen_errors")
+            log.warning("shop state LISTEN dropped, falling back to polling", exc_info=True)
+
+        watch.live = False
+        # запасний режим: опитування версії до наступної спроби LISTEN
+        try:
+            async with engine.connect() as conn:
+                _deliver(on_version, await _poll_version(conn))
+            metrics.inc("shop.sync.polls")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            metrics.inc("shop.sync.poll_errors")
+        await asyncio.sleep(SHOP_SYNC_POLL_S)
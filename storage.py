@@ -0,0 +1,813 @@
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select, delete, update, tuple_, func, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import catalogids
+import jsoncodec
+import metrics
+from config import SHOP_STATE_KEY, SHOP_NOTIFY_CHANNEL
+from models import (
+    KVStore,
+    ShopCategory,
+    ShopSubcategory,
+    ShopProduct,
+    ShopCartItem,
+    ShopFavorite,
+    ShopOrder,
+    ShopOrderItem,
+    ShopUser,
+    ShopAudit,
+    ORDER_ID_SEQ,
+    PRODUCT_ID_SEQ,
+)
+
+
+# =========================================================
+# DATA-ACCESS LAYER (реляційні таблиці ⇄ dict стану)
+#
+# load_state() збирає звичний dict (як раніше лежав у kv_store),
+# save_state() порівнює його зі знімком на момент завантаження
+# і пише ТІЛЬКИ змінені/нові рядки + видаляє зниклі.
+# Ключі, що не мають своєї таблиці (hits, managers, roles, user_tags, ...),
+# лежать у kv_store[SHOP_STATE_KEY] ("header").
+# =========================================================
+
+# ключі стану, що живуть у власних таблицях
+TABLE_KEYS = ("categories", "products", "carts", "favorites", "orders", "users", "audit")
+
+# =========================================================
+# SECTIONS (домени стану)
+# Хендлер вантажить тільки потрібні секції: перегляд каталогу не читає
+# замовлення, клік "в кошик" не пересеріалізовує аудит.
+# header (managers/roles/hits/user_tags) — маленький, вантажиться завжди.
+# section -> (ключі стану, rowsets)
+# =========================================================
+
+SECTIONS: Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...]]] = {
+    "catalog": (("categories", "products"), ("categories", "subcategories", "products")),
+    "carts": (("carts",), ("cart_items",)),
+    "favorites": (("favorites",), ("favorites",)),
+    "orders": (("orders",), ("orders", "order_items")),
+    "users": (("users",), ("users",)),
+    "audit": (("audit",), ()),
+}
+
+ALL_SECTIONS: FrozenSet[str] = frozenset(SECTIONS.keys())
+
+
+def norm_sections(sections: Optional[Sequence[str]]) -> FrozenSet[str]:
+    """None = усі секції. Невідома назва — помилка (щоб не мовчати про одруківку)."""
+    if sections is None:
+        return ALL_SECTIONS
+    out = frozenset(sections)
+    unknown = out - ALL_SECTIONS
+    if unknown:
+        raise ValueError(f"unknown shop sections: {sorted(unknown)}")
+    return out
+
+
+def _rowsets_of(sections: FrozenSet[str]) -> List[str]:
+    names = {rs for sec in sections for rs in SECTIONS[sec][1]}
+    return [name for name in ROWSETS.keys() if name in names]
+
+UPSERT_CHUNK = 500
+DELETE_CHUNK = 1000
+
+
+class ShopState(dict):
+    """
+    dict стану магазину + знімок рядків, з яких його зібрано.
+    Знімок потрібен save_state(), щоб писати лише змінене.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.snapshot: Optional[Dict[str, Any]] = None
+        self.version: Optional[int] = None
+        # які секції завантажені (тільки їх save_state і пише)
+        self.sections: FrozenSet[str] = ALL_SECTIONS
+
+
+class ShopConflict(RuntimeError):
+    """Стан змінився між load і save (compare-and-swap не пройшов)."""
+
+
+def _fp(v: Any) -> str:
+    # відбиток рядка для порівняння "було/стало"
+    return jsoncodec.dumps_sorted(v)
+
+
+def _int(x: Any) -> Optional[int]:
+    try:
+        return int(x)
+    except Exception:
+        return None
+
+
+def _chunks(seq: List[Any], n: int) -> Iterable[List[Any]]:
+    for i in range(0, len(seq), n):
+        yield seq[i:i + n]
+
+
+# =========================================================
+# STATE → ROWS
+# кожен builder повертає {pk_tuple: {column: value}}
+# =========================================================
+
+def _rows_categories(d: Dict[str, Any]) -> Dict[tuple, dict]:
+    out: Dict[tuple, dict] = {}
+    for pos, cat in enumerate((d.get("categories") or {}).keys()):
+        out[(str(cat),)] = {"name": str(cat), "position": pos}
+    return out
+
+
+def _rows_subcategories(d: Dict[str, Any]) -> Dict[tuple, dict]:
+    out: Dict[tuple, dict] = {}
+    for cat, subs in (d.get("categories") or {}).items():
+        if not isinstance(subs, dict):
+            continue
+        for pos, (sub, arr) in enumerate(subs.items()):
+            pids = []
+            for x in (arr if isinstance(arr, list) else []):
+                pid = _int(x.get("id") if isinstance(x, dict) else x)
+                if pid is not None:
+                    pids.append(pid)
+            out[(str(cat), str(sub))] = {
+                "category": str(cat),
+                "name": str(sub),
+                "position": pos,
+                "product_ids": pids,
+            }
+    return out
+
+
+def _rows_products(d: Dict[str, Any]) -> Dict[tuple, dict]:
+    out: Dict[tuple, dict] = {}
+    for p in (d.get("products") or []):
+        if not isinstance(p, dict):
+            continue
+        pid = _int(p.get("id"))
+        if pid is None:
+            continue
+        out[(pid,)] = {
+            "id": pid,
+            "sku": str(p.get("sku") or ""),
+            "barcode": str(p.get("barcode") or ""),
+            "category": str(p.get("category") or ""),
+            "sub_category": str(p.get("sub_category", p.get("subcategory", "")) or ""),
+            "data": p,
+        }
+    return out
+
+
+def _rows_cart_items(d: Dict[str, Any]) -> Dict[tuple, dict]:
+    out: Dict[tuple, dict] = {}
+    for uid_str, cart in (d.get("carts") or {}).items():
+        uid = _int(uid_str)
+        if uid is None:
+            continue
+
+        qtys: Dict[int, int] = {}
+        if isinstance(cart, list):
+            # старий формат: [pid, pid, ...]
+            for x in cart:
+                pid = _int(x)
+                if pid is not None:
+                    qtys[pid] = qtys.get(pid, 0) + 1
+        elif isinstance(cart, dict):
+            for k, v in cart.items():
+                pid, qty = _int(k), _int(v)
+                if pid is not None and qty is not None and qty > 0:
+                    qtys[pid] = qty
+
+        for pid, qty in qtys.items():
+            out[(uid, pid)] = {"user_id": uid, "product_id": pid, "qty": qty}
+    return out
+
+
+def _rows_favorites(d: Dict[str, Any]) -> Dict[tuple, dict]:
+    out: Dict[tuple, dict] = {}
+    for uid_str, favs in (d.get("favorites") or {}).items():
+        uid = _int(uid_str)
+        if uid is None or not isinstance(favs, list):
+            continue
+        for x in favs:
+            pid = _int(x)
+            if pid is not None:
+                out[(uid, pid)] = {"user_id": uid, "product_id": pid}
+    return out
+
+
+def _rows_orders(d: Dict[str, Any]) -> Dict[tuple, dict]:
+    out: Dict[tuple, dict] = {}
+    for o in (d.get("orders") or []):
+        if not isinstance(o, dict):
+            continue
+        oid = _int(o.get("id"))
+        if oid is None:
+            continue
+        try:
+            total = float(o.get("total", 0) or 0)
+        except Exception:
+            total = 0.0
+        out[(oid,)] = {
+            "id": oid,
+            "user_id": _int(o.get("user_id")) or 0,
+            "status": str(o.get("status") or "")[:32],
+            "total": total,
+            "created_ts": _int(o.get("created_ts")) or 0,
+            "data": {k: v for k, v in o.items() if k != "items"},
+        }
+    return out
+
+
+def _rows_order_items(d: Dict[str, Any]) -> Dict[tuple, dict]:
+    out: Dict[tuple, dict] = {}
+    for o in (d.get("orders") or []):
+        if not isinstance(o, dict):
+            continue
+        oid = _int(o.get("id"))
+        if oid is None:
+            continue
+        for pos, it in enumerate(o.get("items") or []):
+            if isinstance(it, dict):
+                pid = _int(it.get("pid"))
+                qty = _int(it.get("qty", 1)) or 1
+            else:
+                pid = _int(it)
+                qty = 1
+            out[(oid, pos)] = {
+                "order_id": oid,
+                "position": pos,
+                "product_id": pid,
+                "qty": qty,
+                "data": it,
+            }
+    return out
+
+
+def _rows_users(d: Dict[str, Any]) -> Dict[tuple, dict]:
+    out: Dict[tuple, dict] = {}
+    for uid_str, u in (d.get("users") or {}).items():
+        uid = _int(uid_str)
+        if uid is None or not isinstance(u, dict):
+            continue
+        out[(uid,)] = {
+            "id": uid,
+            "username": str(u.get("username") or ""),
+            "full_name": str(u.get("full_name") or ""),
+            "last_seen_ts": _int(u.get("last_seen_ts")) or 0,
+            "data": u,
+        }
+    return out
+
+
+# name -> (model, pk columns, builder)
+ROWSETS: Dict[str, Tuple[Any, Tuple[str, ...], Callable[[Dict[str, Any]], Dict[tuple, dict]]]] = {
+    "categories": (ShopCategory, ("name",), _rows_categories),
+    "subcategories": (ShopSubcategory, ("category", "name"), _rows_subcategories),
+    "products": (ShopProduct, ("id",), _rows_products),
+    "cart_items": (ShopCartItem, ("user_id", "product_id"), _rows_cart_items),
+    "favorites": (ShopFavorite, ("user_id", "product_id"), _rows_favorites),
+    "orders": (ShopOrder, ("id",), _rows_orders),
+    "order_items": (ShopOrderItem, ("order_id", "position"), _rows_order_items),
+    "users": (ShopUser, ("id",), _rows_users),
+}
+
+
+def _header(d: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in d.items() if k not in TABLE_KEYS}
+
+
+def _header_fps(header: Dict[str, Any]) -> Dict[str, str]:
+    # відбиток по кожному ключу заголовка — щоб писати лише змінені ключі
+    return {k: _fp(v) for k, v in header.items()}
+
+
+def _header_diff(
+    fps: Dict[str, str],
+    old: Optional[Dict[str, str]],
+) -> Tuple[List[str], List[str]]:
+    """(змінені/нові ключі, видалені ключі) відносно знімка."""
+    if old is None:
+        return list(fps.keys()), []
+    changed = [k for k, fp in fps.items() if old.get(k) != fp]
+    removed = [k for k in old.keys() if k not in fps]
+    return changed, removed
+
+
+def _audit_entries(d: Dict[str, Any]) -> List[dict]:
+    return [e for e in (d.get("audit") or []) if isinstance(e, dict)]
+
+
+def make_snapshot(
+    d: Dict[str, Any],
+    audit_ids: Optional[List[int]] = None,
+    sections: FrozenSet[str] = ALL_SECTIONS,
+) -> Dict[str, Any]:
+    snap: Dict[str, Any] = {}
+    for name in _rowsets_of(sections):
+        _, _, build = ROWSETS[name]
+        snap[name] = {pk: _fp(row) for pk, row in build(d).items()}
+
+    if "audit" in sections:
+        entries = _audit_entries(d)
+        ids = audit_ids if audit_ids is not None else [0] * len(entries)
+        snap["audit"] = [(aid, _fp(e)) for aid, e in zip(ids, entries)]
+
+    snap["header"] = _header_fps(_header(d))
+    return snap
+
+
+# =========================================================
+# LOW-LEVEL WRITES
+# =========================================================
+
+async def _upsert(session: AsyncSession, model, pk: Tuple[str, ...], rows: List[dict]) -> None:
+    for chunk in _chunks(rows, UPSERT_CHUNK):
+        stmt = insert(model).values(chunk)
+        cols = {c: stmt.excluded[c] for c in chunk[0].keys() if c not in pk}
+        if cols:
+            stmt = stmt.on_conflict_do_update(index_elements=list(pk), set_=cols)
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=list(pk))
+        await session.execute(stmt)
+
+
+async def _delete_keys(session: AsyncSession, model, pk: Tuple[str, ...], keys: List[tuple]) -> None:
+    cols = [getattr(model, c) for c in pk]
+    for chunk in _chunks(keys, DELETE_CHUNK):
+        if len(cols) == 1:
+            cond = cols[0].in_([k[0] for k in chunk])
+        else:
+            cond = tuple_(*cols).in_(chunk)
+        await session.execute(delete(model).where(cond))
+
+
+def _plan_rowset(
+    name: str,
+    d: Dict[str, Any],
+    old: Optional[Dict[tuple, str]],
+) -> Tuple[Dict[tuple, str], List[dict], List[tuple]]:
+    """
+    Повертає (нові відбитки, рядки на upsert, ключі на delete).
+    old=None — знімка нема, таблицю треба замінити повністю.
+    """
+    _, _, build = ROWSETS[name]
+    rows = build(d)
+    fps = {key: _fp(row) for key, row in rows.items()}
+
+    if old is None:
+        return fps, list(rows.values()), []
+
+    changed = [rows[key] for key, fp in fps.items() if old.get(key) != fp]
+    removed = [key for key in old.keys() if key not in fps]
+    return fps, changed, removed
+
+
+def _audit_overlap(old_fps: List[str], new_fps: List[str]) -> int:
+    """
+    Аудит лише дописується в кінець і обрізається з голови.
+    Повертає k: скільки найстаріших записів зникло (old[k:] == new[:len(old)-k]).
+    """
+    if not new_fps:
+        return len(old_fps)
+    for k in range(len(old_fps) + 1):
+        tail = old_fps[k:]
+        if tail and tail[0] != new_fps[0]:
+            continue
+        if new_fps[:len(tail)] == tail:
+            return k
+    return len(old_fps)
+
+
+async def _insert_audit(session: AsyncSession, entries: List[dict]) -> List[int]:
+    ids: List[int] = []
+    for chunk in _chunks(entries, UPSERT_CHUNK):
+        rows = [{
+            "ts": _int(e.get("ts")) or 0,
+            "actor_id": _int(e.get("actor_id")) or 0,
+            "action": str(e.get("action") or ""),
+            "data": e,
+        } for e in chunk]
+        res = await session.execute(insert(ShopAudit).values(rows).returning(ShopAudit.id))
+        ids.extend(int(x) for x in res.scalars().all())
+    return ids
+
+
+async def _write_header(
+    session: AsyncSession,
+    header: Dict[str, Any],
+    changed: Optional[List[str]] = None,
+    removed: Sequence[str] = (),
+) -> None:
+    """
+    changed=None — заголовок цілком (повна заміна стану).
+    Інакше read-modify-write: до поточного value накладаємо лише свої
+    змінені/видалені ключі. Рядок уже заблоковано оновленням версії,
+    тож паралельні записи різних ключів (ролі, хіти, catalog_ids) не губляться.
+    """
+    if changed is None:
+        value = header
+    else:
+        res = await session.execute(select(KVStore.value).where(KVStore.key == SHOP_STATE_KEY))
+        cur = res.scalar_one_or_none()
+        value = {k: v for k, v in (cur if isinstance(cur, dict) else {}).items() if k not in TABLE_KEYS}
+        for k in removed:
+            value.pop(k, None)
+        for k in changed:
+            value[k] = header[k]
+    await session.execute(
+        update(KVStore).where(KVStore.key == SHOP_STATE_KEY).values(value=value)
+    )
+
+
+async def _bump_version(session: AsyncSession, expected: Optional[int]) -> Optional[int]:
+    """
+    Атомарно збільшує версію стану.
+    expected=None — без перевірки (сліпий запис).
+    Інакше — compare-and-swap: None, якщо хтось встиг записати раніше.
+    """
+    if expected is None:
+        stmt = insert(KVStore).values(key=SHOP_STATE_KEY, value={}, version=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[KVStore.key],
+            set_={"version": KVStore.version + 1},
+        ).returning(KVStore.version)
+        res = await session.execute(stmt)
+        return int(res.scalar_one())
+
+    res = await session.execute(
+        update(KVStore)
+        .where(KVStore.key == SHOP_STATE_KEY, KVStore.version == int(expected))
+        .values(version=KVStore.version + 1)
+        .returning(KVStore.version)
+    )
+    v = res.scalar_one_or_none()
+    if v is not None:
+        return int(v)
+
+    if int(expected) == 0:
+        # рядка ще нема — перший запис
+        stmt = insert(KVStore).values(key=SHOP_STATE_KEY, value={}, version=1)
+        stmt = stmt.on_conflict_do_nothing(index_elements=[KVStore.key]).returning(KVStore.version)
+        res = await session.execute(stmt)
+        v = res.scalar_one_or_none()
+        if v is not None:
+            return int(v)
+
+    return None
+
+
+# =========================================================
+# PUBLIC API
+# =========================================================
+
+async def read_version(session: AsyncSession) -> int:
+    """Поточна версія стану (один PK-lookup, без даних)."""
+    res = await session.execute(select(KVStore.version).where(KVStore.key == SHOP_STATE_KEY))
+    v = res.scalar_one_or_none()
+    return int(v or 0)
+
+
+def section_snapshot_keys(sections: FrozenSet[str]) -> List[str]:
+    """Ключі знімка, що належать секціям (без header)."""
+    keys = _rowsets_of(sections)
+    if "audit" in sections:
+        keys.append("audit")
+    return keys
+
+
+async def lock_state(session: AsyncSession) -> KVStore:
+    """
+    SELECT ... FOR UPDATE на рядок стану: до кінця транзакції
+    інші записувачі (усі вони бампають version цього рядка) чекають.
+    """
+    stmt = insert(KVStore).values(key=SHOP_STATE_KEY, value={}, version=0)
+    await session.execute(stmt.on_conflict_do_nothing(index_elements=[KVStore.key]))
+
+    res = await session.execute(
+        select(KVStore).where(KVStore.key == SHOP_STATE_KEY).with_for_update()
+    )
+    return res.scalar_one()
+
+
+async def _load_catalog(session: AsyncSession, d: Dict[str, Any]) -> None:
+    cats: Dict[str, Dict[str, list]] = {}
+    res = await session.execute(select(ShopCategory.name).order_by(ShopCategory.position))
+    for name in res.scalars().all():
+        cats[name] = {}
+    res = await session.execute(
+        select(ShopSubcategory).order_by(ShopSubcategory.category, ShopSubcategory.position)
+    )
+    for s in res.scalars().all():
+        cats.setdefault(s.category, {})[s.name] = list(s.product_ids or [])
+    d["categories"] = cats
+
+    res = await session.execute(select(ShopProduct.data).order_by(ShopProduct.id))
+    d["products"] = list(res.scalars().all())
+
+
+async def _load_carts(session: AsyncSession, d: Dict[str, Any]) -> None:
+    carts: Dict[str, Dict[str, int]] = {}
+    res = await session.execute(select(ShopCartItem.user_id, ShopCartItem.product_id, ShopCartItem.qty))
+    for uid, pid, qty in res.all():
+        carts.setdefault(str(uid), {})[str(pid)] = int(qty)
+    d["carts"] = carts
+
+
+async def _load_favorites(session: AsyncSession, d: Dict[str, Any]) -> None:
+    favs: Dict[str, List[int]] = {}
+    res = await session.execute(
+        select(ShopFavorite.user_id, ShopFavorite.product_id).order_by(ShopFavorite.user_id, ShopFavorite.product_id)
+    )
+    for uid, pid in res.all():
+        favs.setdefault(str(uid), []).append(int(pid))
+    d["favorites"] = favs
+
+
+async def _load_orders(session: AsyncSession, d: Dict[str, Any]) -> None:
+    items: Dict[int, list] = {}
+    res = await session.execute(
+        select(ShopOrderItem.order_id, ShopOrderItem.data).order_by(ShopOrderItem.order_id, ShopOrderItem.position)
+    )
+    for oid, it in res.all():
+        items.setdefault(int(oid), []).append(it)
+
+    orders: List[dict] = []
+    res = await session.execute(select(ShopOrder.id, ShopOrder.data).order_by(ShopOrder.id))
+    for oid, data in res.all():
+        o = dict(data or {})
+        o["items"] = items.get(int(oid), [])
+        orders.append(o)
+    d["orders"] = orders
+
+
+async def _load_users(session: AsyncSession, d: Dict[str, Any]) -> None:
+    users: Dict[str, dict] = {}
+    res = await session.execute(select(ShopUser.id, ShopUser.data).order_by(ShopUser.id))
+    for uid, data in res.all():
+        users[str(uid)] = data
+    d["users"] = users
+
+
+async def _load_audit(session: AsyncSession, d: Dict[str, Any]) -> List[int]:
+    res = await session.execute(select(ShopAudit.id, ShopAudit.data).order_by(ShopAudit.id))
+    audit_rows = res.all()
+    d["audit"] = [data for _, data in audit_rows]
+    return [int(aid) for aid, _ in audit_rows]
+
+
+_LOADERS = {
+    "catalog": _load_catalog,
+    "carts": _load_carts,
+    "favorites": _load_favorites,
+    "orders": _load_orders,
+    "users": _load_users,
+}
+
+
+async def load_state(
+    session: AsyncSession,
+    sections: Optional[Sequence[str]] = None,
+    *,
+    for_update: bool = False,
+) -> ShopState:
+    """
+    Збирає dict стану з таблиць. sections — які домени читати (None = усі).
+    Ключі незавантажених секцій у dict відсутні і при save не пишуться.
+    """
+    secs = norm_sections(sections)
+    d = ShopState()
+
+    if for_update:
+        row = await lock_state(session)
+    else:
+        row = await session.get(KVStore, SHOP_STATE_KEY)
+    if row and isinstance(row.value, dict):
+        for k, v in row.value.items():
+            if k not in TABLE_KEYS:
+                d[k] = v
+
+    for name, loader in _LOADERS.items():
+        if name in secs:
+            await loader(session, d)
+
+    audit_ids = await _load_audit(session, d) if "audit" in secs else None
+
+    d.sections = secs
+    d.snapshot = make_snapshot(d, audit_ids, secs)
+    d.version = int(row.version or 0) if row else 0
+    metrics.inc("shop.loads")
+    for name in secs:
+        metrics.inc(f"shop.loads.{name}")
+    return d
+
+
+async def save_state(session: AsyncSession, d: Dict[str, Any], *, strict: bool = False) -> bool:
+    """
+    Пише тільки те, що змінилось відносно знімка.
+    Якщо d — не ShopState (наприклад, default_data()), то це повна заміна.
+    Пишуться лише секції, з якими d було завантажено (d.sections).
+
+    strict=True — compare-and-swap по версії: якщо з моменту load_state()
+    хтось уже записав стан, кидає ShopConflict і нічого не пише.
+    Повертає False, якщо писати не було чого.
+    """
+    snap = getattr(d, "snapshot", None)
+    loaded_version = getattr(d, "version", None)
+    secs = getattr(d, "sections", ALL_SECTIONS)
+
+    if "catalog" in secs:
+        catalogids.sync_ids(d)
+
+    plans = {
+        name: _plan_rowset(name, d, snap.get(name) if snap else None)
+        for name in _rowsets_of(secs)
+    }
+
+    with_audit = "audit" in secs
+    entries = _audit_entries(d) if with_audit else []
+    audit_fps = [_fp(e) for e in entries]
+    old_audit = snap.get("audit") if snap else None
+    audit_k = _audit_overlap([fp for _, fp in old_audit], audit_fps) if old_audit is not None else None
+
+    header = _header(d)
+    header_fps = _header_fps(header)
+    old_header = snap.get("header") if snap else None
+    if not isinstance(old_header, dict):
+        old_header = None  # знімок без відбитків по ключах — заголовок пишемо цілком
+    hdr_changed, hdr_removed = _header_diff(header_fps, old_header)
+
+    dirty = snap is None or bool(hdr_changed or hdr_removed)
+    dirty = dirty or any(changed or removed for _, changed, removed in plans.values())
+    if with_audit:
+        dirty = dirty or audit_k != 0 or len(audit_fps) != len(old_audit or [])
+    if not dirty:
+        return False
+
+    version = await _bump_version(session, loaded_version if strict else None)
+    if version is None:
+        metrics.inc("shop.cas.conflicts")
+        raise ShopConflict(f"shop state changed since version {loaded_version}")
+
+    catalog_dirty = any(
+        snap is None or plans[name][1] or plans[name][2]
+        for name in SECTIONS["catalog"][1] if name in plans
+    )
+    if catalog_dirty:
+        # індекси каталогу звіряються по цій версії (catalogids.catalog_version)
+        d[catalogids.CATALOG_VERSION_KEY] = version
+        header = _header(d)
+        header_fps = _header_fps(header)
+        hdr_changed, hdr_removed = _header_diff(header_fps, old_header)
+
+    if loaded_version is not None and version != int(loaded_version) + 1:
+        # хтось записав між load і save — наші рядки лягли поверх (last-writer-wins по рядку)
+        metrics.inc("shop.cas.blind_overwrites")
+
+    # --- таблиці ---
+    new_snap: Dict[str, Any] = {}
+    for name, (fps, changed, removed) in plans.items():
+        model, pk, _ = ROWSETS[name]
+        if snap is None:
+            await session.execute(delete(model))
+        if removed:
+            await _delete_keys(session, model, pk, removed)
+        if changed:
+            await _upsert(session, model, pk, changed)
+        new_snap[name] = fps
+
+    # --- аудит ---
+    if not with_audit:
+        pass
+    elif audit_k is None:
+        await session.execute(delete(ShopAudit))
+        ids = await _insert_audit(session, entries)
+        new_snap["audit"] = list(zip(ids, audit_fps))
+    else:
+        dropped = [aid for aid, _ in old_audit[:audit_k]]
+        if dropped:
+            await _delete_keys(session, ShopAudit, ("id",), [(aid,) for aid in dropped])
+        kept = old_audit[audit_k:]
+        fresh = entries[len(kept):]
+        ids = await _insert_audit(session, fresh) if fresh else []
+        new_snap["audit"] = kept + list(zip(ids, audit_fps[len(kept):]))
+
+    # --- header (рядок уже існує і заблокований після _bump_version) ---
+    if snap is None or old_header is None:
+        await _write_header(session, header)
+    elif hdr_changed or hdr_removed:
+        await _write_header(session, header, hdr_changed, hdr_removed)
+    new_snap["header"] = header_fps
+
+    # інші репліки дізнаються про нову версію (доставляється на commit)
+    await session.execute(select(func.pg_notify(SHOP_NOTIFY_CHANNEL, str(version))))
+
+    metrics.inc("shop.saves")
+    if isinstance(d, ShopState):
+        d.snapshot = new_snap
+        d.version = version
+    return True
+
+
+# =========================================================
+# ID ALLOCATORS (Postgres sequences замість max()+1)
+# =========================================================
+
+# kind -> (sequence, таблиця з id)
+ID_SEQUENCES = {
+    "order": (ORDER_ID_SEQ, ShopOrder.__tablename__),
+    "product": (PRODUCT_ID_SEQ, ShopProduct.__tablename__),
+}
+
+
+async def alloc_id(session: AsyncSession, kind: str) -> int:
+    """Унікальний id без гонок (між хендлерами і репліками). Можливі пропуски."""
+    seq, _ = ID_SEQUENCES[kind]
+    res = await session.execute(select(seq.next_value()))
+    return int(res.scalar_one())
+
+
+async def seed_id_sequences(session: AsyncSession) -> None:
+    """
+    Наступне значення = max(поточний max(id) у таблиці, вже видані id) + 1.
+    Ідемпотентно: можна викликати на кожному старті.
+    """
+    for seq, table in ID_SEQUENCES.values():
+        await session.execute(text(
+            f"SELECT setval('{seq.name}', GREATEST("
+            f"(SELECT COALESCE(MAX(id), 0) FROM {table}), "
+            f"(SELECT CASE WHEN is_called THEN last_value ELSE last_value - 1 END FROM {seq.name})"
+            f") + 1, false)"
+        ))
+
+
+# =========================================================
+# REVERSE LOOKUPS (по індексах таблиць, без завантаження секцій)
+# =========================================================
+
+async def favorited_by(session: AsyncSession, pid: int) -> List[int]:
+    """Хто додав товар в обране (індекс shop_favorites.product_id)."""
+    res = await session.execute(
+        select(ShopFavorite.user_id).where(ShopFavorite.product_id == int(pid)).order_by(ShopFavorite.user_id)
+    )
+    return [int(uid) for uid in res.scalars().all()]
+
+
+async def orders_keyset(
+    session: AsyncSession,
+    *,
+    statuses: Optional[Sequence[str]] = None,
+    user_id: Optional[int] = None,
+    older_than: Optional[Tuple[int, int]] = None,
+    newer_than: Optional[Tuple[int, int]] = None,
+    limit: int = 10,
+) -> List[Dict[str, Any]]:
+    """
+    Рядки списку замовлень (без data/items) — keyset по (created_ts, id), без OFFSET.
+    older_than: новіші першими, строго старіші за ключ;
+    newer_than: старіші першими, строго новіші за ключ.
+    Повертає до limit+1 рядків (зайвий = "є ще").
+    """
+    stmt = select(ShopOrder.id, ShopOrder.user_id, ShopOrder.status, ShopOrder.total, ShopOrder.created_ts)
+    if statuses:
+        stmt = stmt.where(ShopOrder.status.in_(list(statuses)))
+    if user_id:
+        stmt = stmt.where(ShopOrder.user_id == int(user_id))
+
+    key = tuple_(ShopOrder.created_ts, ShopOrder.id)
+    if newer_than is not None:
+        stmt = stmt.where(key > tuple_(int(newer_than[0]), int(newer_than[1])))
+        stmt = stmt.order_by(ShopOrder.created_ts.asc(), ShopOrder.id.asc())
+    else:
+        if older_than is not None:
+            stmt = stmt.where(key < tuple_(int(older_than[0]), int(older_than[1])))
+        stmt = stmt.order_by(ShopOrder.created_ts.desc(), ShopOrder.id.desc())
+
+    res = await session.execute(stmt.limit(int(limit) + 1))
+    return [
+        {"id": int(r.id), "user_id": int(r.user_id or 0), "status": str(r.status or ""),
+         "total": float(r.total or 0), "created_ts": int(r.created_ts or 0)}
+        for r in res.all()
+    ]
+
+
+async def import_legacy_blob(session: AsyncSession, migrate: Callable[[Dict[str, Any]], Dict[str, Any]]) -> bool:
+    """
+    Одноразовий перенос старого єдиного JSONB (kv_store[SHOP_STATE_KEY])
+    у таблиці. Після переносу в kv_store лишається тільки header.
+    """
+    row = await session.get(KVStore, SHOP_STATE_KEY)
+    if not row or not isinstance(row.value, dict):
+        return False
+    if not any(k in row.value for k in TABLE_KEYS):
+        return False
+
+    d = migrate(dict(row.value))
+    await save_state(session, d)
+    return True
@@ -0,0 +1,68 @@
+# tests/test_admin_sections.py
+import asyncio
+from types import SimpleNamespace
+
+from storage import ShopState, norm_sections
+import handlers.admin as admin
+
+
+class _Message:
+    def __init__(self):
+        self.sent = []
+
+    async def answer(self, text, **kwargs):
+        self.sent.append(text)
+
+
+class _Callback:
+    def __init__(self, data):
+        self.data = data
+        self.from_user = SimpleNamespace(id=1)
+        self.message = _Message()
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+
+def _patch(monkeypatch, reads):
+    d = ShopState(
+        managers=[1],
+        roles={"1": "admin"},
+        hits=[],
+        products=[{"id": 10, "name": "Товар", "price": 100}],
+        audit=[],
+    )
+
+    async def load_data(sections=None, *, writes=None):
+        reads.append((norm_sections(sections), writes))
+        return d
+
+    async def save_data(_d):
+        pass
+
+    monkeypatch.setattr(admin, "load_data", load_data)
+    monkeypatch.setattr(admin, "save_data", save_data)
+    return d
+
+
+def test_product_editmenu_reads_catalog_without_touching_it(monkeypatch):
+    reads = []
+    d = _patch(monkeypatch, reads)
+
+    cb = _Callback("adm:editmenu:10")
+    asyncio.run(admin.product_editmenu(cb))
+
+    assert reads == [(frozenset({"catalog"}), ())]
+    assert cb.message.sent
+    assert d["products"][0] == {"id": 10, "name": "Товар", "price": 100}
+
+
+def test_hit_toggle_loads_audit(monkeypatch):
+    reads = []
+    d = _patch(monkeypatch, reads)
+
+    asyncio.run(admin.hit_toggle(_Callback("adm:hit:on:10")))
+
+    assert reads == [(frozenset({"audit"}), None)]
+    assert d["hits"] == [10]
+    assert d["audit"]
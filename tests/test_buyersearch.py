@@ -0,0 +1,33 @@
+# tests/test_buyersearch.py
+from buyersearch import BuyerIndex, ORDER_RESCAN_IDS
+
+
+def _order(uid: int, phone: str = "") -> dict:
+    return {"user_id": uid, "phone": phone, "created_ts": 1}
+
+
+def test_late_committed_order_is_picked_up():
+    bi = BuyerIndex()
+    bi.take_orders([(1, _order(7)), (3, _order(7))])
+    # id 2 видали раніше, а закомітили після 3 — приходить наступним refresh
+    bi.take_orders([(1, _order(7)), (2, _order(8, "+380 67 123 45 67")), (3, _order(7))])
+
+    assert bi.docs[7]["orders"] == 2
+    assert bi.docs[8]["orders"] == 1
+    assert [d["id"] for d in bi.search("0671234567")] == [8]
+
+
+def test_rescan_window_is_bounded():
+    bi = BuyerIndex()
+    bi.take_orders([(oid, _order(7)) for oid in range(1, ORDER_RESCAN_IDS * 2)])
+    assert bi.docs[7]["orders"] == ORDER_RESCAN_IDS * 2 - 1
+    assert len(bi._order_ids) == ORDER_RESCAN_IDS
+
+
+def test_users_rescan_is_idempotent():
+    bi = BuyerIndex()
+    rows = [(7, {"username": "olena", "full_name": "Олена", "last_seen_ts": 100}, 100)]
+    bi.take_users(rows)
+    bi.take_users(rows)
+    assert len(bi.docs) == 1
+    assert bi.search("olena")[0]["id"] == 7
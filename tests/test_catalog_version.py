@@ -0,0 +1,62 @@
+# tests/test_catalog_version.py
+import metrics
+from catalogindex import CatalogIndex
+from productsearch import ProductSearch
+from storage import ShopState
+
+
+def _state(version: int, catalog_version: int, name: str = "Футболка") -> ShopState:
+    d = ShopState({
+        "catalog_version": catalog_version,
+        "categories": {"Одяг": {"_": [10]}},
+        "products": [{"id": 10, "name": name}],
+    })
+    d.version = version
+    return d
+
+
+def test_search_skips_sync_when_only_carts_were_written():
+    ps = ProductSearch()
+    ps.sync(_state(5, 3))
+    before = metrics.get("product_search.syncs")
+
+    ps.sync(_state(6, 3))
+    ps.sync(_state(7, 3))
+    assert metrics.get("product_search.syncs") == before
+
+    ps.sync(_state(8, 8, name="Світшот"))
+    assert metrics.get("product_search.syncs") == before + 1
+    assert ps.search("світшот") == [10]
+
+
+def test_search_keeps_index_for_state_without_catalog():
+    ps = ProductSearch()
+    ps.sync(_state(5, 3))
+    d = ShopState({"catalog_version": 9})
+    d.version = 9
+    ps.sync(d)
+    assert ps.search("футболка") == [10]
+
+
+def test_catalog_index_follows_catalog_version():
+    ci = CatalogIndex()
+    assert ci.pids(_state(5, 3), "Одяг", "_") == [10]
+
+    d = _state(6, 3)
+    d["categories"]["Одяг"]["_"] = [10, 11]
+    assert ci.pids(d, "Одяг", "_") == [10]
+
+    d = _state(7, 7)
+    d["categories"]["Одяг"]["_"] = [10, 11]
+    assert ci.pids(d, "Одяг", "_") == [10, 11]
+
+
+def test_catalog_index_keeps_subcategories_for_state_without_catalog():
+    ci = CatalogIndex()
+    assert ci.pids(_state(5, 3), "Одяг", "_") == [10]
+
+    # секція carts: categories — порожня заглушка, версія каталогу вже інша
+    d = ShopState({"catalog_version": 9, "categories": {}})
+    d.version = 9
+    d.sections = frozenset({"carts"})
+    assert ci.pids(d, "Одяг", "_") == [10]
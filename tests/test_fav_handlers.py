@@ -0,0 +1,113 @@
+# tests/test_fav_handlers.py
+import asyncio
+from types import SimpleNamespace
+
+from storage import ShopState, norm_sections
+import handlers.user as user
+
+
+class _Message:
+    def __init__(self):
+        self.reply_markup = None
+        self.edited = []
+
+    async def edit_text(self, text, **kwargs):
+        self.edited.append(text)
+
+    async def edit_reply_markup(self, **kwargs):
+        pass
+
+
+class _Callback:
+    def __init__(self, data):
+        self.data = data
+        self.from_user = SimpleNamespace(id=7)
+        self.message = _Message()
+        self.answers = []
+
+    async def answer(self, *args, **kwargs):
+        self.answers.append(args)
+
+
+def _state():
+    d = ShopState(
+        categories={"C": {"_": [10]}},
+        products=[{"id": 10, "name": "Товар", "price": 100}],
+        carts={"7": {"10": 1}},
+        favorites={"7": [10]},
+    )
+    d.version = 1
+    return d
+
+
+def _patch(monkeypatch, writes, reads):
+    d = _state()
+
+    async def update_data_coalesced(mutate, sections=None):
+        writes.append(norm_sections(sections))
+        return mutate(d)
+
+    async def load_data(sections=None, *, writes=None):
+        reads.append((norm_sections(sections), writes))
+        return d
+
+    monkeypatch.setattr(user, "update_data_coalesced", update_data_coalesced)
+    monkeypatch.setattr(user, "load_data", load_data)
+
+
+def test_favs_add_to_cart_writes_only_carts(monkeypatch):
+    writes, reads = [], []
+    _patch(monkeypatch, writes, reads)
+
+    cb = _Callback("favs:add:10:0")
+    asyncio.run(user.favs_add_to_cart(cb))
+
+    assert writes == [frozenset({"carts"})]
+    assert reads == [(frozenset({"catalog", "favorites"}), ())]
+    assert "<b>2</b> шт" in cb.message.edited[0]
+
+
+def test_fav_toggle_writes_only_favorites(monkeypatch):
+    writes, reads = [], []
+    _patch(monkeypatch, writes, reads)
+
+    cb = _Callback("fav:off:10")
+    asyncio.run(user.fav_toggle(cb))
+
+    assert writes == [frozenset({"favorites"})]
+    assert reads == [(frozenset({"catalog", "favorites"}), ())]
+
+
+class _FSM:
+    def __init__(self):
+        self.state = "SearchFSM:query"
+        self.data = {"other": 1}
+
+    async def clear(self):
+        self.state, self.data = None, {}
+
+    async def update_data(self, **kwargs):
+        self.data.update(kwargs)
+
+    async def get_data(self):
+        return dict(self.data)
+
+
+class _TextMessage:
+    def __init__(self, text):
+        self.text = text
+        self.sent = []
+
+    async def answer(self, text, **kwargs):
+        self.sent.append(text)
+
+
+def test_search_query_leaves_search_state(monkeypatch):
+    _patch(monkeypatch, [], [])
+    fsm = _FSM()
+    m = _TextMessage("товар")
+    asyncio.run(user.search_query(m, fsm))
+
+    assert m.sent
+    assert fsm.state is None
+    assert fsm.data == {"search_q": "товар"}
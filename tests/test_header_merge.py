@@ -0,0 +1,51 @@
+# tests/test_header_merge.py
+import asyncio
+
+import storage
+from storage import _header_diff, _header_fps, _write_header
+
+
+class _Result:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar_one_or_none(self):
+        return self.value
+
+
+class _Session:
+    """Рядок kv_store у памʼяті: select повертає value, update — записує."""
+
+    def __init__(self, value):
+        self.value = value
+
+    async def execute(self, stmt):
+        if stmt.is_select:
+            return _Result(self.value)
+        self.value = stmt.compile().params["value"]
+        return _Result(None)
+
+
+def test_header_diff_reports_only_own_changes():
+    old = _header_fps({"managers": [1], "hits": [10], "roles": {}})
+    new = _header_fps({"managers": [1, 2], "roles": {}})
+    assert _header_diff(new, old) == (["managers"], ["hits"])
+
+
+def test_write_header_keeps_keys_changed_by_others():
+    # ми змінили managers; інша репліка тим часом — hits
+    s = _Session({"managers": [1], "hits": [10, 11], "roles": {"1": "admin"}})
+    header = {"managers": [1, 2], "hits": [10], "roles": {"1": "admin"}}
+    asyncio.run(_write_header(s, header, ["managers"], []))
+    assert s.value == {"managers": [1, 2], "hits": [10, 11], "roles": {"1": "admin"}}
+
+
+def test_write_header_full_replace():
+    s = _Session({"managers": [1], "old": True})
+    asyncio.run(_write_header(s, {"managers": []}))
+    assert s.value == {"managers": []}
+
+
+def test_snapshot_keeps_per_key_fingerprints():
+    snap = storage.make_snapshot({"managers": [1], "hits": []}, sections=frozenset())
+    assert set(snap["header"]) == {"managers", "hits"}
@@ -0,0 +1,31 @@
+# tests/test_notify_staff.py
+import asyncio
+
+import utils
+
+
+def test_notify_staff_enqueues_by_default(monkeypatch):
+    def submit(bot, uid, text, **kwargs):
+        raise AssertionError("за замовчуванням доставки не чекаємо")
+
+    monkeypatch.setattr(utils, "submit", submit)
+    monkeypatch.setattr(utils, "enqueue", lambda bot, uid, text, **kw: uid != 3)
+
+    res = asyncio.run(utils.notify_staff(None, "hi", staff=[1, 3]))
+    assert res == {1: True, 3: False}
+
+
+def test_notify_staff_wait_reports_delivery(monkeypatch):
+    def submit(bot, uid, text, **kwargs):
+        fut = asyncio.get_running_loop().create_future()
+        fut.set_result(uid != 2)  # другому не доставлено
+        return fut
+
+    def enqueue(bot, uid, text, **kwargs):
+        raise AssertionError("wait=True чекає доставки")
+
+    monkeypatch.setattr(utils, "submit", submit)
+    monkeypatch.setattr(utils, "enqueue", enqueue)
+
+    res = asyncio.run(utils.notify_staff(None, "hi", staff=[1, 2], wait=True))
+    assert res == {1: True, 2: False}
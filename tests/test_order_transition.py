@@ -0,0 +1,50 @@
+# tests/test_order_transition.py
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+from storage import ShopState, norm_sections
+import handlers.admin as admin
+
+
+class _Message:
+    def __init__(self):
+        self.sent = []
+
+    async def answer(self, text, **kwargs):
+        self.sent.append(text)
+
+
+class _Callback:
+    def __init__(self):
+        self.from_user = SimpleNamespace(id=1)
+        self.message = _Message()
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+
+def test_order_transition_locks_only_order_sections(monkeypatch):
+    requested = []
+    d = ShopState(
+        managers=[1],
+        roles={"1": "admin"},
+        products=[{"id": 10, "name": "Товар", "price": 100}],
+        orders=[{"id": 5, "user_id": 7, "status": "paid", "created_ts": 1, "items": [{"pid": 10, "qty": 1}]}],
+        audit=[],
+    )
+
+    @asynccontextmanager
+    async def shop_tx(sections=None):
+        requested.append(norm_sections(sections))
+        yield d
+
+    monkeypatch.setattr(admin, "shop_tx", shop_tx)
+    monkeypatch.setattr(admin, "_notify_buyer", lambda *a, **kw: asyncio.sleep(0))
+
+    cb = _Callback()
+    asyncio.run(admin._order_transition(cb, None, None, "in_work", 5))
+
+    assert requested == [frozenset({"catalog", "orders", "audit"})]
+    assert d["orders"][0]["status"] == "in_work"
+    assert d["audit"]
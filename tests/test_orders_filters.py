@@ -0,0 +1,20 @@
+# tests/test_orders_filters.py
+import handlers.admin as admin
+
+
+def _rows(kb):
+    return [[b.callback_data for b in row] for row in kb.inline_keyboard]
+
+
+def test_filter_chips_fill_rows_of_four():
+    kb = admin.orders_list_kb([], "all", 0, False, False)
+    chips = [r for r in _rows(kb) if all(c.startswith("adm:ol:") for c in r)]
+
+    assert [len(r) for r in chips] == admin._rows_of(len(admin.ORDER_FILTERS))
+    assert all(len(r) <= 4 for r in chips)
+    assert [c.split(":")[2] for r in chips for c in r] == list(admin.ORDER_FILTERS)
+
+
+def test_pickup_outcome_is_not_closed():
+    assert "picked" not in admin.ORDER_FILTERS["end"][1]
+    assert "picked" in admin.ORDER_FILTERS["got"][1]
@@ -0,0 +1,62 @@
+# tests/test_panel_nav.py
+import asyncio
+from types import SimpleNamespace
+
+from storage import ShopState, norm_sections
+import handlers.admin as admin
+
+
+class _Message:
+    def __init__(self):
+        self.sent = []
+
+    async def answer(self, text, **kwargs):
+        self.sent.append(text)
+
+
+class _Callback:
+    def __init__(self, data):
+        self.data = data
+        self.from_user = SimpleNamespace(id=1)
+        self.message = _Message()
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+
+class _State:
+    async def clear(self):
+        pass
+
+    async def set_state(self, st):
+        pass
+
+
+def _run(monkeypatch, action):
+    requested = []
+    cb = _Callback(f"adm:panel:{action}")
+
+    async def load_data(sections=None, *, writes=None):
+        requested.append(norm_sections(sections))
+        return ShopState(
+            managers=[1],
+            roles={"1": "admin"},
+            categories={"C": {"_": [10]}},
+            catalog_ids={"seq": 1, "cats": {"C": {"id": 1, "subs": {}}}, "by_id": {"1": ["C", None]}},
+            products=[],
+            orders=[{"id": 5, "status": "paid", "created_ts": 1, "items": []}],
+        )
+
+    monkeypatch.setattr(admin, "load_data", load_data)
+    asyncio.run(admin.panel_nav(cb, _State()))
+    assert cb.message.sent
+    return requested
+
+
+def test_orders_menu_loads_only_orders(monkeypatch):
+    assert _run(monkeypatch, "orders") == [frozenset({"orders"})]
+
+
+def test_catalog_actions_load_catalog_on_demand(monkeypatch):
+    assert _run(monkeypatch, "catalog") == [frozenset({"orders"})]
+    assert _run(monkeypatch, "cats") == [frozenset({"orders"}), frozenset({"catalog"})]
@@ -0,0 +1,50 @@
+# tests/test_picklist_wave.py
+import asyncio
+from types import SimpleNamespace
+
+from storage import ShopState, norm_sections
+import handlers.admin as admin
+
+
+class _Message:
+    def __init__(self):
+        self.sent = []
+
+    async def answer(self, text, **kwargs):
+        self.sent.append(text)
+
+
+class _Callback:
+    def __init__(self, data):
+        self.data = data
+        self.from_user = SimpleNamespace(id=1)
+        self.message = _Message()
+        self.answers = []
+
+    async def answer(self, *args, **kwargs):
+        self.answers.append(args)
+
+
+def _fake_load(requested):
+    async def load_data(sections=None, *, writes=None):
+        # той самий розбір секцій, що й у справжньому load_data
+        requested.append((norm_sections(sections), writes))
+        d = ShopState(
+            roles={"1": "manager"},
+            categories={"C": {"_": [10]}},
+            products=[{"id": 10, "sku": "SKU-1", "name": "Товар", "category": "C", "sub_category": "_"}],
+            orders=[{"id": 5, "status": "paid", "created_ts": 1, "items": [{"pid": 10, "qty": 2}]}],
+        )
+        return d
+    return load_data
+
+
+def test_wave_callback_loads_valid_sections(monkeypatch):
+    requested = []
+    monkeypatch.setattr(admin, "load_data", _fake_load(requested))
+
+    cb = _Callback("adm:wave:sku")
+    asyncio.run(admin.picklist_wave_cb(cb))
+
+    assert requested == [(frozenset({"catalog", "orders"}), ())]
+    assert any("SKU-1" in t and "#5×2" in t for t in cb.message.sent)
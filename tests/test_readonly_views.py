@@ -0,0 +1,32 @@
+# tests/test_readonly_views.py
+import copy
+
+import handlers.user as user
+
+
+def _state():
+    return {
+        "products": [{"id": 10, "name": "Товар", "price": 100}],
+        "carts": {"7": [10, 10, "x"]},   # старий формат — список pid
+        "favorites": {},
+        "orders": [{"id": 5, "user_id": 7, "created_ts": 100, "status": "paid", "items": []}],
+    }
+
+
+def test_views_do_not_touch_shared_state():
+    d = _state()
+    before = copy.deepcopy(d)
+
+    assert user._cart_view(d, 7) == {"10": 2}
+    assert user._cart_view(d, 8) == {}
+    assert user.is_fav(d, 7, 10) is False
+    assert user._favs_items_all(d, 7) == []
+    assert "Замовлення створено" in user._render_timeline(d["orders"][0])
+
+    assert d == before
+
+
+def test_cart_dict_normalizes_for_writes():
+    d = _state()
+    assert user._cart_add(d, 7, 10, +1) == 3
+    assert d["carts"]["7"] == {"10": 3}
@@ -0,0 +1,37 @@
+# tests/test_sendqueue.py
+import asyncio
+
+from aiogram.exceptions import TelegramRetryAfter
+
+from sendqueue import LANE_STAFF, SendQueue
+
+
+class _FloodBot:
+    """Перша спроба "A" падає з RetryAfter — після паузи, поки інші вже можуть летіти."""
+
+    def __init__(self):
+        self.sent = []
+        self.failed = False
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.sleep(0.01)
+        if text == "A" and not self.failed:
+            self.failed = True
+            raise TelegramRetryAfter(None, "flood", 0)
+        self.sent.append((chat_id, text))
+
+
+def test_retry_keeps_chat_order():
+    async def run():
+        q = SendQueue(rate=1000, chat_interval_s=0, concurrency=4)
+        bot = _FloodBot()
+        futs = [q.submit(bot, 1, t, lane=LANE_STAFF) for t in ("A", "B", "C")]
+        futs.append(q.submit(bot, 2, "X", lane=LANE_STAFF))
+        assert await asyncio.gather(*futs) == [True, True, True, True]
+        await q.close(0)
+        return bot.sent
+
+    sent = asyncio.run(run())
+    assert [t for c, t in sent if c == 1] == ["A", "B", "C"]
+    # інший чат не чекає на повтор у першому
+    assert sent.index((2, "X")) < sent.index((1, "A"))
@@ -0,0 +1,55 @@
+# tests/test_shopindex.py
+import shopindex
+from storage import ShopState
+
+
+def _orders():
+    return [
+        {"id": 1, "user_id": 7, "status": "paid", "created_ts": 10},
+        {"id": 2, "user_id": 8, "status": "new", "created_ts": 20},
+        {"id": 3, "user_id": 7, "status": "paid", "created_ts": 30},
+    ]
+
+
+def _wrap(orders):
+    # так load_data віддає спільну секцію з кешу: новий ShopState, той самий список
+    d = ShopState(orders=orders)
+    d.version = 5
+    return d
+
+
+def test_order_index_survives_across_requests(monkeypatch):
+    orders = _orders()
+    built = []
+    orig = shopindex.OrderIndex.__init__
+
+    def counting_init(self, arr):
+        built.append(1)
+        orig(self, arr)
+
+    monkeypatch.setattr(shopindex.OrderIndex, "__init__", counting_init)
+
+    assert shopindex.status_counts(_wrap(orders)) == {"paid": 2, "new": 1}
+    assert [o["id"] for o in shopindex.orders_by_status(_wrap(orders), "paid", newest_first=True)] == [3, 1]
+    assert [o["id"] for o in shopindex.orders_of_user(_wrap(orders), 7)] == [3, 1]
+    assert shopindex.orders_count_of_user(_wrap(orders), 8) == 1
+    assert len(built) == 1
+
+    # інший список (нова версія стану) — свій індекс
+    shopindex.status_counts(_wrap(_orders()))
+    assert len(built) == 2
+
+
+def test_incremental_updates_reach_shared_index():
+    orders = _orders()
+    d = _wrap(orders)
+    shopindex.status_counts(d)
+
+    o = {"id": 4, "user_id": 7, "status": "new", "created_ts": 40}
+    orders.append(o)
+    shopindex.order_added(_wrap(orders), o)
+    o["status"] = "paid"
+    shopindex.order_status_changed(_wrap(orders), o)
+
+    assert shopindex.status_counts(_wrap(orders)) == {"paid": 3, "new": 1}
+    assert [x["id"] for x in shopindex.orders_of_user(_wrap(orders), 7)] == [4, 3, 1]
@@ -0,0 +1,57 @@
+# tests/test_statecache.py
+from statecache import StateCache
+from storage import ShopState
+
+
+def _state(version: int) -> ShopState:
+    d = ShopState({
+        "roles": {"1": "manager"},
+        "categories": {"Одяг": {"_": [10]}},
+        "products": [{"id": 10, "name": "Футболка"}],
+        "carts": {"7": {"10": 1}},
+    })
+    d.snapshot = {
+        "header": "h",
+        "categories": {}, "subcategories": {}, "products": {},
+        "cart_items": {},
+    }
+    d.version = version
+    d.sections = frozenset({"catalog", "carts"})
+    return d
+
+
+def test_get_copies_only_written_sections():
+    c = StateCache()
+    c.put(_state(3))
+
+    d = c.get(3, frozenset({"catalog", "carts"}), frozenset({"carts"}))
+    assert d["products"] is c.parts["catalog"]["products"]
+    assert d["carts"] is not c.parts["carts"]["carts"]
+    assert d["roles"] is not c.header["roles"]
+
+    d["carts"]["7"]["10"] = 5
+    assert c.parts["carts"]["carts"]["7"]["10"] == 1
+
+
+def test_get_without_writes_copies_everything():
+    c = StateCache()
+    c.put(_state(3))
+
+    d = c.get(3, frozenset({"catalog"}))
+    assert d["products"] is not c.parts["catalog"]["products"]
+    assert d["products"] == c.parts["catalog"]["products"]
+
+
+def test_put_keeps_untouched_shared_section():
+    c = StateCache()
+    c.put(_state(3))
+    products = c.parts["catalog"]["products"]
+
+    d = c.get(3, frozenset({"catalog", "carts"}), frozenset({"carts"}))
+    d["carts"]["7"]["10"] = 2
+    d.version = 4
+    c.put(d, prev_version=3)
+
+    assert c.parts["catalog"]["products"] is products
+    assert c.parts["carts"]["carts"]["7"]["10"] == 2
+    assert c.parts["carts"]["carts"] is not d["carts"]
@@ -3,6 +3,12 @@ from __future__ import annotations
 from datetime import datetime, timezone
 from typing import Any, Dict, Optional, List
 
+import promos
+from rendercache import render_cache, invalidate_product
+
+# акція закінчилась — картка товару вже інша
+promos.price_table.on_expire(invalidate_product)
+
 
 # ---------- base helpers ----------
 
@@ -30,6 +36,32 @@ def esc(text: str) -> str:
     )
 
 
+# ліміт тексту одного повідомлення Telegram
+TG_TEXT_LIMIT = 4096
+
+def split_message(lines: List[str], limit: int = TG_TEXT_LIMIT) -> List[str]:
+    """
+    Склеює рядки в повідомлення не довші за limit, ріже тільки між рядками
+    (HTML-теги не розриваються). Задовгий рядок — окремим шматком, обрізаним.
+    """
+    out: List[str] = []
+    cur: List[str] = []
+    size = 0
+    for line in lines:
+        if len(line) > limit:
+            line = line[:limit - 1] + "…"
+        add = len(line) + (1 if cur else 0)
+        if cur and size + add > limit:
+            out.append("\n".join(cur))
+            cur, size = [], 0
+            add = len(line)
+        cur.append(line)
+        size += add
+    if cur:
+        out.append("\n".join(cur))
+    return out
+
+
 # ---------- time / promo ----------
 
 def _now_ts() -> int:
@@ -91,11 +123,8 @@ def price_line(p: Dict[str, Any]) -> str:
     except Exception:
         base_v = 0.0
 
-    if is_promo_active(p):
-        try:
-            promo_v = float(p.get("promo_price") or 0)
-        except Exception:
-            promo_v = 0.0
+    if promos.is_active(p):
+        promo_v = promos.unit_price(p)
 
         perc = ""
         if base_v > 0 and promo_v > 0 and promo_v < base_v:
@@ -110,7 +139,22 @@ def price_line(p: Dict[str, Any]) -> str:
 
 # ---------- product formatting ----------
 
+def _product_sig(p: Dict[str, Any]) -> tuple:
+    # усе, від чого залежить картка/рядок товару (крім часу — його дає прапорець акції)
+    return (
+        p.get("id"), p.get("name"), p.get("description"),
+        p.get("base_price"), p.get("price"), p.get("promo_price"),
+        promos.is_active(p),
+    )
+
 def product_card(p: Dict[str, Any]) -> str:
+    key = _product_sig(p)
+    txt = render_cache.get("product", p.get("id"), key)
+    if txt is None:
+        txt = render_cache.put("product", p.get("id"), key, _product_card(p))
+    return txt
+
+def _product_card(p: Dict[str, Any]) -> str:
     name = esc(str(p.get("name", "Товар")))
     pid = p.get("id", "")
     desc = esc(str(p.get("description", "")).strip())
@@ -134,8 +178,8 @@ def product_short(p: Dict[str, Any]) -> str:
     base = float(p.get("base_price", p.get("price", 0)) or 0)
     qty = int(p.get("_qty", 1) or 1)
 
-    if is_promo_active(p):
-        promo = float(p.get("promo_price") or 0)
+    if promos.is_active(p):
+        promo = promos.unit_price(p)
         line = f"• {b(name)} ({code(f'#{pid}')}) — {s_(money_uah(base))} → {b(money_uah(promo))}"
     else:
         line = f"• {b(name)} ({code(f'#{pid}')}) — {b(money_uah(base))}"
@@ -169,8 +213,8 @@ def cart_summary(data: Dict[str, Any], items: List[Dict[str, Any]], cart: Dict[s
         name = esc(str(p.get("name", "Товар")))
 
         base_price = float(p.get("base_price", p.get("price", 0)) or 0)
-        promo_on = is_promo_active(p, now_ts=now)
-        promo_price = float(p.get("promo_price") or 0)
+        promo_on = promos.is_active(p, now)
+        promo_price = promos.unit_price(p, now) if promo_on else 0.0
 
         if promo_on and promo_price > 0:
             unit_text = f"{s_(money_uah(base_price))} → {b(money_uah(promo_price))}"
@@ -193,23 +237,45 @@ def cart_summary(data: Dict[str, Any], items: List[Dict[str, Any]], cart: Dict[s
 
 # ---------- order formatting ----------
 
+ORDER_STATUS_LABELS = {
+    "paid": "🟢 Оплачено",
+    "prepay": "🟣 Передплата",
+    "in_work": "🟡 В роботі",
+    "shipped": "🚚 Відправлено",
+    "picked": "✅ Забрав (продано)",
+    "not_picked": "❌ Не забрав",
+    "returned": "🔁 Повернуто",
+    "done": "✅ Завершено",
+    "new": "🆕 Нове",
+    "pending": "⏳ Очікує оплату",
+    "picking": "📦 Збирається",
+    "packed": "📦 Запаковано",
+    "arrived": "📍 У відділенні",
+    "received": "✅ Отримано",
+    "canceled": "❌ Скасовано",
+}
+
+
+def _order_sig(order: Dict[str, Any], products: List[Dict[str, Any]]) -> tuple:
+    delivery = order.get("delivery", {}) or {}
+    return (
+        order.get("id"), order.get("status"), order.get("user_id"), order.get("ttn"),
+        tuple(delivery.items()) if isinstance(delivery, dict) else (),
+        tuple((_product_sig(p), p.get("_qty")) for p in products),
+    )
+
 def order_premium_text(data: Dict[str, Any], order: Dict[str, Any], products: List[Dict[str, Any]]) -> str:
+    key = _order_sig(order, products)
+    txt = render_cache.get("order", order.get("id"), key)
+    if txt is None:
+        txt = render_cache.put("order", order.get("id"), key, _order_premium_text(order, products))
+    return txt
+
+def _order_premium_text(order: Dict[str, Any], products: List[Dict[str, Any]]) -> str:
     oid = order.get("id", "")
     status = str(order.get("status", "new"))
 
-    status_map = {
-        "paid": "🟢 Оплачено",
-        "prepay": "🟣 Передплата",
-        "in_work": "🟡 В роботі",
-        "shipped": "🚚 Відправлено",
-        "picked": "✅ Забрав (продано)",
-        "not_picked": "❌ Не забрав",
-        "returned": "🔁 Повернуто",
-        "done": "✅ Завершено",
-        "new": "🆕 Нове",
-        "pending": "⏳ Очікує оплату",
-    }
-    st = status_map.get(status, status)
+    st = ORDER_STATUS_LABELS.get(status, status)
 
     delivery = order.get("delivery", {}) or {}
     cname = esc(str(delivery.get("name", "")))
@@ -222,7 +288,7 @@ def order_premium_text(data: Dict[str, Any], order: Dict[str, Any], products: Li
     total = 0.0
     for p in products:
         qty = int(p.get("_qty", 1) or 1)
-        unit = float(p.get("promo_price") or 0) if is_promo_active(p, now_ts=now) else float(p.get("base_price", p.get("price", 0)) or 0)
+        unit = promos.unit_price(p, now)
         total += unit * qty
 
     lines: List[str] = []
@@ -0,0 +1,107 @@
+# textsearch.py
+from __future__ import annotations
+
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Set
+
+
+# =========================================================
+# TEXT SEARCH (нормалізація + триграмний інвертований індекс)
+#
+# norm():  регістр і діакритика не важливі: "Їжак" == "іжак", "Йод" == "иод",
+#          апострофи прибираємо ("пам'ять" == "память").
+# TrigramIndex: токен → триграми (пошук підрядка) + префікси 1–2 символи
+#          (короткі запити). Кандидати перевіряються реальним входженням.
+# =========================================================
+
+_APOSTROPHES = "'’ʼ`´"
+_SPLIT_RE = re.compile(r"[^\w]+", re.UNICODE)
+
+
+def norm(s: str) -> str:
+    s = unicodedata.normalize("NFD", (s or "").casefold())
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))
+    for a in _APOSTROPHES:
+        s = s.replace(a, "")
+    return re.sub(r"\s+", " ", s).strip()
+
+
+def tokens(s: str) -> List[str]:
+    return [t for t in _SPLIT_RE.split(norm(s)) if t]
+
+
+def digits(s: str) -> str:
+    return "".join(ch for ch in (s or "") if ch.isdigit())
+
+
+def trigrams(t: str) -> Set[str]:
+    return {t[i:i + 3] for i in range(len(t) - 2)}
+
+
+def _keys(t: str) -> Set[str]:
+    keys = trigrams(t)
+    keys.add("^" + t[:1])
+    if len(t) >= 2:
+        keys.add("^" + t[:2])
+    return keys
+
+
+class TrigramIndex:
+    """
+    doc_id → набір токенів. Оновлюється інкрементально (set_doc / remove_doc).
+    candidates(q) повертає документи, у яких якийсь токен містить q
+    (для q з 1–2 символів — починається з q).
+    """
+
+    def __init__(self):
+        self._post: Dict[str, Set[int]] = {}
+        self._docs: Dict[int, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def set_doc(self, doc_id: int, toks: Iterable[str]) -> None:
+        new = {t for t in toks if t}
+        old = self._docs.get(doc_id)
+        if old == new:
+            return
+        if old:
+            self.remove_doc(doc_id)
+        self._docs[doc_id] = new
+        for key in {k for t in new for k in _keys(t)}:
+            self._post.setdefault(key, set()).add(doc_id)
+
+    def remove_doc(self, doc_id: int) -> None:
+        old = self._docs.pop(doc_id, None)
+        if not old:
+            return
+        for key in {k for t in old for k in _keys(t)}:
+            bucket = self._post.get(key)
+            if bucket is not None:
+                bucket.discard(doc_id)
+                if not bucket:
+                    self._post.pop(key, None)
+
+    def doc_tokens(self, doc_id: int) -> Set[str]:
+        return self._docs.get(doc_id, set())
+
+    def candidates(self, q: str) -> Set[int]:
+        q = (q or "").strip()
+        if not q:
+            return set()
+        if len(q) < 3:
+            hits = self._post.get("^" + q, set())
+            return set(hits)
+
+        grams = sorted(trigrams(q), key=lambda g: len(self._post.get(g, ())))
+        out: Optional[Set[int]] = None
+        for g in grams:
+            bucket = self._post.get(g)
+            if not bucket:
+                return set()
+            out = set(bucket) if out is None else out & bucket
+            if not out:
+                return set()
+        # триграми збіглись — перевіряємо справжнє входження
+        return {doc for doc in (out or set()) if any(q in t for t in self._docs.get(doc, ()))}
@@ -1,12 +1,14 @@
 from __future__ import annotations
 
-from typing import Dict, Any, List
+import asyncio
+from typing import Dict, Any, List, Optional
 
 from aiogram import Bot
 
 from config import ADMIN_ID
 from data import load_data, find_product
 from text import order_premium_text
+from sendqueue import enqueue, submit, LANE_REPLY, LANE_STAFF
 
 
 def is_admin(uid: int) -> bool:
@@ -17,24 +19,61 @@ def is_staff(data: Dict[str, Any], uid: int) -> bool:
     return uid in (data.get("managers", []) or []) or is_admin(uid)
 
 
-async def safe_send(bot: Bot, chat_id: int, text: str, **kwargs):
-    try:
-        await bot.send_message(chat_id, text, **kwargs)
-    except Exception:
-        pass
-
+async def safe_send(bot: Bot, chat_id: int, text: str, *, lane: int = LANE_REPLY, **kwargs) -> bool:
+    # через чергу: доставку, темп і повтори (RetryAfter) веде sendqueue, хендлер не чекає
+    return enqueue(bot, chat_id, text, lane=lane, **kwargs)
+
+
+def staff_ids(data: Dict[str, Any]) -> List[int]:
+    """Кому слати сповіщення персоналу: managers (header) + ADMIN_ID, без дублів."""
+    out: List[int] = []
+    for x in list(data.get("managers", []) or []) + [ADMIN_ID]:
+        try:
+            uid = int(x)
+        except Exception:
+            continue
+        if uid and uid not in out:
+            out.append(uid)
+    return out
+
+
+async def notify_staff(
+    bot: Bot,
+    text: str,
+    *,
+    data: Optional[Dict[str, Any]] = None,
+    staff: Optional[List[int]] = None,
+    wait: bool = False,
+    **kwargs,
+) -> Dict[int, bool]:
+    """
+    Сповіщення персоналу (смуга LANE_STAFF черги sendqueue).
+    data — вже завантажений стан (managers лежать у header), staff — готовий список id;
+    без обох — читаємо тільки header.
+    Результат {uid: bool}:
+      wait=False (за замовчуванням) — не чекаємо: True лише означає "стало
+        в чергу" (доставка не гарантована), False — черга повна, не відправлятиметься.
+      wait=True — True: Telegram прийняв повідомлення; False: відкинуто
+        (черга повна, бот заблоковано, вичерпано повтори).
+        Чекаємо всіх разом, паралельність обмежує черга.
+    wait=True — лише тим, хто повторює недоставлене:
+    notify_staff(..., staff=[uid for uid, ok in res.items() if not ok], wait=True).
+    """
+    if staff is None:
+        if data is None:
+            data = await load_data(())
+        staff = staff_ids(data)
 
-async def notify_staff(bot: Bot, text: str, **kwargs):
-    data = await load_data()
-    recipients = set(int(x) for x in (data.get("managers", []) or []))
-    recipients.add(int(ADMIN_ID))
+    if not wait:
+        return {uid: enqueue(bot, uid, text, lane=LANE_STAFF, **kwargs) for uid in staff}
 
-    for uid in recipients:
-        await safe_send(bot, uid, text, **kwargs)
+    futs = {uid: submit(bot, uid, text, lane=LANE_STAFF, **kwargs) for uid in staff}
+    results = await asyncio.gather(*futs.values())
+    return dict(zip(futs.keys(), results))
 
 
 async def notify_user(bot: Bot, user_id: int, text: str, **kwargs):
-    await safe_send(bot, int(user_id), text, **kwargs)
+    await safe_send(bot, int(user_id), text, lane=LANE_REPLY, **kwargs)
 
 
 def format_order_text(data: Dict[str, Any], order: Dict[str, Any]) -> str:
@@ -0,0 +1,103 @@
+# writebehind.py
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+import metrics
+
+
+# =========================================================
+# WRITE-BEHIND (злиття частих мутацій в один запис)
+#
+# Тапи +/- в кошику, "в кошик", ⭐ — приходять пачками по кілька на секунду.
+# Замість load→save на кожен тап збираємо мутації за вікно window_ms
+# і застосовуємо їх усі до ОДНОГО завантаженого стану з ОДНИМ записом.
+# Кожен виклик submit() чекає, поки його мутація реально ляже в БД,
+# і отримує результат своєї мутації.
+# =========================================================
+
+Mutation = Callable[[Dict[str, Any]], Any]
+
+# apply(mutations, sections) -> результати (або винятки) у тому ж порядку
+BatchApply = Callable[[List[Mutation], Optional[Set[str]]], Awaitable[List[Tuple[bool, Any]]]]
+
+
+class WriteBehind:
+    def __init__(self, apply: BatchApply, window_ms: int = 200):
+        self._apply = apply
+        self.window = max(0, int(window_ms)) / 1000.0
+
+        self._pending: List[Tuple[Mutation, asyncio.Future]] = []
+        self._sections: Optional[Set[str]] = set()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._lock = asyncio.Lock()
+        self._inflight: Set[asyncio.Task] = set()
+
+    async def submit(self, mutate: Mutation, sections: Optional[Sequence[str]] = None) -> Any:
+        loop = asyncio.get_running_loop()
+        fut: asyncio.Future = loop.create_future()
+
+        self._pending.append((mutate, fut))
+        if sections is None or self._sections is None:
+            self._sections = None  # хтось хоче весь стан
+        else:
+            self._sections.update(sections)
+        metrics.inc("shop.wb.mutations")
+
+        if self.window <= 0:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._on_timer)
+
+        return await fut
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        task = asyncio.ensure_future(self.flush())
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def flush(self) -> None:
+        """
+        Записати все, що накопичилось, прямо зараз.
+        Викликати перед критичними шляхами (оформлення/оплата) і на shutdown.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        async with self._lock:
+            batch, self._pending = self._pending, []
+            sections, self._sections = self._sections, set()
+            if not batch:
+                return
+
+            metrics.inc("shop.wb.batches")
+            try:
+                results = await self._apply([m for m, _ in batch], sections)
+            except Exception as e:
+                # запис не вдався — кожен очікувач отримує помилку
+                metrics.inc("shop.wb.errors")
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                return
+
+            for (_, fut), (ok, value) in zip(batch, results):
+                if fut.done():
+                    continue
+                if ok:
+                    fut.set_result(value)
+                else:
+                    fut.set_exception(value)
+
+    async def close(self) -> None:
+        """Shutdown: дочекатись запланованих flush і записати залишок."""
+        if self._inflight:
+            await asyncio.gather(*list(self._inflight), return_exceptions=True)
+        await self.flush()
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)